@@ -11,6 +11,8 @@ from rebalance_server.routes import (
     get_APR_composition,
     get_debank_data,
 )
+from rebalance_server.utils.single_flight import get_single_flight_stats
+from rebalance_server.utils.snapshot_refresher import get_snapshot_ages
 
 config = {
     "DEBUG": True,  # some Flask specific configs
@@ -108,6 +110,22 @@ def apr_composition():
     return resp
 
 
+@app.route("/snapshot_ages", methods=["GET"])
+def snapshot_ages():
+    # seconds since each upstream snapshot (defillama, coingecko) was last refreshed
+    response = get_snapshot_ages()
+    resp = jsonify(response)
+    return resp
+
+
+@app.route("/single_flight_stats", methods=["GET"])
+def single_flight_stats():
+    # upstream calls of this worker, and the share of them that piggybacked on another caller's fetch
+    response = get_single_flight_stats()
+    resp = jsonify(response)
+    return resp
+
+
 @app.route("/one_1inch_swap_data", methods=["GET"])
 def one_1inch_swap_data():
     chainId = request.args.get("chainId")
@@ -1,19 +1,17 @@
-import json
-import random
-
-import requests
+import pandas as pd
 
 from rebalance_server.apr_utils import convert_apy_to_apr
+from rebalance_server.apr_utils.deferred_apr import resolve_apr
+from rebalance_server.apr_utils.yields_store import get_yields_store
 from rebalance_server.portfolio_config import (
     ADDRESS_2_CATEGORY,
-    DEFILLAMA_API_REQUEST_FREQUENCY_RECIPROCAL,
     LIQUIDITY_BOOK_PROTOCOL_APR_DISCOUNT_FACTOR,
     get_metadata_by_project_symbol,
 )
 
 
 def get_lowest_or_default_apr(project_symbol: str, addr: str):
-    apr = ADDRESS_2_CATEGORY.get(addr, {}).get("APR")
+    apr = resolve_apr(ADDRESS_2_CATEGORY.get(addr, {}).get("APR"))
     if apr is not None:
         return apr
     default_apr = _get_default_apr(project_symbol)
@@ -23,30 +21,14 @@ def get_lowest_or_default_apr(project_symbol: str, addr: str):
         "defillama-APY-pool-id", ""
     )
     if defillama_pool_uuid:
-        try:
-            res_json = json.load(open("rebalance_server/yield-llama.json", "r"))
-        except FileNotFoundError:
-            res_json = _get_data_from_defillama()
-        if random.randint(0, DEFILLAMA_API_REQUEST_FREQUENCY_RECIPROCAL) == 0:
-            print(
-                f"Update Defillama data from API (1/{DEFILLAMA_API_REQUEST_FREQUENCY_RECIPROCAL}) chance"
-            )
-            res_json = _get_data_from_defillama()
-        for pool_metadata in res_json["data"]:
-            if pool_metadata["pool"] == defillama_pool_uuid:
-                protocol_apy = get_apy(pool_metadata)
-                return convert_apy_to_apr(protocol_apy)
+        pool_metadata = get_yields_store().get_pool(defillama_pool_uuid)
+        if pool_metadata is not None:
+            protocol_apy = get_apy(pool_metadata)
+            return convert_apy_to_apr(protocol_apy)
         raise FileNotFoundError(f"Cannot find {defillama_pool_uuid} in defillama's API")
     raise NotImplementedError(f"No APR for {project_symbol} and {addr}")
 
 
-def _get_data_from_defillama():
-    res = requests.get("https://yields.llama.fi/pools")
-    res_json = res.json()
-    json.dump(res_json, open("rebalance_server/yield-llama.json", "w"))
-    return res_json
-
-
 def _get_default_apr(project_symbol: str):
     return get_metadata_by_project_symbol(project_symbol).get("DEFAULT_APR", 0)
 
@@ -57,5 +39,27 @@ def get_apy(pool_metadata):
     return _lower_the_apy_if_protocol_uses_liquidity_book(pool_metadata["project"], apy)
 
 
+def get_tvl_apr_harmonic_mean(pool_metadata) -> float:
+    """
+    harmonic mean of the pool's APR (in %) and TVL (in million USD), so a high APR on a shallow pool doesn't rank high
+    """
+    apr = convert_apy_to_apr(get_apy(pool_metadata)) * 100
+    tvl = pool_metadata["tvlUsd"] / 10**6
+    if apr <= 0 or tvl <= 0:
+        return 0.0
+    return 2 * apr * tvl / (apr + tvl)
+
+
+def get_apy_of_pool_columns(pool_columns: pd.DataFrame) -> pd.Series:
+    # vectorized get_apy over YieldsStore.pool_columns
+    discount_factor = (
+        pool_columns["project"]
+        .map(LIQUIDITY_BOOK_PROTOCOL_APR_DISCOUNT_FACTOR)
+        .astype(float)
+        .fillna(1)
+    )
+    return pool_columns["apy"] / 100 * discount_factor
+
+
 def _lower_the_apy_if_protocol_uses_liquidity_book(project_name: str, apy: float):
     return apy * LIQUIDITY_BOOK_PROTOCOL_APR_DISCOUNT_FACTOR.get(project_name, 1)
@@ -1,59 +1,101 @@
-import json
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
 
 from rebalance_server.apr_utils import convert_apr_to_apy, convert_apy_to_apr
-from rebalance_server.apr_utils.apr_calculator import get_apy, get_lowest_or_default_apr
+from rebalance_server.apr_utils.apr_calculator import (
+    get_apy,
+    get_apy_of_pool_columns,
+    get_lowest_or_default_apr,
+    get_tvl_apr_harmonic_mean,
+)
+from rebalance_server.apr_utils.candidate_cache import get_candidate_cache
+from rebalance_server.apr_utils.combination_search import (
+    MAX_POOLS_IN_COMBINATION,
+    search_best_combination,
+)
+from rebalance_server.apr_utils.stablecoin_pool_index import get_stablecoin_pool_index
+from rebalance_server.apr_utils.yields_store import YieldsStore, get_yields_store
 from rebalance_server.portfolio_config import (
     BLACKLIST_CHAINS,
     BLACKLIST_CHAINS_FOR_STABLE_COIN,
     BLACKLIST_PROTOCOL,
+    MIN_REBALANCE_POSITION_THRESHOLD,
+    OPTIMIZER_MAX_WORKERS,
     STABLE_COIN_WHITELIST,
+    TOKEN_2_CATEGORIES,
 )
+from rebalance_server.rebalance_strategies import rebalance_strategy_factory
+from rebalance_server.rebalance_strategies.base_portfolio import BasePortfolio
 from rebalance_server.search_handlers import SearchBase
 from rebalance_server.search_handlers.jaccard_similarity_handler import (
     JaccardSimilarityHandler,
 )
-from rebalance_server.search_handlers.ngram_handler import NgramSimilarityHandler
+from rebalance_server.search_handlers.minhash_lsh_handler import (
+    MinHashLSHSimilarityHandler,
+    get_minhash_lsh_index,
+)
+from rebalance_server.search_handlers.ngram_handler import (
+    NgramSimilarityHandler,
+    get_ngram_index,
+)
+from rebalance_server.search_handlers.suffix_trie import SuffixTrie
+from rebalance_server.search_handlers.tag_index import (
+    TagIndex,
+    get_suffix_trie,
+    get_tag_index,
+)
+from rebalance_server.search_handlers.token_incidence import get_token_incidence
 from rebalance_server.utils.position import skip_rebalance_if_position_too_small
+from rebalance_server.utils.snapshot_refresher import SNAPSHOT_REFRESHER_THREAD_NAME
+from rebalance_server.utils.top_k import get_top_k
 
 MILLION = 10**6
+# don't put more than this share of a pool's TVL into it, otherwise we'd dilute its APR
+MAX_SHARE_OF_POOL_TVL = 0.05
+# how the candidate pools of a position are ranked
+POOL_RANKING_SCORES = {
+    "apy": get_apy,
+    "tvl_apr_harmonic_mean": get_tvl_apr_harmonic_mean,
+}
 
 
 def search_better_stable_coin_pools(categorized_positions: dict, topn_int: int = 5):
-    with open("rebalance_server/yield-llama.json", "r") as f:
-        defillama = json.load(f)
+    yields_store = get_yields_store()
     max_apy = _get_current_stable_max_apy_in_your_portfolio(
-        categorized_positions, defillama
+        categorized_positions, yields_store
     )
-    topn = _get_topn_apy_pool(defillama, max_apy)
-    top_n_stable_coins = []
-    for pool in sorted(topn, key=lambda x: x["apy"], reverse=True):
-        if pool["tvlUsd"] < MILLION / 10:
-            continue
-        if pool["chain"] in BLACKLIST_CHAINS_FOR_STABLE_COIN:
-            continue
-        if not _check_if_symbol_consists_of_whitelist_coins(pool["symbol"]):
-            continue
-        if pool["project"] in BLACKLIST_PROTOCOL:
-            continue
-        top_n_stable_coins.append(pool)
-    return top_n_stable_coins[:topn_int]
+    return _get_topn_apy_pool(yields_store, max_apy, topn_int)
 
 
 def search_top_n_pool_consist_of_same_lp_token(
-    categorized_positions: dict, optimize_apr_mode: str
+    categorized_positions: dict,
+    optimize_apr_mode: str,
+    searching_algorithm: str = "jaccard_similarity",
+    ranking: str = "apy",
+    max_workers: int = OPTIMIZER_MAX_WORKERS,
 ) -> list[dict]:
+    """
+    the candidates of each position are cached across requests, and only updated for the pools that changed once the yields snapshot does
+    `max_workers` > 1 searches them from scratch instead, spread across that many forked worker processes,
+    as long as no other thread but the snapshot refresher is alive, e.g. from the CLI, otherwise it stays with the cache
+    """
     print("\n\n=======Search top n pools consist of same lp token=======")
-    res_json = json.load(open("rebalance_server/yield-llama.json", "r"))
-    search_handler = _get_search_handler(
-        optimize_apr_mode=optimize_apr_mode, searching_algorithm="jaccard_similarity"
-    )
+    yields_store = get_yields_store()
+    pool_score = POOL_RANKING_SCORES[ranking]
     project_symbol_set = set()
     pool_ids_of_current_portfolio = set(
         metadata["metadata"].get("defillama-APY-pool-id")
         for portfolio in categorized_positions.values()
         for metadata in portfolio["portfolio"].values()
     )
-    top_n_list = []
+    candidate_pool_columns = _get_candidate_pool_columns(
+        yields_store, pool_ids_of_current_portfolio
+    )
+    positions = []
     for portfolio in categorized_positions.values():
         for project_symbol, metadata in portfolio["portfolio"].items():
             if project_symbol in project_symbol_set:
@@ -62,60 +104,400 @@ def search_top_n_pool_consist_of_same_lp_token(
                 continue
             project_symbol_set.add(project_symbol)
             apr = get_lowest_or_default_apr(project_symbol, metadata["address"])
-            top_n = _get_topn_candidate_pool(
+            positions.append((project_symbol, metadata, apr))
+    if max_workers > 1 and len(positions) > 1 and _can_fork_workers():
+        search_handler = _get_search_handler(
+            optimize_apr_mode=optimize_apr_mode,
+            searching_algorithm=searching_algorithm,
+            yields_store=yields_store,
+        )
+        snapshot = (yields_store, candidate_pool_columns, search_handler, pool_score)
+        top_ns = _get_topn_candidate_pools_in_parallel(positions, snapshot, max_workers)
+    else:
+        candidate_cache = get_candidate_cache(
+            (optimize_apr_mode, searching_algorithm),
+            lambda yields_store: _get_search_handler(
+                optimize_apr_mode=optimize_apr_mode,
+                searching_algorithm=searching_algorithm,
+                yields_store=yields_store,
+            ),
+        )
+        top_ns = candidate_cache.get_topn_candidate_pools(
+            positions,
+            yields_store,
+            candidate_pool_columns,
+            pool_score,
+            frozenset(pool_ids_of_current_portfolio),
+        )
+    return [
+        (project_symbol, top_n, apr)
+        for (project_symbol, _, apr), top_n in zip(positions, top_ns)
+    ]
+
+
+def _get_topn_candidate_pools(
+    positions: list[tuple[str, dict, float]],
+    yields_store: YieldsStore,
+    candidate_pool_columns: pd.DataFrame,
+    search_handler: SearchBase,
+    pool_score,
+) -> list[list]:
+    top_ns = _get_topn_candidate_pools_in_batch(
+        positions, yields_store, candidate_pool_columns, search_handler, pool_score
+    )
+    if top_ns is None:
+        top_ns = [
+            _get_topn_candidate_pool(
                 apr,
                 metadata,
-                res_json,
+                yields_store,
+                candidate_pool_columns,
                 search_handler,
-                pool_ids_of_current_portfolio,
+                pool_score,
             )
-            top_n_list.append((project_symbol, top_n, apr))
-    return top_n_list
+            for _, metadata, apr in positions
+        ]
+    return top_ns
+
+
+# what the forked workers inherit from the parent process, see _get_topn_candidate_pools_in_parallel
+_worker_positions = None
+_worker_snapshot = None
+
+
+def _get_topn_candidate_pools_in_parallel(
+    positions: list[tuple[str, dict, float]], snapshot: tuple, max_workers: int
+) -> list[list]:
+    """
+    the positions are split into contiguous chunks, one per worker, and merged back in order
+    workers are forked, so the pool snapshot and the positions are shared copy-on-write instead of being pickled, only the top n pools of each position are sent back
+    """
+    if not _can_fork_workers():
+        raise RuntimeError(
+            "Refuse to fork candidate search workers while other threads are alive"
+        )
+    yields_store, _, search_handler, _ = snapshot
+    # build the lazy indexes once in the parent, rather than once per worker
+    get_tag_index(yields_store)
+    if isinstance(search_handler, JaccardSimilarityHandler):
+        get_token_incidence(yields_store)
+    n_workers = min(max_workers, len(positions))
+    chunk_size = -(-len(positions) // n_workers)
+    starts = range(0, len(positions), chunk_size)
+    with ProcessPoolExecutor(
+        max_workers=n_workers,
+        mp_context=multiprocessing.get_context("fork"),
+        initializer=_init_worker,
+        initargs=(positions, snapshot),
+    ) as executor:
+        chunks = executor.map(
+            _get_topn_candidate_pools_of_chunk,
+            starts,
+            [start + chunk_size for start in starts],
+        )
+        return [top_n for chunk in chunks for top_n in chunk]
+
+
+def _can_fork_workers() -> bool:
+    """
+    a forked child only gets the forking thread, a lock another thread held at that moment stays locked in the child forever
+    the snapshot refresher every process runs is left out, the workers only read the snapshot the parent has already built
+    """
+    threads = [
+        thread.name
+        for thread in threading.enumerate()
+        if thread is not threading.current_thread()
+        and thread.name != SNAPSHOT_REFRESHER_THREAD_NAME
+    ]
+    if threads:
+        print(
+            f"Threads {', '.join(threads)} alive, search candidates without forking workers"
+        )
+        return False
+    return True
+
+
+def _init_worker(positions: list[tuple[str, dict, float]], snapshot: tuple) -> None:
+    global _worker_positions, _worker_snapshot
+    _worker_positions = positions
+    _worker_snapshot = snapshot
 
 
-def _get_search_handler(optimize_apr_mode: str, searching_algorithm: str):
+def _get_topn_candidate_pools_of_chunk(start: int, end: int) -> list[list]:
+    return _get_topn_candidate_pools(_worker_positions[start:end], *_worker_snapshot)
+
+
+def search_new_combination(
+    categorized_positions: dict,
+    strategy_name: str,
+    net_worth: float,
+    max_pools: int = MAX_POOLS_IN_COMBINATION,
+) -> dict | None:
+    """
+    the combination of pools with the highest blended APR, whose tokens (mapped through TOKEN_2_CATEGORIES) keep each category at the strategy's target allocation
+    only the categories TOKEN_2_CATEGORIES has tokens for are allocated
+    """
+    print("\n\n=======Search new combination of pools=======")
+    yields_store = get_yields_store()
+    target_asset_allocation = rebalance_strategy_factory(
+        strategy_name
+    ).target_asset_allocation
+    categories = [
+        category
+        for category, tokens in TOKEN_2_CATEGORIES.items()
+        if tokens and target_asset_allocation.get(category, 0) > 0
+    ]
+    pool_ids_of_current_portfolio = set(
+        metadata["metadata"].get("defillama-APY-pool-id")
+        for portfolio in categorized_positions.values()
+        for metadata in portfolio["portfolio"].values()
+    )
+    candidate_pool_columns = _get_candidate_pool_columns(
+        yields_store, pool_ids_of_current_portfolio
+    )
+    token_2_category = {
+        token: category
+        for category in categories
+        for token in TOKEN_2_CATEGORIES[category]
+    }
+    pool_indexes, category_weights, aprs, capacities = [], [], [], []
+    category_weights_by_symbol = {}
+    for pool_index, apr, tvl in zip(
+        candidate_pool_columns.index,
+        candidate_pool_columns["apr"],
+        candidate_pool_columns["tvlUsd"],
+    ):
+        symbol = yields_store.pools[pool_index]["symbol"]
+        if symbol not in category_weights_by_symbol:
+            category_weights_by_symbol[symbol] = _get_category_weights(
+                symbol, categories, token_2_category, get_suffix_trie(yields_store)
+            )
+        if category_weights_by_symbol[symbol] is None:
+            continue
+        pool_indexes.append(pool_index)
+        category_weights.append(category_weights_by_symbol[symbol])
+        aprs.append(apr)
+        capacities.append(tvl * MAX_SHARE_OF_POOL_TVL)
+    category_budgets = [
+        net_worth * target_asset_allocation[category] for category in categories
+    ]
+    best_combination = search_best_combination(
+        category_weights,
+        aprs,
+        capacities,
+        category_budgets,
+        tolerance=net_worth * BasePortfolio.REBALANCE_THRESHOLD,
+        max_pools=max_pools,
+        min_allocation=MIN_REBALANCE_POSITION_THRESHOLD,
+    )
+    if best_combination is None:
+        return None
+    allocations = []
+    category_sums = dict.fromkeys(categories, 0.0)
+    for index, amount in best_combination["allocations"]:
+        amount_by_category = {
+            category: amount * weight
+            for category, weight in zip(categories, category_weights[index])
+            if weight > 0
+        }
+        for category, category_amount in amount_by_category.items():
+            category_sums[category] += category_amount
+        allocations.append(
+            {
+                "pool_metadata": yields_store.pools[pool_indexes[index]],
+                "apr": aprs[index],
+                "amount": amount,
+                "categories": amount_by_category,
+            }
+        )
+    return {
+        "blended_apr": best_combination["interest"] / sum(category_sums.values()),
+        "allocations": allocations,
+        "category_sums": category_sums,
+        "target_category_sums": dict(zip(categories, category_budgets)),
+        "exhaustive": best_combination["exhaustive"],
+    }
+
+
+def _get_category_weights(
+    symbol: str,
+    categories: list[str],
+    token_2_category: dict[str, str],
+    suffix_trie: SuffixTrie,
+) -> tuple[float, ...] | None:
+    """
+    how a pool's liquidity splits across the categories, assuming its tokens are equally weighted
+    a tag falls back to the tokens it ends with, e.g. "sfrxeth" is an "eth", None if any of them isn't in one of the categories
+    """
+    weights = [0.0] * len(categories)
+    tags = TagIndex.get_tags(symbol)
+    for tag in tags:
+        token = next(
+            (
+                token
+                for token in (tag, *suffix_trie.get_suffixes(tag))
+                if token in token_2_category
+            ),
+            None,
+        )
+        if token is None:
+            return None
+        weights[categories.index(token_2_category[token])] += 1 / len(tags)
+    return tuple(weights)
+
+
+def _get_search_handler(
+    optimize_apr_mode: str, searching_algorithm: str, yields_store: YieldsStore
+):
     if optimize_apr_mode == "new_pool":
         if searching_algorithm == "ngram":
-            # sucks
+            # fuzzy match on the whole symbol
             threashold = 0.2
-            return NgramSimilarityHandler(similarity_threshold=threashold)
+            return NgramSimilarityHandler(
+                similarity_threshold=threashold,
+                ngram_index=get_ngram_index(yields_store),
+            )
         elif searching_algorithm == "jaccard_similarity":
-            return JaccardSimilarityHandler(similarity_threshold=0.5)
+            return JaccardSimilarityHandler(
+                similarity_threshold=0.5, suffix_trie=get_suffix_trie(yields_store)
+            )
+        elif searching_algorithm == "minhash_lsh":
+            # approximate jaccard similarity, for large pool universes
+            return MinHashLSHSimilarityHandler(
+                similarity_threshold=0.5,
+                minhash_lsh_index=get_minhash_lsh_index(yields_store),
+                suffix_trie=get_suffix_trie(yields_store),
+            )
     elif optimize_apr_mode == "new_combination":
-        raise NotImplementedError("Not implemented yet")
+        raise NotImplementedError(
+            "new_combination searches for combinations of pools, use search_new_combination instead"
+        )
 
 
 def _get_topn_candidate_pool(
     current_apr: float,
     metadata: dict,
-    res_json: dict,
+    yields_store: YieldsStore,
+    candidate_pool_columns: pd.DataFrame,
     search_handler: SearchBase,
-    pool_ids_of_current_portfolio: set,
+    pool_score=get_apy,
     topn_int: int = 5,
 ) -> list:
     worth = metadata["worth"]
-    top_n: list[dict] = []
-    for pool_metadata in res_json["data"]:
-        if skip_rebalance_if_position_too_small(worth):
-            continue
-        if pool_metadata["chain"] in BLACKLIST_CHAINS:
-            continue
-        if pool_metadata["project"] in BLACKLIST_PROTOCOL:
-            continue
+    if skip_rebalance_if_position_too_small(worth):
+        return []
+    # only the pools with a better APR than the current one reach the similarity scorer
+    candidate_pool_indexes = candidate_pool_columns.index[
+        candidate_pool_columns["apr"].to_numpy() > current_apr
+    ]
+    pool_indexes_worth_scoring = search_handler.get_candidate_pool_indexes(
+        metadata, get_tag_index(yields_store)
+    )
+    if pool_indexes_worth_scoring is not None:
+        candidate_pool_indexes = np.intersect1d(
+            candidate_pool_indexes, list(pool_indexes_worth_scoring)
+        )
+    return get_top_k(
+        _iter_similar_pools(
+            metadata, yields_store, candidate_pool_indexes, search_handler
+        ),
+        topn_int,
+        score=lambda x: pool_score(x["pool_metadata"]),
+    )
+
+
+def _iter_similar_pools(
+    metadata: dict,
+    yields_store: YieldsStore,
+    candidate_pool_indexes: np.ndarray,
+    search_handler: SearchBase,
+):
+    for pool_index in candidate_pool_indexes:
+        pool_metadata = yields_store.pools[pool_index]
         if (
             pool_similarity := search_handler.get_similarity(
                 metadata, pool_metadata["symbol"].lower()
             )
             > search_handler.similarity_threshold
-            and pool_metadata["pool"] not in pool_ids_of_current_portfolio
-            and current_apr < convert_apy_to_apr(get_apy(pool_metadata))
-            and pool_metadata["tvlUsd"] > MILLION * 0.7
         ):
-            top_n.append(
-                {"pool_metadata": pool_metadata, "pool_similarity": pool_similarity}
-            )
-    # TODO(david): use harmonic mean of tvl and apr to sort
-    return sorted(top_n, key=lambda x: -get_apy(x["pool_metadata"]))[:topn_int]
+            yield {"pool_metadata": pool_metadata, "pool_similarity": pool_similarity}
+
+
+def _get_topn_candidate_pools_in_batch(
+    positions: list[tuple[str, dict, float]],
+    yields_store: YieldsStore,
+    candidate_pool_columns: pd.DataFrame,
+    search_handler: SearchBase,
+    pool_score=get_apy,
+    topn_int: int = 5,
+) -> list[list] | None:
+    """
+    `_get_topn_candidate_pool` of every position at once, from the search handler's similarity matrix
+    None if the search handler can only score one pair at a time
+    """
+    position_indexes = [
+        position_index
+        for position_index, (_, metadata, _) in enumerate(positions)
+        if not skip_rebalance_if_position_too_small(metadata["worth"])
+    ]
+    candidate_pool_mask = np.zeros(len(yields_store), dtype=bool)
+    candidate_pool_mask[candidate_pool_columns.index] = True
+    similarity_matrix = search_handler.get_similarity_matrix(
+        [positions[position_index][1] for position_index in position_indexes],
+        yields_store,
+        candidate_pool_mask,
+    )
+    if similarity_matrix is None:
+        return None
+    rows, pool_indexes, similarities = similarity_matrix
+    pool_aprs = np.zeros(len(yields_store))
+    pool_aprs[candidate_pool_columns.index] = candidate_pool_columns["apr"].to_numpy()
+    current_aprs = np.array(
+        [positions[position_index][2] for position_index in position_indexes],
+        dtype=float,
+    )
+    mask = (pool_aprs[pool_indexes] > current_aprs[rows]) & (
+        similarities > search_handler.similarity_threshold
+    )
+    # grouped by position, in pool order within a position, same as the candidates `_get_topn_candidate_pool` scores
+    order = np.lexsort((pool_indexes[mask], rows[mask]))
+    rows, pool_indexes = rows[mask][order], pool_indexes[mask][order]
+    boundaries = np.searchsorted(rows, np.arange(len(position_indexes) + 1))
+    top_ns: list[list] = [[] for _ in positions]
+    for row, position_index in enumerate(position_indexes):
+        start, end = boundaries[row], boundaries[row + 1]
+        top_n = get_top_k(
+            (yields_store.pools[pool_index] for pool_index in pool_indexes[start:end]),
+            topn_int,
+            score=pool_score,
+        )
+        # `pool_similarity` is the outcome of the threshold check in `_get_topn_candidate_pool`
+        top_ns[position_index] = [
+            {"pool_metadata": pool_metadata, "pool_similarity": True}
+            for pool_metadata in top_n
+        ]
+    return top_ns
+
+
+def _get_candidate_pool_columns(
+    yields_store: YieldsStore, pool_ids_of_current_portfolio: set
+) -> pd.DataFrame:
+    """
+    the position independent filters, applied as boolean masks over the whole pool universe once per request
+    the index of the returned rows is still the index of `yields_store.pools`
+    """
+    pool_columns = yields_store.pool_columns
+    mask = (
+        ~pool_columns["chain"].isin(BLACKLIST_CHAINS)
+        & ~pool_columns["project"].isin(BLACKLIST_PROTOCOL)
+        & ~pool_columns["pool"].isin(pool_ids_of_current_portfolio)
+        & (pool_columns["tvlUsd"] > MILLION * 0.7)
+    )
+    candidate_pool_columns = pool_columns[mask].copy()
+    candidate_pool_columns["apr"] = convert_apy_to_apr(
+        get_apy_of_pool_columns(candidate_pool_columns)
+    )
+    return candidate_pool_columns
 
 
 def print_out_topn_candidate_pool(
@@ -126,13 +508,14 @@ def print_out_topn_candidate_pool(
     print(
         f"{symbol}'s possible better protocol to deposit (lowest or default apr {current_apr:.2f}):"
     )
-    for metadata_with_similarity in sorted(
+    for metadata_with_similarity in get_top_k(
         top_n,
-        key=lambda x: (
-            -x["pool_similarity"],
-            -convert_apy_to_apr(get_apy(x["pool_metadata"])),
+        n,
+        score=lambda x: (
+            x["pool_similarity"],
+            convert_apy_to_apr(get_apy(x["pool_metadata"])),
         ),
-    )[:n]:
+    ):
         metadata = metadata_with_similarity["pool_metadata"]
         print(
             f" - Chain: {metadata['chain']}, Protocol: {metadata['project']+':'+metadata['poolMeta'] if metadata['poolMeta'] else metadata['project']}, Token: {metadata['symbol']}, lowest or default APR: {convert_apy_to_apr(get_apy(metadata)):.2f}"
@@ -140,17 +523,12 @@ def print_out_topn_candidate_pool(
 
 
 def _get_current_stable_max_apy_in_your_portfolio(
-    categorized_positions: dict, defillama: dict
+    categorized_positions: dict, yields_store: YieldsStore
 ):
     """
     # Code to calculate the maximum APY for stable coin pools
     think of cash as intermediate_term_bond, since stable usd coin is actually a bond issued by US government
     """
-    defillama_APY_pool_id_to_apy = {
-        obj["pool"]: obj["apy"]
-        for obj in defillama["data"]
-        if obj["stablecoin"] is True
-    }
     max_apy = 0
     for portfolio in categorized_positions["intermediate_term_bond"][
         "portfolio"
@@ -163,8 +541,9 @@ def _get_current_stable_max_apy_in_your_portfolio(
                 continue
             apy = 0
             if key == "defillama-APY-pool-id":
-                if potential_defillama_key in defillama_APY_pool_id_to_apy:
-                    apy = defillama_APY_pool_id_to_apy[potential_defillama_key]
+                pool = yields_store.get_pool(potential_defillama_key)
+                if pool is not None and pool["stablecoin"] is True:
+                    apy = pool["apy"]
             else:
                 apy = convert_apr_to_apy(float(potential_defillama_key))
             if apy > max_apy:
@@ -172,17 +551,14 @@ def _get_current_stable_max_apy_in_your_portfolio(
     return max_apy
 
 
-def _get_topn_apy_pool(defillama: dict, max_apy: float):
-    # Code to retrieve top N pools with APYs greater than or equal to max_apy
-    topn = []
-    for pool in defillama["data"]:
-        if (
-            pool["stablecoin"] is True
-            and pool["apy"] > max_apy
-            and pool["apyMean30d"] > max_apy
-        ):
-            topn.append(pool)
-    return topn
+def _get_topn_apy_pool(yields_store: YieldsStore, max_apy: float, topn_int: int):
+    # Code to retrieve top N stable coin pools with APYs greater than max_apy, apart from the blacklisted ones and tiny ones
+    return [
+        yields_store.pools[pool_index]
+        for pool_index in get_stablecoin_pool_index(yields_store).search(
+            max_apy, topn_int
+        )
+    ]
 
 
 def show_topn_stable_coins(topn: list):
@@ -191,14 +567,25 @@ def show_topn_stable_coins(topn: list):
     print("Better stable coin:")
     print("Current Blacklist Chains: ", ", ".join(BLACKLIST_CHAINS_FOR_STABLE_COIN))
     print("Current Whitelist Stable Coins: ", ", ".join(STABLE_COIN_WHITELIST))
-    for pool in sorted(topn, key=lambda x: x["apy"], reverse=True):
+    for pool in get_top_k(topn, len(topn), score=lambda x: x["apy"]):
         print(
             f"- Chain: {pool['chain']}, Pool: {pool['project']}, Coin: {pool['symbol']}, TVL: {pool['tvlUsd']/MILLION:.2f}M, APR: {convert_apy_to_apr(pool['apy']/100)*100:.2f}%"
         )
 
 
-def _check_if_symbol_consists_of_whitelist_coins(symbol: str):
-    for subsymbol in symbol.split("-"):
-        if subsymbol not in STABLE_COIN_WHITELIST:
-            return False
-    return True
+def print_out_new_combination(new_combination: dict | None):
+    if new_combination is None:
+        print("No combination of pools fits the target asset allocation")
+        return
+    print(
+        f"New combination of pools (blended APR {new_combination['blended_apr']:.2f}):"
+    )
+    for allocation in new_combination["allocations"]:
+        metadata = allocation["pool_metadata"]
+        print(
+            f" - Chain: {metadata['chain']}, Protocol: {metadata['project']}, Token: {metadata['symbol']}, APR: {allocation['apr']:.2f}, Amount: {allocation['amount']:.2f}"
+        )
+    for category, category_sum in new_combination["category_sums"].items():
+        print(
+            f"{category}: {category_sum:.2f}, Target Sum: {new_combination['target_category_sums'][category]:.2f}"
+        )
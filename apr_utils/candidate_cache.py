@@ -0,0 +1,382 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+from rebalance_server.apr_utils.yields_store import YieldsStore, diff_yields_stores
+from rebalance_server.search_handlers import SearchBase
+from rebalance_server.search_handlers.tag_index import get_tag_index
+from rebalance_server.utils.position import skip_rebalance_if_position_too_small
+from rebalance_server.utils.top_k import get_top_k
+
+MAX_CACHED_POSITIONS = 4096
+MAX_CACHED_TOP_NS_PER_POSITION = 16
+
+
+class CandidateCache:
+    """
+    Per position, the pools similar enough to it (by uuid), and its top n candidates of the latest requests.
+    When the yields snapshot changes, only the pools added, removed or changed since the previous snapshot are rescored,
+    and only the positions one of them is (or becomes) similar to get their top n recomputed.
+    The top n of the other positions are served as is.
+    The lock is only held to read and insert entries, the scoring happens outside of it. A snapshot change or a position new to the cache
+    is scored by the first request that needs it, concurrent requests wait for its result rather than scoring it again.
+    """
+
+    def __init__(
+        self,
+        get_search_handler: Callable[[YieldsStore], SearchBase],
+        max_positions: int = MAX_CACHED_POSITIONS,
+    ):
+        self._get_search_handler = get_search_handler
+        self._max_positions = max_positions
+        self._yields_store = None
+        self._search_handler = None
+        # position key -> {"metadata", "similar_pools": {uuid: similarity}, "top_ns": {request key: [uuid]}}
+        # entries are replaced rather than rescored in place, requests may still be reading them outside of the lock
+        self._entries = OrderedDict()
+        self._sync_in_flight = None
+        # (id of the yields store, position key) -> the entry being scored
+        self._positions_in_flight: dict[tuple, Future] = {}
+        self._lock = threading.Lock()
+
+    def get_topn_candidate_pools(
+        self,
+        positions: list[tuple[str, dict, float]],
+        yields_store: YieldsStore,
+        candidate_pool_columns: pd.DataFrame,
+        pool_score,
+        excluded_pool_ids: frozenset,
+        topn_int: int = 5,
+    ) -> list[list]:
+        """
+        same as `apr_pool_optimizer._get_topn_candidate_pools`
+        `candidate_pool_columns` has to be filtered from `yields_store` with `excluded_pool_ids` left out
+        """
+        search_handler = self._sync(yields_store)
+        entries = self._get_entries(positions, yields_store, search_handler)
+        requests = []
+        for _, metadata, apr in positions:
+            if skip_rebalance_if_position_too_small(metadata["worth"]):
+                requests.append(None)
+                continue
+            position_key = _get_position_key(metadata)
+            request_key = (apr, excluded_pool_ids, pool_score, topn_int)
+            requests.append((entries[position_key], position_key, request_key))
+        with self._lock:
+            topn_uuids = [
+                request and request[0]["top_ns"].get(request[2]) for request in requests
+            ]
+        candidate_pool_mask = np.zeros(len(yields_store), dtype=bool)
+        candidate_pool_mask[candidate_pool_columns.index] = True
+        pool_aprs = np.zeros(len(yields_store))
+        pool_aprs[candidate_pool_columns.index] = candidate_pool_columns[
+            "apr"
+        ].to_numpy()
+        computed = {}
+        for i, request in enumerate(requests):
+            if request is None or topn_uuids[i] is not None:
+                continue
+            entry, position_key, request_key = request
+            if (position_key, request_key) not in computed:
+                computed[(position_key, request_key)] = (
+                    entry,
+                    self._get_topn_uuids(
+                        yields_store,
+                        entry,
+                        request_key[0],
+                        candidate_pool_mask,
+                        pool_aprs,
+                        pool_score,
+                        topn_int,
+                    ),
+                )
+            topn_uuids[i] = computed[(position_key, request_key)][1]
+        with self._lock:
+            if self._yields_store is yields_store:
+                for (_, request_key), (entry, uuids) in computed.items():
+                    if len(entry["top_ns"]) >= MAX_CACHED_TOP_NS_PER_POSITION:
+                        entry["top_ns"].clear()
+                    entry["top_ns"][request_key] = uuids
+        # `pool_similarity` is the outcome of the threshold check in `_get_topn_candidate_pool`
+        return [
+            [
+                {"pool_metadata": yields_store.get_pool(uuid), "pool_similarity": True}
+                for uuid in uuids or ()
+            ]
+            for uuids in topn_uuids
+        ]
+
+    def _sync(self, yields_store: YieldsStore) -> SearchBase:
+        """
+        points the cache at `yields_store` and returns its search handler
+        """
+        while True:
+            with self._lock:
+                if yields_store is self._yields_store:
+                    return self._search_handler
+                sync_in_flight = self._sync_in_flight
+                is_leader = sync_in_flight is None
+                if is_leader:
+                    sync_in_flight = self._sync_in_flight = threading.Event()
+                    previous_yields_store = self._yields_store
+                    entries = list(self._entries.items())
+            if not is_leader:
+                # another request is syncing, to this snapshot or another one, check again once it's done
+                sync_in_flight.wait()
+                continue
+            try:
+                search_handler = self._get_search_handler(yields_store)
+                entries = self._get_synced_entries(
+                    previous_yields_store, yields_store, search_handler, entries
+                )
+                with self._lock:
+                    self._yields_store = yields_store
+                    self._search_handler = search_handler
+                    self._entries = OrderedDict(entries)
+                return search_handler
+            finally:
+                with self._lock:
+                    self._sync_in_flight = None
+                sync_in_flight.set()
+
+    def _get_synced_entries(
+        self,
+        previous_yields_store: YieldsStore | None,
+        yields_store: YieldsStore,
+        search_handler: SearchBase,
+        entries: list[tuple[tuple, dict]],
+    ) -> list[tuple[tuple, dict]]:
+        if (
+            previous_yields_store is None
+            or not entries
+            or search_handler.similarity_depends_on_snapshot
+        ):
+            return []
+        diff = diff_yields_stores(previous_yields_store, yields_store)
+        gone = diff["removed"] | diff["changed"]
+        rescored_pool_mask = np.zeros(len(yields_store), dtype=bool)
+        for uuid in diff["added"] | diff["changed"]:
+            rescored_pool_mask[yields_store.get_pool_index(uuid)] = True
+        rescored = {}
+        for row, uuid, similarity in self._get_similar_pools(
+            yields_store,
+            search_handler,
+            [entry["metadata"] for _, entry in entries],
+            rescored_pool_mask,
+        ):
+            rescored.setdefault(row, {})[uuid] = similarity
+        synced_entries = []
+        for row, (position_key, entry) in enumerate(entries):
+            similar_pools = entry["similar_pools"]
+            if row in rescored or any(uuid in similar_pools for uuid in gone):
+                entry = {
+                    "metadata": entry["metadata"],
+                    "similar_pools": {
+                        **{
+                            uuid: similarity
+                            for uuid, similarity in similar_pools.items()
+                            if uuid not in gone
+                        },
+                        **rescored.get(row, {}),
+                    },
+                    "top_ns": {},
+                }
+            synced_entries.append((position_key, entry))
+        return synced_entries
+
+    def _get_entries(
+        self,
+        positions: list[tuple[str, dict, float]],
+        yields_store: YieldsStore,
+        search_handler: SearchBase,
+    ) -> dict[tuple, dict]:
+        """
+        the entry of each position big enough to rebalance, by position key
+        """
+        entries = {}
+        metadatas = {}
+        waiting = {}
+        with self._lock:
+            # another request may have synced to another snapshot in the meantime
+            is_current = yields_store is self._yields_store
+            for _, metadata, _ in positions:
+                if skip_rebalance_if_position_too_small(metadata["worth"]):
+                    continue
+                position_key = _get_position_key(metadata)
+                if (
+                    position_key in entries
+                    or position_key in metadatas
+                    or position_key in waiting
+                ):
+                    continue
+                if is_current and position_key in self._entries:
+                    self._entries.move_to_end(position_key)
+                    entries[position_key] = self._entries[position_key]
+                    continue
+                in_flight = self._positions_in_flight.get(
+                    (id(yields_store), position_key)
+                )
+                if in_flight is None:
+                    self._positions_in_flight[
+                        (id(yields_store), position_key)
+                    ] = Future()
+                    metadatas[position_key] = metadata
+                else:
+                    waiting[position_key] = in_flight
+        if metadatas:
+            entries.update(
+                self._add_new_positions(metadatas, yields_store, search_handler)
+            )
+        for position_key, in_flight in waiting.items():
+            entries[position_key] = in_flight.result()
+        return entries
+
+    def _add_new_positions(
+        self,
+        metadatas: dict[tuple, dict],
+        yields_store: YieldsStore,
+        search_handler: SearchBase,
+    ) -> dict[tuple, dict]:
+        """
+        scores the positions this request got to first, and hands their entries to the requests waiting for them
+        """
+        try:
+            position_keys = list(metadatas)
+            similar_pools = {position_key: {} for position_key in position_keys}
+            for row, uuid, similarity in self._get_similar_pools(
+                yields_store,
+                search_handler,
+                list(metadatas.values()),
+                np.ones(len(yields_store), dtype=bool),
+            ):
+                similar_pools[position_keys[row]][uuid] = similarity
+        except BaseException as e:
+            with self._lock:
+                in_flight = [
+                    self._positions_in_flight.pop((id(yields_store), position_key))
+                    for position_key in metadatas
+                ]
+            for future in in_flight:
+                future.set_exception(e)
+            raise
+        entries = {
+            position_key: {
+                "metadata": metadata,
+                "similar_pools": similar_pools[position_key],
+                "top_ns": {},
+            }
+            for position_key, metadata in metadatas.items()
+        }
+        with self._lock:
+            if yields_store is self._yields_store:
+                self._entries.update(entries)
+                while len(self._entries) > self._max_positions:
+                    self._entries.popitem(last=False)
+            in_flight = [
+                self._positions_in_flight.pop((id(yields_store), position_key))
+                for position_key in metadatas
+            ]
+        for position_key, future in zip(metadatas, in_flight):
+            future.set_result(entries[position_key])
+        return entries
+
+    def _get_similar_pools(
+        self,
+        yields_store: YieldsStore,
+        search_handler: SearchBase,
+        metadatas: list[dict],
+        pool_mask: np.ndarray,
+    ) -> list[tuple[int, str, float]]:
+        """
+        (index of the metadata, pool uuid, similarity) of the pools in `pool_mask` similar enough to one of the positions
+        """
+        similar_pools = []
+        similarity_matrix = search_handler.get_similarity_matrix(
+            metadatas, yields_store, pool_mask
+        )
+        if similarity_matrix is not None:
+            rows, pool_indexes, similarities = similarity_matrix
+            mask = similarities > search_handler.similarity_threshold
+            for row, pool_index, similarity in zip(
+                rows[mask], pool_indexes[mask], similarities[mask]
+            ):
+                similar_pools.append(
+                    (row, yields_store.pools[pool_index]["pool"], similarity)
+                )
+            return similar_pools
+        for row, metadata in enumerate(metadatas):
+            pool_indexes = search_handler.get_candidate_pool_indexes(
+                metadata, get_tag_index(yields_store)
+            )
+            if pool_indexes is None:
+                pool_indexes = range(len(yields_store))
+            for pool_index in pool_indexes:
+                if not pool_mask[pool_index]:
+                    continue
+                pool = yields_store.pools[pool_index]
+                similarity = search_handler.get_similarity(
+                    metadata, pool["symbol"].lower()
+                )
+                if similarity > search_handler.similarity_threshold:
+                    similar_pools.append((row, pool["pool"], similarity))
+        return similar_pools
+
+    def _get_topn_uuids(
+        self,
+        yields_store: YieldsStore,
+        entry: dict,
+        current_apr: float,
+        candidate_pool_mask: np.ndarray,
+        pool_aprs: np.ndarray,
+        pool_score,
+        topn_int: int,
+    ) -> list[str]:
+        pool_indexes = np.array(
+            sorted(
+                yields_store.get_pool_index(uuid) for uuid in entry["similar_pools"]
+            ),
+            dtype=np.int64,
+        )
+        # in pool order, same as the candidates `_get_topn_candidate_pool` scores
+        pool_indexes = pool_indexes[
+            candidate_pool_mask[pool_indexes] & (pool_aprs[pool_indexes] > current_apr)
+        ]
+        return [
+            pool["pool"]
+            for pool in get_top_k(
+                (yields_store.pools[pool_index] for pool_index in pool_indexes),
+                topn_int,
+                score=pool_score,
+            )
+        ]
+
+
+def _get_position_key(metadata: dict) -> tuple:
+    # what the search handlers score a position by
+    return (
+        tuple(metadata["metadata"].get("tags", ())),
+        metadata["metadata"].get("symbol"),
+    )
+
+
+_candidate_caches: dict[tuple, CandidateCache] = {}
+_candidate_caches_lock = threading.Lock()
+
+
+def get_candidate_cache(
+    key: tuple, get_search_handler: Callable[[YieldsStore], SearchBase]
+) -> CandidateCache:
+    with _candidate_caches_lock:
+        if key not in _candidate_caches:
+            _candidate_caches[key] = CandidateCache(get_search_handler)
+        return _candidate_caches[key]
+
+
+def clear_candidate_caches() -> None:
+    # e.g. to measure the candidate search from scratch
+    with _candidate_caches_lock:
+        _candidate_caches.clear()
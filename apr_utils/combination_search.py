@@ -0,0 +1,95 @@
+import time
+from collections import defaultdict
+
+MAX_POOLS_IN_COMBINATION = 5
+DEFAULT_TIME_BUDGET_SECONDS = 1.0
+
+
+def search_best_combination(
+    category_weights: list[tuple[float, ...]],
+    aprs: list[float],
+    capacities: list[float],
+    category_budgets: list[float],
+    tolerance: float,
+    max_pools: int = MAX_POOLS_IN_COMBINATION,
+    min_allocation: float = 0,
+    time_budget_seconds: float = DEFAULT_TIME_BUDGET_SECONDS,
+) -> dict | None:
+    """
+    Branch-and-bound search for the combination of at most `max_pools` pools earning the most interest, i.e. the highest blended APR on the strategy's budget.
+    - `category_weights[i]` is how pool i's liquidity splits across the categories, it sums up to 1
+    - a pool takes as much as its capacity (e.g. a share of its TVL) and the room left in its categories allow, pools are filled from the highest APR down
+    - a category never gets more than its budget, and a combination only counts once every category is within `tolerance` of its budget
+    - pools are visited from the highest APR down, so the room left times the APR of the next pool bounds what a branch can still earn
+    returns {"interest", "allocations": [(pool index, amount)], "exhaustive"}, or None if no combination meets the budgets
+    `exhaustive` is False if the time budget ran out, the best combination found so far is returned then
+    """
+    order = [
+        index
+        for index in sorted(range(len(aprs)), key=lambda index: -aprs[index])
+        if aprs[index] > 0 and capacities[index] >= min_allocation
+    ]
+    order = _drop_dominated_pools(order, category_weights, capacities, max_pools)
+    room = list(category_budgets)
+    allocations = []
+    best = {"interest": float("-inf"), "allocations": None, "exhaustive": True}
+    deadline = time.monotonic() + time_budget_seconds
+
+    def visit(start: int, interest: float) -> None:
+        for position in range(start, len(order)):
+            index = order[position]
+            # every pool from here on has an APR no higher than this one
+            if interest + sum(room) * aprs[index] <= best["interest"]:
+                return
+            if time.monotonic() > deadline:
+                best["exhaustive"] = False
+                return
+            weights = category_weights[index]
+            amount = min(
+                [capacities[index]]
+                + [room[c] / weight for c, weight in enumerate(weights) if weight > 0]
+            )
+            if amount < min_allocation:
+                continue
+            for c, weight in enumerate(weights):
+                room[c] -= amount * weight
+            allocations.append((index, amount))
+            pool_interest = interest + amount * aprs[index]
+            if pool_interest > best["interest"] and all(
+                room_of_category <= tolerance for room_of_category in room
+            ):
+                best["interest"] = pool_interest
+                best["allocations"] = list(allocations)
+            if len(allocations) < max_pools:
+                visit(position + 1, pool_interest)
+            allocations.pop()
+            for c, weight in enumerate(weights):
+                room[c] += amount * weight
+            if not best["exhaustive"]:
+                return
+
+    visit(0, 0.0)
+    if best["allocations"] is None:
+        return None
+    return best
+
+
+def _drop_dominated_pools(
+    order: list[int],
+    category_weights: list[tuple[float, ...]],
+    capacities: list[float],
+    max_pools: int,
+) -> list[int]:
+    # a pool with `max_pools` pools of the same composition, a higher APR and a larger capacity ahead of it is never needed
+    kept_capacities_by_weights = defaultdict(list)
+    result = []
+    for index in order:
+        kept_capacities = kept_capacities_by_weights[category_weights[index]]
+        if (
+            sum(1 for capacity in kept_capacities if capacity >= capacities[index])
+            >= max_pools
+        ):
+            continue
+        kept_capacities.append(capacities[index])
+        result.append(index)
+    return result
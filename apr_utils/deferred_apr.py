@@ -0,0 +1,88 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable
+
+DEFAULT_DEFERRED_APR_TTL_SECONDS = 60 * 30
+DEFAULT_WARM_UP_MAX_WORKERS = 8
+# after a failed refetch, the stale APR is served this long (at most the ttl) before the upstream is tried again
+DEFERRED_APR_RETRY_BACKOFF_SECONDS = 60
+
+
+class DeferredAPR:
+    """
+    An APR that is fetched from its upstream API on first use instead of at import time.
+    The fetched value is kept for `ttl` seconds, after that the next `resolve()` fetches it again.
+    If the refetch fails, the last good value is served until the upstream recovers.
+    """
+
+    def __init__(
+        self,
+        fetcher: Callable[..., float],
+        *args,
+        ttl: float = DEFAULT_DEFERRED_APR_TTL_SECONDS,
+        **kwargs,
+    ):
+        self._fetcher = fetcher
+        self._args = args
+        self._kwargs = kwargs
+        self.ttl = ttl
+        self._value = None
+        self._fetched_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_stale(self) -> bool:
+        return self._fetched_at is None or time.time() - self._fetched_at > self.ttl
+
+    def resolve(self) -> float:
+        if not self.is_stale:
+            return self._value
+        with self._lock:
+            # another thread might have refreshed it while we were waiting for the lock
+            if not self.is_stale:
+                return self._value
+            try:
+                self._value = self._fetcher(*self._args, **self._kwargs)
+            except Exception as e:
+                if self._value is None:
+                    raise
+                print(f"Failed to refresh {self}, serving the stale APR instead: {e}")
+                # back off, so callers don't each block on another fetch while the upstream is down
+                self._fetched_at = (
+                    time.time()
+                    - self.ttl
+                    + min(self.ttl, DEFERRED_APR_RETRY_BACKOFF_SECONDS)
+                )
+                return self._value
+            self._fetched_at = time.time()
+            return self._value
+
+    def __repr__(self) -> str:
+        arguments = [repr(arg) for arg in self._args] + [
+            f"{k}={v!r}" for k, v in self._kwargs.items()
+        ]
+        return f"DeferredAPR({self._fetcher.__name__}({', '.join(arguments)}))"
+
+
+def resolve_apr(apr):
+    if isinstance(apr, DeferredAPR):
+        return apr.resolve()
+    return apr
+
+
+def warm_up_deferred_aprs(
+    deferred_aprs: Iterable[DeferredAPR],
+    max_workers: int = DEFAULT_WARM_UP_MAX_WORKERS,
+) -> None:
+    """
+    Resolve every stale DeferredAPR concurrently, so one slow upstream doesn't serialize the others
+    """
+    stale_aprs = [apr for apr in deferred_aprs if apr.is_stale]
+    if not stale_aprs:
+        return
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(apr.resolve) for apr in stale_aprs]
+    for apr, future in zip(stale_aprs, futures):
+        if future.exception() is not None:
+            print(f"Failed to warm up {apr}: {future.exception()}")
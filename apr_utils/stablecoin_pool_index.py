@@ -0,0 +1,80 @@
+from typing import TYPE_CHECKING
+
+import numpy as np
+import pandas as pd
+
+from rebalance_server.portfolio_config import (
+    BLACKLIST_CHAINS_FOR_STABLE_COIN,
+    BLACKLIST_PROTOCOL,
+    STABLE_COIN_WHITELIST,
+)
+from rebalance_server.utils.store_indexes import get_store_index
+
+if TYPE_CHECKING:
+    from rebalance_server.apr_utils.yields_store import YieldsStore
+
+MIN_STABLECOIN_POOL_TVL_USD = 10**5
+
+
+class StablecoinPoolIndex:
+    """
+    The stable coin pools of a snapshot sorted by APY, highest first and ties in pool order.
+    The filters that don't depend on the portfolio (TVL, blacklists, whitelisted symbol) are applied once per snapshot,
+    so a query only walks the pools above the portfolio's APY, and stops at the `topn_int`-th one that qualifies
+    """
+
+    def __init__(self, pool_columns: pd.DataFrame, symbols: list[str]):
+        is_eligible = (
+            pool_columns["stablecoin"].to_numpy()
+            & (pool_columns["tvlUsd"].to_numpy() >= MIN_STABLECOIN_POOL_TVL_USD)
+            & ~pool_columns["chain"].isin(BLACKLIST_CHAINS_FOR_STABLE_COIN).to_numpy()
+            & ~pool_columns["project"].isin(BLACKLIST_PROTOCOL).to_numpy()
+            & np.array(
+                [_check_if_symbol_consists_of_whitelist_coins(s) for s in symbols],
+                dtype=bool,
+            )
+        )
+        apys = pool_columns["apy"].to_numpy()
+        # a NaN APY is never above anyone's
+        pool_indexes = np.flatnonzero(is_eligible & ~np.isnan(apys))
+        pool_indexes = pool_indexes[np.argsort(-apys[pool_indexes], kind="stable")]
+        self._pool_indexes = pool_indexes.tolist()
+        self._apys = apys[pool_indexes].tolist()
+        self._apy_mean_30ds = (
+            pool_columns["apyMean30d"].to_numpy()[pool_indexes].tolist()
+        )
+
+    def search(self, max_apy: float, topn_int: int) -> list[int]:
+        """
+        indexes of the `topn_int` pools with the highest APY whose APY and 30-day mean APY are both above `max_apy`
+        """
+        result = []
+        if topn_int <= 0:
+            return result
+        for pool_index, apy, apy_mean_30d in zip(
+            self._pool_indexes, self._apys, self._apy_mean_30ds
+        ):
+            if apy <= max_apy:
+                break
+            if apy_mean_30d > max_apy:
+                result.append(pool_index)
+                if len(result) == topn_int:
+                    break
+        return result
+
+
+def get_stablecoin_pool_index(yields_store: "YieldsStore") -> StablecoinPoolIndex:
+    return get_store_index(
+        yields_store,
+        "stablecoin_pool_index",
+        lambda yields_store: StablecoinPoolIndex(
+            yields_store.pool_columns, [pool["symbol"] for pool in yields_store.pools]
+        ),
+    )
+
+
+def _check_if_symbol_consists_of_whitelist_coins(symbol: str):
+    for subsymbol in symbol.split("-"):
+        if subsymbol not in STABLE_COIN_WHITELIST:
+            return False
+    return True
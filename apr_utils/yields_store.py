@@ -0,0 +1,242 @@
+import threading
+from collections import defaultdict
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+import requests
+
+from rebalance_server.portfolio_config import (
+    ADDRESS_2_CATEGORY,
+    BLACKLIST_CHAINS,
+    BLACKLIST_CHAINS_FOR_STABLE_COIN,
+    BLACKLIST_PROTOCOL,
+    DEFILLAMA_SNAPSHOT_TTL_SECONDS,
+)
+from rebalance_server.utils.json_stream import iter_json_array_items
+from rebalance_server.utils.snapshot_refresher import (
+    SnapshotRefresher,
+    register_snapshot_refresher,
+)
+from rebalance_server.utils.store_indexes import get_store_index
+
+YIELD_LLAMA_FILE_PATH = "rebalance_server/yield-llama.json"
+DEFILLAMA_POOLS_API = "https://yields.llama.fi/pools"
+DEFILLAMA_POOLS_API_TIMEOUT_SECONDS = 60
+DEFILLAMA_POOLS_API_CHUNK_SIZE = 1 << 16
+# the only fields of defillama's pools the optimizers read, the rest are dropped on the way in
+POOL_FIELDS = (
+    "pool",
+    "chain",
+    "project",
+    "symbol",
+    "poolMeta",
+    "apy",
+    "apyMean30d",
+    "tvlUsd",
+    "stablecoin",
+)
+# the smallest TVL any of the optimizers' filters lets through
+MIN_POOL_TVL_USD = 10**5
+# a pool counts as changed between two snapshots if any of these differ
+POOL_DIFF_FIELDS = (
+    "chain",
+    "project",
+    "symbol",
+    "poolMeta",
+    "apy",
+    "apyMean30d",
+    "tvlUsd",
+    "stablecoin",
+)
+
+
+class YieldsStore:
+    """
+    In-memory snapshot of defillama's yields API, indexed by pool uuid, chain, project and stablecoin flag
+    """
+
+    def __init__(self, pools: list[dict]):
+        self._pools = pools
+        self._pool_by_uuid = {}
+        self._pool_index_by_uuid = {}
+        self._pools_by_chain = defaultdict(list)
+        self._pools_by_project = defaultdict(list)
+        self._stablecoin_pools = []
+        for pool_index, pool in enumerate(pools):
+            self._pool_by_uuid[pool["pool"]] = pool
+            self._pool_index_by_uuid[pool["pool"]] = pool_index
+            self._pools_by_chain[pool["chain"]].append(pool)
+            self._pools_by_project[pool["project"]].append(pool)
+            if pool["stablecoin"] is True:
+                self._stablecoin_pools.append(pool)
+
+    @classmethod
+    def from_json(cls, res_json: dict) -> "YieldsStore":
+        """
+        either defillama's payload, or the compact snapshot `_get_data_from_defillama` writes:
+        {"fields": POOL_FIELDS, "rows": [[value of each field]]}
+        """
+        if "rows" in res_json:
+            fields = res_json["fields"]
+            return cls([dict(zip(fields, row)) for row in res_json["rows"]])
+        return cls(res_json["data"])
+
+    @property
+    def pools(self) -> list[dict]:
+        return self._pools
+
+    def get_pool(self, pool_uuid: str) -> dict | None:
+        return self._pool_by_uuid.get(pool_uuid)
+
+    def get_pool_index(self, pool_uuid: str) -> int | None:
+        return self._pool_index_by_uuid.get(pool_uuid)
+
+    def get_pools_by_chain(self, chain: str) -> list[dict]:
+        return self._pools_by_chain.get(chain, [])
+
+    def get_pools_by_project(self, project: str) -> list[dict]:
+        return self._pools_by_project.get(project, [])
+
+    def get_stablecoin_pools(self) -> list[dict]:
+        return self._stablecoin_pools
+
+    @cached_property
+    def pool_columns(self) -> pd.DataFrame:
+        """
+        the numeric and categorical fields of every pool as columns, row i is `self.pools[i]`
+        so filters can be applied as boolean masks instead of looping over the pool dicts
+        """
+        return pd.DataFrame(
+            {
+                "pool": [pool["pool"] for pool in self._pools],
+                "chain": pd.Categorical([pool["chain"] for pool in self._pools]),
+                "project": pd.Categorical([pool["project"] for pool in self._pools]),
+                "apy": np.array([pool["apy"] for pool in self._pools], dtype=float),
+                "apyMean30d": np.array(
+                    [pool["apyMean30d"] for pool in self._pools], dtype=float
+                ),
+                "tvlUsd": np.array(
+                    [pool["tvlUsd"] for pool in self._pools], dtype=float
+                ),
+                "stablecoin": np.array(
+                    [pool["stablecoin"] is True for pool in self._pools], dtype=bool
+                ),
+            }
+        )
+
+    def get_pools_by_mask(self, mask: np.ndarray) -> list[dict]:
+        return [self._pools[index] for index in np.flatnonzero(mask)]
+
+    def __len__(self) -> int:
+        return len(self._pools)
+
+
+def diff_yields_stores(old: YieldsStore, new: YieldsStore) -> dict[str, set[str]]:
+    """
+    uuids of the pools added, removed and changed (see POOL_DIFF_FIELDS) between two snapshots
+    """
+    old_fingerprints = get_pool_fingerprints(old)
+    new_fingerprints = get_pool_fingerprints(new)
+    return {
+        "added": new_fingerprints.keys() - old_fingerprints.keys(),
+        "removed": old_fingerprints.keys() - new_fingerprints.keys(),
+        "changed": {
+            uuid
+            for uuid, fingerprint in new_fingerprints.items()
+            if old_fingerprints.get(uuid, fingerprint) != fingerprint
+        },
+    }
+
+
+def get_pool_fingerprints(yields_store: YieldsStore) -> dict[str, tuple]:
+    # the POOL_DIFF_FIELDS of every pool by uuid, the last pool wins like in `get_pool`
+    return get_store_index(
+        yields_store,
+        "pool_fingerprints",
+        lambda yields_store: {
+            pool["pool"]: tuple(map(pool.get, POOL_DIFF_FIELDS))
+            for pool in yields_store.pools
+        },
+    )
+
+
+_yields_store = None
+_yields_store_lock = threading.Lock()
+
+
+def get_yields_store() -> YieldsStore:
+    """
+    process-wide store, the snapshot on disk is parsed once and then served from memory
+    the snapshot refresher swaps in a new store in the background once the snapshot is older than its ttl
+    """
+    global _yields_store
+    if _yields_store is not None:
+        return _yields_store
+    with _yields_store_lock:
+        if _yields_store is None:
+            refresher = get_yields_snapshot_refresher()
+            _yields_store = YieldsStore.from_json(refresher.load())
+    return _yields_store
+
+
+def get_yields_snapshot_refresher() -> SnapshotRefresher:
+    return register_snapshot_refresher(
+        SnapshotRefresher(
+            name="defillama-yields",
+            snapshot_path=YIELD_LLAMA_FILE_PATH,
+            ttl=DEFILLAMA_SNAPSHOT_TTL_SECONDS,
+            fetch=_get_data_from_defillama,
+            on_update=_swap_yields_store,
+        )
+    )
+
+
+def _swap_yields_store(res_json: dict) -> None:
+    # readers holding the old store keep a consistent view of it
+    global _yields_store
+    _yields_store = YieldsStore.from_json(res_json)
+
+
+def _get_data_from_defillama() -> dict:
+    """
+    stream defillama's pools payload, keeping only POOL_FIELDS of the pools the optimizers could ever pick
+    """
+    pinned_pool_ids = _get_pinned_pool_ids()
+    with requests.get(
+        DEFILLAMA_POOLS_API,
+        stream=True,
+        timeout=DEFILLAMA_POOLS_API_TIMEOUT_SECONDS,
+    ) as res:
+        res.raise_for_status()
+        rows = [
+            [pool.get(field) for field in POOL_FIELDS]
+            for pool in iter_json_array_items(
+                res.iter_content(chunk_size=DEFILLAMA_POOLS_API_CHUNK_SIZE), "data"
+            )
+            if _is_pool_worth_keeping(pool, pinned_pool_ids)
+        ]
+    return {"fields": list(POOL_FIELDS), "rows": rows}
+
+
+def _is_pool_worth_keeping(pool: dict, pinned_pool_ids: set[str]) -> bool:
+    # the pools in portfolio_config are looked up by uuid for their APR, whatever they are
+    if pool.get("pool") in pinned_pool_ids:
+        return True
+    if pool.get("project") in BLACKLIST_PROTOCOL:
+        return False
+    if (pool.get("tvlUsd") or 0) < MIN_POOL_TVL_USD:
+        return False
+    # blacklisted chains are only searched for stable coin pools
+    return pool.get("chain") not in BLACKLIST_CHAINS or (
+        pool.get("stablecoin") is True
+        and pool.get("chain") not in BLACKLIST_CHAINS_FOR_STABLE_COIN
+    )
+
+
+def _get_pinned_pool_ids() -> set[str]:
+    return {
+        metadata["defillama-APY-pool-id"]
+        for metadata in ADDRESS_2_CATEGORY.values()
+        if metadata.get("defillama-APY-pool-id")
+    }
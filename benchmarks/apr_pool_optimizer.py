@@ -0,0 +1,234 @@
+"""
+Wall time, peak memory and pools/sec of each stage of the apr pool optimizer on synthetic pool universes
+a stage slower or hungrier than its baseline in baselines.json (beyond the tolerances below) fails the run
+usage: python -m rebalance_server.benchmarks.apr_pool_optimizer --preset 20k [--update-baselines]
+       python -m rebalance_server.benchmarks.apr_pool_optimizer --pools 50000 --positions 200
+"""
+import contextlib
+import gc
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+from typing import Callable
+from unittest import mock
+
+from rebalance_server.apr_utils import apr_pool_optimizer
+from rebalance_server.apr_utils.candidate_cache import clear_candidate_caches
+from rebalance_server.apr_utils.yields_store import YieldsStore, get_pool_fingerprints
+from rebalance_server.benchmarks.synthetic import (
+    generate_categorized_positions,
+    generate_pools,
+    get_address_2_category,
+)
+from rebalance_server.portfolio_config import ADDRESS_2_CATEGORY
+from rebalance_server.search_handlers.minhash_lsh_handler import get_minhash_lsh_index
+from rebalance_server.search_handlers.ngram_handler import get_ngram_index
+from rebalance_server.search_handlers.tag_index import get_suffix_trie, get_tag_index
+from rebalance_server.search_handlers.token_incidence import get_token_incidence
+from rebalance_server.utils.store_indexes import drop_store_index
+
+SEARCHING_ALGORITHMS = ["jaccard_similarity", "ngram", "minhash_lsh"]
+# (pools, positions, searching algorithms), ngram scores every pool sharing an n-gram with a position,
+# which is most of the synthetic universe, so it's left out of the large presets
+PRESETS = {
+    "1k": (1_000, 10, SEARCHING_ALGORITHMS),
+    "20k": (20_000, 100, SEARCHING_ALGORITHMS),
+    "100k": (100_000, 300, ["jaccard_similarity", "minhash_lsh"]),
+    "500k": (500_000, 1_000, ["jaccard_similarity"]),
+}
+BASELINES_PATH = os.path.join(os.path.dirname(__file__), "baselines.json")
+# baselines are recorded on one machine, so leave room for noise before calling it a regression
+WALL_TIME_TOLERANCE = 0.5
+PEAK_MEMORY_TOLERANCE = 0.25
+MIN_WALL_TIME_SLACK_SECONDS = 0.01
+MIN_PEAK_MEMORY_SLACK_MB = 1.0
+
+
+def benchmark_apr_pool_optimizer(
+    n_pools: int,
+    n_positions: int,
+    seed: int = 0,
+    searching_algorithms: list[str] = SEARCHING_ALGORITHMS,
+) -> dict[str, dict]:
+    """
+    {stage: {"wall_seconds", "peak_memory_mb", "pools_per_second"}}
+    each stage runs once for its wall time, then once more under tracemalloc for its peak memory
+    """
+    pools = generate_pools(n_pools, seed=seed)
+    categorized_positions = generate_categorized_positions(
+        n_positions, pools, seed=seed
+    )
+    yields_store = _build_yields_store(pools, searching_algorithms)
+
+    def search_candidates(searching_algorithm: str) -> Callable[[], None]:
+        return lambda: apr_pool_optimizer.search_top_n_pool_consist_of_same_lp_token(
+            categorized_positions, "new_pool", searching_algorithm, max_workers=0
+        )
+
+    # (name, setup, run), setup puts the process in the state the stage starts from and isn't measured
+    stages = [
+        (
+            "yields_store",
+            lambda: None,
+            lambda: _build_yields_store(pools, searching_algorithms),
+        )
+    ]
+    for searching_algorithm in searching_algorithms:
+        stages.append(
+            (
+                f"candidate_search:{searching_algorithm}",
+                clear_candidate_caches,
+                search_candidates(searching_algorithm),
+            )
+        )
+        stages.append(
+            (
+                f"candidate_search:{searching_algorithm}:cached",
+                search_candidates(searching_algorithm),
+                search_candidates(searching_algorithm),
+            )
+        )
+    stages.append(
+        (
+            "stable_coin_search",
+            # its index is built by the first search of a snapshot, so the stage builds it too
+            lambda: drop_store_index(yields_store, "stablecoin_pool_index"),
+            lambda: apr_pool_optimizer.search_better_stable_coin_pools(
+                categorized_positions
+            ),
+        )
+    )
+
+    results = {}
+    with mock.patch.object(
+        apr_pool_optimizer, "get_yields_store", lambda: yields_store
+    ), mock.patch.dict(
+        ADDRESS_2_CATEGORY, get_address_2_category(categorized_positions)
+    ), contextlib.redirect_stdout(
+        io.StringIO()
+    ):
+        for name, setup, run in stages:
+            setup()
+            gc.collect()
+            start = time.perf_counter()
+            run()
+            wall_seconds = time.perf_counter() - start
+            setup()
+            gc.collect()
+            tracemalloc.start()
+            run()
+            _, peak_memory = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            results[name] = {
+                "wall_seconds": wall_seconds,
+                "peak_memory_mb": peak_memory / 2**20,
+                "pools_per_second": n_pools / wall_seconds,
+            }
+    clear_candidate_caches()
+    return results
+
+
+def _build_yields_store(
+    pools: list[dict], searching_algorithms: list[str]
+) -> YieldsStore:
+    # everything a snapshot builds once for the searching algorithms in use, before serving requests
+    yields_store = YieldsStore(pools)
+    yields_store.pool_columns
+    get_pool_fingerprints(yields_store)
+    get_tag_index(yields_store)
+    get_suffix_trie(yields_store)
+    for searching_algorithm in searching_algorithms:
+        if searching_algorithm == "jaccard_similarity":
+            get_token_incidence(yields_store)
+        elif searching_algorithm == "ngram":
+            get_ngram_index(yields_store)
+        elif searching_algorithm == "minhash_lsh":
+            get_minhash_lsh_index(yields_store)
+    return yields_store
+
+
+def get_regressions(results: dict[str, dict], baselines: dict[str, dict]) -> list[str]:
+    """
+    the stages whose wall time or peak memory went past their baseline's, the stages without a baseline are skipped
+    """
+    regressions = []
+    for name, result in results.items():
+        baseline = baselines.get(name)
+        if baseline is None:
+            continue
+        max_wall_seconds = max(
+            baseline["wall_seconds"] * (1 + WALL_TIME_TOLERANCE),
+            baseline["wall_seconds"] + MIN_WALL_TIME_SLACK_SECONDS,
+        )
+        if result["wall_seconds"] > max_wall_seconds:
+            regressions.append(
+                f"{name}: {result['wall_seconds']:.4f}s, baseline {baseline['wall_seconds']:.4f}s"
+            )
+        max_peak_memory_mb = max(
+            baseline["peak_memory_mb"] * (1 + PEAK_MEMORY_TOLERANCE),
+            baseline["peak_memory_mb"] + MIN_PEAK_MEMORY_SLACK_MB,
+        )
+        if result["peak_memory_mb"] > max_peak_memory_mb:
+            regressions.append(
+                f"{name}: {result['peak_memory_mb']:.1f}MB, baseline {baseline['peak_memory_mb']:.1f}MB"
+            )
+    return regressions
+
+
+def load_baselines() -> dict:
+    try:
+        with open(BASELINES_PATH, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--preset", choices=PRESETS)
+    parser.add_argument("--pools", type=int, default=20_000)
+    parser.add_argument("--positions", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--algorithms",
+        nargs="+",
+        choices=SEARCHING_ALGORITHMS,
+        help="defaults to the preset's, or all of them",
+    )
+    parser.add_argument(
+        "--update-baselines",
+        action="store_true",
+        help="record this run as the preset's baseline instead of checking it",
+    )
+    args = parser.parse_args()
+    n_pools, n_positions, searching_algorithms = (
+        PRESETS[args.preset]
+        if args.preset
+        else (args.pools, args.positions, SEARCHING_ALGORITHMS)
+    )
+    results = benchmark_apr_pool_optimizer(
+        n_pools, n_positions, args.seed, args.algorithms or searching_algorithms
+    )
+    print(f"pools: {n_pools}, positions: {n_positions}")
+    for name, result in results.items():
+        print(
+            f"{name}: {result['wall_seconds']:.4f}s, {result['peak_memory_mb']:.1f}MB peak, {result['pools_per_second']:.0f} pools/s"
+        )
+    if args.preset is None:
+        sys.exit(0)
+    baselines = load_baselines()
+    if args.update_baselines:
+        baselines.setdefault(args.preset, {}).update(results)
+        with open(BASELINES_PATH, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write("\n")
+        sys.exit(0)
+    regressions = get_regressions(results, baselines.get(args.preset, {}))
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,140 @@
+"""
+Recall and latency of the approximate MinHash/LSH handler against the exact jaccard handler
+a recall or precision below the minimums below fails the run
+usage: python -m rebalance_server.benchmarks.minhash_lsh_vs_jaccard --pools 20000 --positions 50
+"""
+import sys
+import time
+
+from rebalance_server.apr_utils.yields_store import YieldsStore
+from rebalance_server.benchmarks.synthetic import (
+    generate_categorized_positions,
+    generate_pools,
+)
+from rebalance_server.search_handlers.jaccard_similarity_handler import (
+    JaccardSimilarityHandler,
+)
+from rebalance_server.search_handlers.minhash_lsh_handler import (
+    MinHashLSHSimilarityHandler,
+    get_minhash_lsh_index,
+)
+from rebalance_server.search_handlers.tag_index import get_suffix_trie, get_tag_index
+
+SIMILARITY_THRESHOLD = 0.5
+# the candidates are scored exactly, so every pool it finds should pass, and LSH should miss next to none
+MIN_RECALL = 0.99
+MIN_PRECISION = 1.0
+
+
+def benchmark_minhash_lsh_vs_jaccard(n_pools: int, n_positions: int, seed: int = 0):
+    pools = generate_pools(n_pools, seed=seed)
+    yields_store = YieldsStore(pools)
+    categorized_positions = generate_categorized_positions(
+        n_positions, pools, seed=seed
+    )
+    positions = list(
+        {
+            project_symbol: position
+            for portfolio in categorized_positions.values()
+            for project_symbol, position in portfolio["portfolio"].items()
+        }.values()
+    )
+    symbols = [pool["symbol"].lower() for pool in pools]
+
+    start = time.perf_counter()
+    jaccard = JaccardSimilarityHandler(
+        similarity_threshold=SIMILARITY_THRESHOLD,
+        suffix_trie=get_suffix_trie(yields_store),
+    )
+    tag_index = get_tag_index(yields_store)
+    exact_index_build_time = time.perf_counter() - start
+    start = time.perf_counter()
+    minhash_lsh = MinHashLSHSimilarityHandler(
+        similarity_threshold=SIMILARITY_THRESHOLD,
+        minhash_lsh_index=get_minhash_lsh_index(yields_store),
+        suffix_trie=get_suffix_trie(yields_store),
+    )
+    minhash_lsh_index_build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    exact_full_scan = [
+        {
+            pool_index
+            for pool_index, symbol in enumerate(symbols)
+            if jaccard.get_similarity(position, symbol) > SIMILARITY_THRESHOLD
+        }
+        for position in positions
+    ]
+    exact_full_scan_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    exact_tag_index = [
+        {
+            pool_index
+            for pool_index in jaccard.get_candidate_pool_indexes(position, tag_index)
+            if jaccard.get_similarity(position, symbols[pool_index])
+            > SIMILARITY_THRESHOLD
+        }
+        for position in positions
+    ]
+    exact_tag_index_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    approximate = [
+        {
+            pool_index
+            for pool_index in minhash_lsh.get_candidate_pool_indexes(
+                position, tag_index
+            )
+            if minhash_lsh.get_similarity(position, symbols[pool_index])
+            > SIMILARITY_THRESHOLD
+        }
+        for position in positions
+    ]
+    minhash_lsh_time = time.perf_counter() - start
+
+    assert exact_full_scan == exact_tag_index
+    n_exact = sum(len(pool_indexes) for pool_indexes in exact_full_scan)
+    n_approximate = sum(len(pool_indexes) for pool_indexes in approximate)
+    n_both = sum(
+        len(exact & approx) for exact, approx in zip(exact_full_scan, approximate)
+    )
+    return {
+        "pools": n_pools,
+        "positions": len(positions),
+        "exact_index_build_seconds": exact_index_build_time,
+        "minhash_lsh_index_build_seconds": minhash_lsh_index_build_time,
+        "exact_full_scan_ms_per_position": exact_full_scan_time / len(positions) * 1000,
+        "exact_tag_index_ms_per_position": exact_tag_index_time / len(positions) * 1000,
+        "minhash_lsh_ms_per_position": minhash_lsh_time / len(positions) * 1000,
+        "recall": n_both / n_exact if n_exact else 1.0,
+        "precision": n_both / n_approximate if n_approximate else 1.0,
+    }
+
+
+def get_regressions(results: dict) -> list[str]:
+    regressions = []
+    if results["recall"] < MIN_RECALL:
+        regressions.append(f"recall: {results['recall']:.4f}, minimum {MIN_RECALL}")
+    if results["precision"] < MIN_PRECISION:
+        regressions.append(
+            f"precision: {results['precision']:.4f}, minimum {MIN_PRECISION}"
+        )
+    return regressions
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pools", type=int, default=20000)
+    parser.add_argument("--positions", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    results = benchmark_minhash_lsh_vs_jaccard(args.pools, args.positions, args.seed)
+    for key, value in results.items():
+        print(f"{key}: {value:.4f}" if isinstance(value, float) else f"{key}: {value}")
+    regressions = get_regressions(results)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    sys.exit(1 if regressions else 0)
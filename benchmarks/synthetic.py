@@ -0,0 +1,152 @@
+"""
+synthetic defillama-shaped pools and categorized portfolios, so the optimizer can be measured without hitting any API
+"""
+import random
+import uuid
+
+from rebalance_server.utils.categorized_positions import (
+    CATEGORIES,
+    CategorizedPositions,
+    PositionSource,
+)
+
+STABLE_COINS = [
+    "USDC",
+    "USDT",
+    "DAI",
+    "FRAX",
+    "USDC.E",
+    "USDT.E",
+    "MIM",
+    "BUSD",
+    "LUSD",
+]
+VOLATILE_TOKENS = [
+    "ETH",
+    "WETH",
+    "STETH",
+    "WSTETH",
+    "RETH",
+    "FRXETH",
+    "SFRXETH",
+    "WBTC",
+    "GLP",
+    "GMX",
+    "ARB",
+    "OP",
+    "VELO",
+    "CRV",
+    "CVX",
+    "CVXCRV",
+    "PENDLE",
+    "RDNT",
+    "MAGIC",
+    "DPX",
+    "KAVA",
+    "WKAVA",
+    "OHM",
+    "GOHM",
+    "BNB",
+    "MATIC",
+    "FIL",
+    "LINK",
+    "UNI",
+    "AAVE",
+]
+CHAINS = [
+    "Ethereum",
+    "Arbitrum",
+    "Optimism",
+    "Polygon",
+    "Avalanche",
+    "BSC",
+    "Solana",
+    "Base",
+    "Kava",
+    "Linea",
+]
+PROJECTS = [
+    "uniswap-v3",
+    "kyberswap-elastic",
+    "curve-dex",
+    "convex-finance",
+    "aave-v3",
+    "gmx",
+    "beefy",
+    "yearn-finance",
+    "sushiswap",
+    "velodrome-v2",
+    "pendle",
+    "stakedao",
+    "balancer-v2",
+    "acryptos",
+    "gamma",
+]
+
+
+def generate_pools(n: int, seed: int = 0) -> list[dict]:
+    rng = random.Random(seed)
+    # long tail of made up tokens, like the real universe
+    tokens = (
+        VOLATILE_TOKENS + STABLE_COINS + [f"TKN{i}" for i in range(max(n // 20, 1))]
+    )
+    pools = []
+    for _ in range(n):
+        symbols = rng.sample(tokens, rng.choice([1, 1, 2, 2, 2, 3]))
+        apy = rng.expovariate(1 / 15)
+        pools.append(
+            {
+                "pool": str(uuid.UUID(int=rng.getrandbits(128))),
+                "chain": rng.choice(CHAINS),
+                "project": rng.choice(PROJECTS),
+                "symbol": "-".join(symbols),
+                "poolMeta": rng.choice([None, "meta"]),
+                "apy": apy,
+                "apyMean30d": apy * rng.uniform(0.5, 1.5),
+                "tvlUsd": rng.expovariate(1 / 3e6),
+                "stablecoin": all(symbol in STABLE_COINS for symbol in symbols),
+            }
+        )
+    return pools
+
+
+def generate_categorized_positions(
+    n: int, pools: list[dict], seed: int = 0
+) -> CategorizedPositions:
+    """
+    categorized positions shaped like `main.categorize_positions`'s output, each position backed by one of the pools
+    """
+    rng = random.Random(seed)
+    result = CategorizedPositions()
+    for index, pool in enumerate(rng.sample(pools, min(n, len(pools)))):
+        tags = [symbol.lower() for symbol in pool["symbol"].split("-")]
+        metadata = {
+            "categories": rng.sample(CATEGORIES, rng.choice([1, 1, 2])),
+            "symbol": pool["symbol"],
+            "defillama-APY-pool-id": pool["pool"],
+            "tags": tags,
+            "composition": {tag: 1 / len(tags) for tag in tags},
+        }
+        worth = rng.expovariate(1 / 5000) + 100
+        project_symbol = f"{pool['project']}-{index}:{pool['symbol']}"
+        result.add_position(
+            project_symbol,
+            {
+                category: worth / len(metadata["categories"])
+                for category in metadata["categories"]
+            },
+            PositionSource(f"0x{index:040x}:{pool['project']}", pool["apy"] / 100, []),
+            metadata,
+        )
+    return result
+
+
+def get_address_2_category(categorized_positions: dict) -> dict:
+    """
+    `portfolio_config.ADDRESS_2_CATEGORY` entries of the positions, so their APR can be looked up like the real ones
+    """
+    return {
+        position["address"]: {**position["metadata"], "APR": position["APR"]}
+        for portfolio in categorized_positions.values()
+        for position in portfolio["portfolio"].values()
+    }
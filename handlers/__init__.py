@@ -1,5 +1,6 @@
 from rebalance_server.handlers.debank_handler import debank_handler
 from rebalance_server.handlers.nansen_handler import nansen_handler
+from rebalance_server.handlers.zapper_handler import zapper_handler
 
 
 def get_data_source_handler(defi_portfolio_service_name) -> callable:
@@ -7,6 +8,8 @@ def get_data_source_handler(defi_portfolio_service_name) -> callable:
         return debank_handler
     elif defi_portfolio_service_name == "nansen":
         return nansen_handler
+    elif defi_portfolio_service_name == "zapper":
+        return zapper_handler
     raise NotImplementedError(
         f"{defi_portfolio_service_name} handler not implemented yet"
     )
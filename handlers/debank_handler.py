@@ -1,14 +1,38 @@
+import hashlib
+import json
+from collections import defaultdict
+from typing import Iterable
+
 from rebalance_server.apr_utils.apr_calculator import get_lowest_or_default_apr
-from rebalance_server.handlers.utils import place_value_into_categorized_portfolio_dict
+from rebalance_server.handlers.utils import (
+    get_weighted_balanceUSD,
+    place_value_into_categorized_portfolio_dict,
+)
 from rebalance_server.portfolio_config import (
     ADDRESS_2_CATEGORY,
     MIN_REBALANCE_POSITION_THRESHOLD,
     get_metadata_by_project_symbol,
 )
+from rebalance_server.utils.categorized_positions import (
+    CategorizedPositions,
+    PositionSource,
+)
 
 
 def debank_handler(positions, result):
-    for pool in positions["data"]["result"]["data"]:
+    """
+    `positions` is either DeBank's merged payload, or a stream of per-address protocol lists
+    each protocol list is released once it's categorized
+    """
+    if isinstance(positions, dict):
+        positions = [positions["data"]["result"]["data"]]
+    for protocol_list in positions:
+        _categorize_protocol_list(protocol_list, result)
+    return result
+
+
+def _categorize_protocol_list(protocol_list: list[dict], result: dict) -> dict:
+    for pool in protocol_list:
         for portfolio in pool["portfolio_item_list"]:
             net_usd_valud = portfolio["stats"]["net_usd_value"]
             if net_usd_valud < MIN_REBALANCE_POSITION_THRESHOLD:
@@ -42,6 +66,160 @@ def debank_handler(positions, result):
     return result
 
 
+def debank_delta_handler(
+    protocol_lists: Iterable[list[dict]],
+    result: CategorizedPositions,
+    state: dict | None,
+) -> dict:
+    """
+    categorizes the same way debank_handler does, against the `state` returned by the last call for the same addresses
+    only the portfolio items added or changed since then are categorized, the removed ones are taken out, and the sums are adjusted by the delta
+    `result` is filled in, and the new state is returned for the next call
+    """
+    version = _get_categorization_version()
+    if state is None or state["version"] != version:
+        state = {"version": version, "items": [], "sums": {}, "worths": {}}
+    sums = defaultdict(float, state["sums"])
+    worths = defaultdict(lambda: defaultdict(float))
+    for category, worth_of_project_symbols in state["worths"].items():
+        worths[category].update(worth_of_project_symbols)
+    items = []
+    for i, protocol_list in enumerate(protocol_lists):
+        previous_items = state["items"][i] if i < len(state["items"]) else []
+        items.append(
+            _apply_protocol_list_delta(protocol_list, previous_items, sums, worths)
+        )
+    n_addresses = len(items)
+    for previous_items in state["items"][n_addresses:]:
+        for _, contribution in previous_items:
+            _add_contribution(contribution, -1, sums, worths)
+
+    # the rest of the fields come from the last position of each project:symbol, same as debank_handler
+    last_contributions = {}
+    for address_items in items:
+        for _, contribution in address_items:
+            for category in contribution["worth"]:
+                last_contributions[
+                    (category, contribution["project_symbol"])
+                ] = contribution
+    live_worths = defaultdict(dict)
+    sources = {}
+    for (category, project_symbol), contribution in last_contributions.items():
+        live_worths[category][project_symbol] = worths[category][project_symbol]
+        source = sources.get(id(contribution))
+        if source is None:
+            # APRs move on their own, so they're looked up once per position instead of being stored
+            source = sources[id(contribution)] = PositionSource(
+                contribution["unique_id"],
+                get_lowest_or_default_apr(project_symbol, contribution["unique_id"]),
+                contribution["tokens_metadata"],
+            )
+        result.add_position(
+            project_symbol,
+            {category: live_worths[category][project_symbol]},
+            source,
+            get_metadata_by_project_symbol(project_symbol),
+        )
+    for category in live_worths:
+        result[category]["sum"] = sums[category]
+    return {
+        "version": version,
+        "items": items,
+        "sums": {category: sums[category] for category in live_worths},
+        "worths": live_worths,
+    }
+
+
+def _apply_protocol_list_delta(
+    protocol_list: list[dict],
+    previous_items: list[list],
+    sums: dict,
+    worths: dict,
+) -> list[list]:
+    unchanged_contributions = defaultdict(list)
+    for fingerprint, contribution in previous_items:
+        unchanged_contributions[fingerprint].append(contribution)
+    items = []
+    for pool in protocol_list:
+        for portfolio in pool["portfolio_item_list"]:
+            net_usd_valud = portfolio["stats"]["net_usd_value"]
+            if net_usd_valud < MIN_REBALANCE_POSITION_THRESHOLD:
+                continue
+            tokens_metadata = _get_token_metadata(portfolio)
+            fingerprint = json.dumps(
+                [
+                    _get_correct_addr(portfolio),
+                    _get_project_id(portfolio),
+                    net_usd_valud,
+                    tokens_metadata,
+                ],
+                sort_keys=True,
+            )
+            if unchanged_contributions[fingerprint]:
+                contribution = unchanged_contributions[fingerprint].pop(0)
+            else:
+                contribution = _get_contribution(
+                    portfolio, net_usd_valud, tokens_metadata
+                )
+                _add_contribution(contribution, 1, sums, worths)
+            items.append([fingerprint, contribution])
+    for contributions in unchanged_contributions.values():
+        for contribution in contributions:
+            _add_contribution(contribution, -1, sums, worths)
+    return items
+
+
+def _get_contribution(
+    portfolio: dict, net_usd_valud: float, tokens_metadata: list
+) -> dict:
+    addr = _get_correct_addr(portfolio)
+    project_id = _get_project_id(portfolio)
+    unique_id = f"{addr}:{project_id}"
+    categories = ADDRESS_2_CATEGORY.get(unique_id, {}).get("categories", [])
+    symbol = ADDRESS_2_CATEGORY.get(unique_id, {}).get("symbol", "")
+    project_symbol = f"{project_id}:{symbol}"
+    if not symbol:
+        raise Exception(
+            f"Address {unique_id} no category, need to update your ADDRESS_2_CATEGORY, or update its APR"
+        )
+    metadata = get_metadata_by_project_symbol(project_symbol)
+    return {
+        "project_symbol": project_symbol,
+        "unique_id": unique_id,
+        "worth": {
+            category: get_weighted_balanceUSD(
+                net_usd_valud, category, metadata, len(categories)
+            )
+            for category in categories
+        },
+        "tokens_metadata": tokens_metadata,
+    }
+
+
+def _add_contribution(contribution: dict, sign: int, sums: dict, worths: dict):
+    for category, worth in contribution["worth"].items():
+        worths[category][contribution["project_symbol"]] += sign * worth
+        sums[category] += sign * worth
+
+
+def _get_categorization_version() -> str:
+    # stored contributions are only valid for the mapping table and threshold they were categorized with
+    mapping_table = [
+        [
+            unique_id,
+            metadata.get("categories"),
+            metadata.get("symbol"),
+            metadata.get("composition"),
+        ]
+        for unique_id, metadata in ADDRESS_2_CATEGORY.items()
+    ]
+    return hashlib.sha1(
+        json.dumps(
+            [MIN_REBALANCE_POSITION_THRESHOLD, mapping_table], sort_keys=True
+        ).encode()
+    ).hexdigest()
+
+
 def _get_correct_addr(portfolio):
     return portfolio["pool"]["id"]
 
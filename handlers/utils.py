@@ -1,3 +1,9 @@
+from rebalance_server.utils.categorized_positions import (
+    CategorizedPositions,
+    PositionSource,
+)
+
+
 def place_value_into_categorized_portfolio_dict(
     categories: list,
     net_usd_valud: float,
@@ -8,22 +14,19 @@ def place_value_into_categorized_portfolio_dict(
     apr: float,
     metadata: dict,
     tokens_metadata: list,
-    result: dict,
+    result: CategorizedPositions,
 ):
-    for category in categories:
-        weighted_balanceUSD = get_weighted_balanceUSD(
-            net_usd_valud, category, metadata, length_of_categories
-        )
-        result[category]["portfolio"][f"{project}:{symbol}"][
-            "worth"
-        ] += weighted_balanceUSD
-        result[category]["portfolio"][f"{project}:{symbol}"]["address"] = unique_id
-        result[category]["portfolio"][f"{project}:{symbol}"]["APR"] = apr
-        result[category]["portfolio"][f"{project}:{symbol}"]["metadata"] = metadata
-        result[category]["portfolio"][f"{project}:{symbol}"][
-            "tokens_metadata"
-        ] = tokens_metadata
-        result[category]["sum"] += weighted_balanceUSD
+    result.add_position(
+        f"{project}:{symbol}",
+        {
+            category: get_weighted_balanceUSD(
+                net_usd_valud, category, metadata, length_of_categories
+            )
+            for category in categories
+        },
+        PositionSource(unique_id, apr, tokens_metadata),
+        metadata,
+    )
     return result
 
 
@@ -0,0 +1,65 @@
+from rebalance_server.apr_utils.apr_calculator import get_lowest_or_default_apr
+from rebalance_server.handlers.utils import place_value_into_categorized_portfolio_dict
+from rebalance_server.portfolio_config import (
+    ADDRESS_2_CATEGORY,
+    MIN_REBALANCE_POSITION_THRESHOLD,
+    get_metadata_by_project_symbol,
+    get_unique_ids_by_address,
+)
+
+
+def zapper_handler(positions, result):
+    """
+    `positions` are the app balances from Zapper's balances/apps endpoint
+    """
+    for app_balance in positions:
+        for product in app_balance["products"]:
+            for asset in product["assets"]:
+                net_usd_value = asset["balanceUSD"]
+                if net_usd_value < MIN_REBALANCE_POSITION_THRESHOLD:
+                    continue
+                unique_id = _get_unique_id(asset, app_balance["appId"])
+                categories = ADDRESS_2_CATEGORY[unique_id]["categories"]
+                symbol = ADDRESS_2_CATEGORY[unique_id]["symbol"]
+                # named after the mapping table's project, so the position matches the one DeBank would report
+                project = unique_id.split(":")[-1]
+                project_symbol = f"{project}:{symbol}"
+
+                length_of_categories = len(categories)
+                apr = get_lowest_or_default_apr(project_symbol, unique_id)
+                metadata = get_metadata_by_project_symbol(project_symbol)
+                # underlying tokens stay nested, the networth_to_balance_adapter flattens them
+                tokens_metadata = asset.get("tokens", [])
+                result = place_value_into_categorized_portfolio_dict(
+                    categories,
+                    net_usd_value,
+                    length_of_categories,
+                    project,
+                    symbol,
+                    unique_id,
+                    apr,
+                    metadata,
+                    tokens_metadata,
+                    result,
+                )
+    return result
+
+
+def _get_unique_id(asset: dict, app_id: str) -> str:
+    """
+    an `address:app_id` key in ADDRESS_2_CATEGORY wins, otherwise the contract address has to map to exactly one key
+    """
+    address = asset["address"].lower()
+    unique_id = f"{address}:{app_id}"
+    if unique_id in ADDRESS_2_CATEGORY:
+        return unique_id
+    unique_ids = get_unique_ids_by_address(address)
+    if len(unique_ids) == 1:
+        return unique_ids[0]
+    if unique_ids:
+        raise Exception(
+            f"Address {unique_id} matches {unique_ids}, add {unique_id} to your ADDRESS_2_CATEGORY to pick one"
+        )
+    raise Exception(
+        f"Address {unique_id} no category, need to update your ADDRESS_2_CATEGORY, or update its APR"
+    )
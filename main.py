@@ -1,19 +1,25 @@
-import json
 import os
 from collections import defaultdict
 from pathlib import Path
+from typing import Iterator
 
-import requests
 from dotenv import load_dotenv
 
 from rebalance_server.apr_utils.apr_calculator import get_lowest_or_default_apr
 from rebalance_server.apr_utils.apr_pool_optimizer import (
+    print_out_new_combination,
     print_out_topn_candidate_pool,
     search_better_stable_coin_pools,
+    search_new_combination,
     search_top_n_pool_consist_of_same_lp_token,
     show_topn_stable_coins,
 )
 from rebalance_server.handlers import get_data_source_handler
+from rebalance_server.handlers.debank_handler import debank_delta_handler
+from rebalance_server.portfolio_config import (
+    NON_EVM_CATEGORIZED_POSITIONS_TTL_SECONDS,
+    warm_up_apr_sources,
+)
 
 # TODO(david): uncomment sharpe ratio and max drawdown once we've migrated to standalone server not lambda or cloud run
 # from rebalance_server.adapters.networth_to_balance_adapter import (
@@ -25,7 +31,12 @@ from rebalance_server.rebalance_strategies import (
     get_rebalancing_suggestions,
     print_rebalancing_suggestions,
 )
+from rebalance_server.utils.categorized_positions import CategorizedPositions
+from rebalance_server.utils.debank_cache import DebankCache
+from rebalance_server.utils.debank_client import get_debank_client
 from rebalance_server.utils.exchange_rate import get_exrate
+from rebalance_server.utils.file_cache import get_cached_by_file, load_json_file
+from rebalance_server.utils.zapper_client import get_zapper_client
 
 dotenv_path = Path("./rebalance_server/.env")
 load_dotenv(dotenv_path=dotenv_path)
@@ -37,20 +48,25 @@ def main(
     strategy_name: str,
     addresses: list[str],
 ):
-    evm_positions = load_evm_raw_positions(defi_portfolio_service_name, addresses)
-    evm_categorized_positions = categorize_positions(
-        defi_portfolio_service_name, evm_positions
-    )
+    warm_up_apr_sources()
+    if defi_portfolio_service_name == "debank" and not _is_loaded_from_disk(addresses):
+        evm_categorized_positions = categorize_debank_positions_incrementally(addresses)
+    else:
+        evm_positions = load_evm_raw_positions(defi_portfolio_service_name, addresses)
+        evm_categorized_positions = categorize_positions(
+            defi_portfolio_service_name, evm_positions
+        )
     # CEX & cosmos posistions
     # 1. Binance
     # 2. Nansen
     # because some of my sizes are located in Binance, and Nansen(cosmos ecosystem), which is not included in either debank or zapper
     # therefore, these 2 data sources need to be loaded everytime (ps. they're all manually updated in debank data format)
-    non_evm_posistions = _load_non_evm_posistions(data_sources={"binance": "debank"})
     if os.getenv("DEBUG", "").lower() == "true":
         # this block is for David's portfolio
         non_evm_categorized_positions_array = (
-            _categorize_non_evm_categorized_positions_array(non_evm_posistions)
+            _categorize_non_evm_categorized_positions_array(
+                data_sources={"binance": "debank"}
+            )
         )
     else:
         non_evm_categorized_positions_array = []
@@ -91,15 +107,23 @@ def main(
     # print(
     #     f"Portfolio's Max Drawdown: {calculate_max_drawdown(categorized_positions_with_token_balance):.2f}"
     # )
-    if optimize_apr_mode:
+    new_combination = None
+    if optimize_apr_mode == "new_combination":
+        top_n_with_metadata = []
+        new_combination = search_new_combination(
+            categorized_positions, strategy_name, net_worth
+        )
+        print_out_new_combination(new_combination)
+    elif optimize_apr_mode:
         top_n_with_metadata = search_top_n_pool_consist_of_same_lp_token(
             categorized_positions, optimize_apr_mode
         )
         for project_symbol, top_n, apr in top_n_with_metadata:
             print_out_topn_candidate_pool(project_symbol, top_n, apr)
+    if optimize_apr_mode:
         topn_stable_coins = search_better_stable_coin_pools(categorized_positions)
         show_topn_stable_coins(topn_stable_coins)
-    return {
+    result = {
         "net_worth": net_worth,
         "suggestions": suggestions,
         "total_interest": total_interest,
@@ -110,75 +134,81 @@ def main(
         "top_n_pool_consist_of_same_lp_token": top_n_with_metadata,
         "topn_stable_coins": topn_stable_coins,
     }
+    if new_combination is not None:
+        result["new_combination"] = new_combination
+    return result
 
 
 def load_raw_positions(data_format: str) -> dict:
-    return json.load(open(f"./rebalance_server/dashboard/{data_format}.json"))
+    # these files are edited by hand, so they're only parsed again once they change
+    return load_json_file(_get_raw_positions_path(data_format))
+
+
+def _get_raw_positions_path(data_format: str) -> str:
+    return f"./rebalance_server/dashboard/{data_format}.json"
 
 
 def load_evm_raw_positions(
     data_format: str, addresses: list[str], useCache: bool = False
-) -> dict:
-    if os.getenv("DEBUG", "").lower() == "true" or addresses == ["demo"]:
-        return json.load(open(f"./rebalance_server/dashboard/{data_format}.json"))
-    file_name_for_production = "production-cache.json"
-    if (
-        useCache
-        and Path(f"./rebalance_server/dashboard/{file_name_for_production}").exists()
-    ):
-        return json.load(
-            open(f"./rebalance_server/dashboard/{file_name_for_production}")
-        )
+) -> dict | list[dict]:
+    if data_format == "zapper":
+        return load_zapper_raw_positions(addresses)
     merged_data = []
-    for address in addresses:
-        data = requests.get(
-            f"https://pro-openapi.debank.com/v1/user/all_complex_protocol_list?id={address}",
-            headers={"AccessKey": os.getenv("ACCESSKEY")},
-        ).json()
-        merged_data += data
-    merged_result = {"data": {"result": {"data": merged_data}}}
-    if merged_result:
-        json.dump(
-            merged_result,
-            open(f"./rebalance_server/dashboard/{file_name_for_production}", "w"),
-        )
-    return merged_result
+    for protocol_list in iter_evm_raw_positions(data_format, addresses, useCache):
+        merged_data += protocol_list
+    return {"data": {"result": {"data": merged_data}}}
+
+
+def iter_evm_raw_positions(
+    data_format: str, addresses: list[str], useCache: bool = False
+) -> Iterator[list[dict]]:
+    """
+    DeBank's protocol list of each address, in the order of the addresses, each one as soon as it's fetched
+    `useCache` serves the addresses cached within DEBANK_CACHE_TTL_SECONDS and only fetches the others
+    either way, the fetched addresses are cached
+    """
+    if _is_loaded_from_disk(addresses):
+        yield load_raw_positions(data_format)["data"]["result"]["data"]
+        return
+    # fetched concurrently
+    yield from DebankCache().iter_or_fetch_protocol_lists(
+        addresses, get_debank_client(), use_cache=useCache
+    )
+
+
+def load_zapper_raw_positions(addresses: list[str]) -> list[dict]:
+    if _is_loaded_from_disk(addresses):
+        return load_raw_positions("zapper")
+    # every address and network in one round trip
+    return get_zapper_client().get_app_balances(addresses)
+
+
+def _is_loaded_from_disk(addresses: list[str]) -> bool:
+    return os.getenv("DEBUG", "").lower() == "true" or addresses == ["demo"]
+
+
+def categorize_debank_positions_incrementally(addresses: list[str]) -> dict:
+    """
+    same as categorize_positions on DeBank's positions, but only the portfolio items that changed since the last call for the same addresses are categorized again
+    """
+    debank_cache = DebankCache()
+    result = CategorizedPositions()
+    # categorized while the rest of the addresses are still being fetched
+    state = debank_delta_handler(
+        iter_evm_raw_positions("debank", addresses),
+        result,
+        debank_cache.get_categorized_state(addresses),
+    )
+    debank_cache.put_categorized_state(addresses, state)
+    return result
 
 
 def categorize_positions(defi_portfolio_service_name, positions) -> dict:
     """
     user need to label your positions with category type
     """
-    result = {
-        "long_term_bond": {
-            "sum": 0,
-            "portfolio": defaultdict(lambda: defaultdict(int)),
-        },
-        "intermediate_term_bond": {
-            "sum": 0,
-            "portfolio": defaultdict(lambda: defaultdict(int)),
-        },
-        "commodities": {"sum": 0, "portfolio": defaultdict(lambda: defaultdict(int))},
-        "gold": {"sum": 0, "portfolio": defaultdict(lambda: defaultdict(int))},
-        "large_cap_us_stocks": {
-            "sum": 0,
-            "portfolio": defaultdict(lambda: defaultdict(int)),
-        },
-        "small_cap_us_stocks": {
-            "sum": 0,
-            "portfolio": defaultdict(lambda: defaultdict(int)),
-        },
-        "non_us_developed_market_stocks": {
-            "sum": 0,
-            "portfolio": defaultdict(lambda: defaultdict(int)),
-        },
-        "non_us_emerging_market_stocks": {
-            "sum": 0,
-            "portfolio": defaultdict(lambda: defaultdict(int)),
-        },
-    }
     handler = get_data_source_handler(defi_portfolio_service_name)
-    return handler(positions, result)
+    return handler(positions, CategorizedPositions())
 
 
 def calculate_interest(categorized_positions):
@@ -199,23 +229,23 @@ def calculate_interest(categorized_positions):
     return total_interest
 
 
-def _load_non_evm_posistions(data_sources: dict) -> list[dict]:
-    result = []
-    for data_source, handler in data_sources.items():
-        result.append((load_raw_positions(data_source), handler))
-    return result
-
-
 def _categorize_non_evm_categorized_positions_array(
-    non_evm_posistions: list[dict],
+    data_sources: dict,
 ) -> list[dict]:
-    non_evm_categorized_positions_array = []
-    for non_evm_posistion, handler in non_evm_posistions:
-        non_evm_categorized_position = categorize_positions(
-            defi_portfolio_service_name=handler, positions=non_evm_posistion
+    """
+    categorized once per version of each file, and again once their APRs are NON_EVM_CATEGORIZED_POSITIONS_TTL_SECONDS old
+    """
+    return [
+        get_cached_by_file(
+            _get_raw_positions_path(data_source),
+            lambda path: categorize_positions(
+                defi_portfolio_service_name=handler, positions=load_json_file(path)
+            ),
+            name=f"categorized:{handler}",
+            ttl=NON_EVM_CATEGORIZED_POSITIONS_TTL_SECONDS,
         )
-        non_evm_categorized_positions_array.append(non_evm_categorized_position)
-    return non_evm_categorized_positions_array
+        for data_source, handler in data_sources.items()
+    ]
 
 
 def _get_networth(categorized_positions: dict):
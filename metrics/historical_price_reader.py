@@ -1,19 +1,16 @@
-import json
-import pathlib
-import random
-
 import numpy as np
 import pandas as pd
 import requests
 
-from rebalance_server.metrics.utils import (
-    FOUR_YEARS_AGO_UNIX_TIMESTAMP,
-    TODAY_UNIX_TIMESTAMP,
-)
+from rebalance_server.metrics.utils import get_required_unix_timestamp
 from rebalance_server.portfolio_config import (
-    DEFILLAMA_API_REQUEST_FREQUENCY_RECIPROCAL,
+    COINGECKO_SNAPSHOT_TTL_SECONDS,
     ZAPPER_SYMBOL_2_COINGECKO_MAPPING,
 )
+from rebalance_server.utils.snapshot_refresher import (
+    SnapshotRefresher,
+    register_snapshot_refresher,
+)
 
 
 def get_historical_price_reader(source: str):
@@ -28,28 +25,8 @@ class CoinGeckoHistoricalPriceReader:
     def get_token_historical_price(
         symbol: str,
     ) -> pd.Series:
-        if (
-            random.randint(0, DEFILLAMA_API_REQUEST_FREQUENCY_RECIPROCAL) == 0
-            or not pathlib.Path(f"./rebalance_server/coingecko/{symbol}.json").exists()
-        ):
-            print(f"Update historical price data from CoinGecko: {symbol}...")
-            res = requests.get(
-                f"https://api.coingecko.com/api/v3/coins/{symbol}/market_chart/range?vs_currency=usd&from={FOUR_YEARS_AGO_UNIX_TIMESTAMP}&to={TODAY_UNIX_TIMESTAMP})"
-            )
-            if res.status_code == 200:
-                json.dump(
-                    res.json(), open(f"./rebalance_server/coingecko/{symbol}.json", "w")
-                )
-                res_json = res.json()
-            else:
-                print(res.json())
-                res_json = json.load(
-                    open(f"./rebalance_server/coingecko/{symbol}.json", "r")
-                )
-        else:
-            res_json = json.load(
-                open(f"./rebalance_server/coingecko/{symbol}.json", "r")
-            )
+        # serve the last good snapshot, the refresher updates it in the background once it's stale
+        res_json = _get_coingecko_snapshot_refresher(symbol).load()
         # use reverse to make the array' date in descending order
         # then trimming with different kind of tokens would be fine
         price = np.array(list(reversed(res_json["prices"])))[:, 1]
@@ -62,3 +39,26 @@ class CoinGeckoHistoricalPriceReader:
         if dashboard == "zapper":
             return ZAPPER_SYMBOL_2_COINGECKO_MAPPING[symbol]
         raise NotImplementedError(f"Dashboard {dashboard} is not supported yet.")
+
+
+def _get_coingecko_snapshot_refresher(symbol: str) -> SnapshotRefresher:
+    return register_snapshot_refresher(
+        SnapshotRefresher(
+            name=f"coingecko:{symbol}",
+            snapshot_path=f"./rebalance_server/coingecko/{symbol}.json",
+            ttl=COINGECKO_SNAPSHOT_TTL_SECONDS,
+            fetch=lambda: _fetch_coingecko_market_chart(symbol),
+        )
+    )
+
+
+def _fetch_coingecko_market_chart(symbol: str) -> dict:
+    print(f"Update historical price data from CoinGecko: {symbol}...")
+    # compute the range on every fetch, the refresher outlives the day the module got imported
+    from_unix_timestamp, to_unix_timestamp = get_required_unix_timestamp()
+    res = requests.get(
+        f"https://api.coingecko.com/api/v3/coins/{symbol}/market_chart/range?vs_currency=usd&from={from_unix_timestamp}&to={to_unix_timestamp})"
+    )
+    if res.status_code != 200:
+        raise Exception(f"Failed to fetch {symbol} from CoinGecko: {res.text}")
+    return res.json()
@@ -1,15 +1,69 @@
+import json
 import os
+import time
+from collections import defaultdict
 
 import requests
 
 from rebalance_server.apr_utils import convert_apy_to_apr
+from rebalance_server.apr_utils.deferred_apr import (
+    DeferredAPR,
+    resolve_apr,
+    warm_up_deferred_aprs,
+)
+from rebalance_server.utils.single_flight import single_flight
+from rebalance_server.utils.snapshot_refresher import write_json_atomically
 
+EQUILIBRIA_CHAIN_INFO_MAP_API = "https://equilibria.fi/api/chain-info-map"
+# shared by the workers, so the ones resolving their equilibria APRs right after another reuse its map
+EQUILIBRIA_CHAIN_INFO_MAP_CACHE_PATH = (
+    "./rebalance_server/dashboard/equilibria-chain-info-map.json"
+)
+EQUILIBRIA_CHAIN_INFO_MAP_TTL_SECONDS = 60 * 5
 
-def fetch_equilibria_APR(chain_id: str, category: str, pool_token: str = "") -> float:
-    equilibria_chain_info_map = requests.get("https://equilibria.fi/api/chain-info-map")
+
+def get_equilibria_chain_info_map(
+    cache_path: str = EQUILIBRIA_CHAIN_INFO_MAP_CACHE_PATH,
+) -> dict:
+    # every equilibria APR reads the same map, concurrent callers of any worker share one request
+    requested_at = time.time()
+    return single_flight(
+        f"GET {EQUILIBRIA_CHAIN_INFO_MAP_API}",
+        lambda: _fetch_equilibria_chain_info_map(cache_path),
+        load_cached=lambda: _load_equilibria_chain_info_map(cache_path, requested_at),
+        lock_path=f"{cache_path}.lock",
+    )
+
+
+def _fetch_equilibria_chain_info_map(cache_path: str) -> dict:
+    equilibria_chain_info_map = requests.get(EQUILIBRIA_CHAIN_INFO_MAP_API)
     if equilibria_chain_info_map.status_code != 200:
         raise Exception("Failed to fetch equilibria chain info map")
     equilibria_chain_info_map = equilibria_chain_info_map.json()
+    write_json_atomically(cache_path, equilibria_chain_info_map)
+    return equilibria_chain_info_map
+
+
+def _load_equilibria_chain_info_map(
+    cache_path: str, requested_at: float
+) -> dict | None:
+    """
+    the map another worker cached within the ttl, None if there's none
+    """
+    try:
+        if (
+            os.path.getmtime(cache_path)
+            < requested_at - EQUILIBRIA_CHAIN_INFO_MAP_TTL_SECONDS
+        ):
+            return None
+        with open(cache_path, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def fetch_equilibria_APR(chain_id: str, category: str, pool_token: str = "") -> float:
+    equilibria_chain_info_map = get_equilibria_chain_info_map()
     if category == "poolInfos":
         for pool in equilibria_chain_info_map[chain_id]["poolInfos"]:
             if pool["token"] == pool_token:
@@ -126,15 +180,86 @@ def fetch_equilibre_APR(symbol: str) -> float:
 
 
 def get_metadata_by_project_symbol(project_symbol: str) -> dict:
+    metadata = _get_address_2_category_indexes()["project_symbol"].get(
+        project_symbol.lower()
+    )
+    if metadata is None:
+        raise Exception(f"Cannot find {project_symbol} in your address mapping table")
+    return _resolve_deferred_apr_of_metadata(metadata)
+
+
+def get_metadata_by_address(address: str) -> list[dict]:
+    """
+    reverse lookup, one contract address might be used by several positions (e.g. different pool ids of the same masterchef)
+    """
+    return [
+        _resolve_deferred_apr_of_metadata(ADDRESS_2_CATEGORY[unique_id])
+        for unique_id in get_unique_ids_by_address(address)
+    ]
+
+
+def get_unique_ids_by_address(address: str) -> list[str]:
+    """
+    the ADDRESS_2_CATEGORY keys of a contract address, for data sources that don't name projects the way DeBank does
+    """
+    return _get_address_2_category_indexes()["address"].get(address.lower(), [])
+
+
+def rebuild_address_2_category_indexes() -> None:
+    """
+    call this after editing an entry of ADDRESS_2_CATEGORY in place, adding, removing or replacing entries is detected automatically
+    """
+    project_symbol_index = {}
+    address_index = defaultdict(list)
     for address_and_project, metadata in ADDRESS_2_CATEGORY.items():
         project = address_and_project.split(":")[-1]
-        if f'{project}:{metadata["symbol"]}'.lower() == project_symbol.lower():
-            return metadata
-    raise Exception(f"Cannot find {project_symbol} in your address mapping table")
+        # keep the first match, same as the linear scan used to do
+        project_symbol_index.setdefault(
+            f'{project}:{metadata["symbol"]}'.lower(), metadata
+        )
+        address_index[address_and_project.split(":")[0].lower()].append(
+            address_and_project
+        )
+    _ADDRESS_2_CATEGORY_INDEXES["project_symbol"] = project_symbol_index
+    _ADDRESS_2_CATEGORY_INDEXES["address"] = dict(address_index)
+    _ADDRESS_2_CATEGORY_INDEXES["version"] = ADDRESS_2_CATEGORY.version
+
+
+def _get_address_2_category_indexes() -> dict:
+    if _ADDRESS_2_CATEGORY_INDEXES["version"] != ADDRESS_2_CATEGORY.version:
+        rebuild_address_2_category_indexes()
+    return _ADDRESS_2_CATEGORY_INDEXES
+
+
+def _resolve_deferred_apr_of_metadata(metadata: dict) -> dict:
+    # metadata ends up in the API response, so it can't carry a DeferredAPR object
+    if isinstance(metadata.get("APR"), DeferredAPR):
+        return {**metadata, "APR": resolve_apr(metadata["APR"])}
+    return metadata
+
+
+def warm_up_apr_sources() -> None:
+    """
+    APRs in ADDRESS_2_CATEGORY are fetched lazily, call this before serving a request
+    so that all of the stale ones get fetched concurrently instead of one after another
+    """
+    warm_up_deferred_aprs(
+        metadata["APR"]
+        for metadata in ADDRESS_2_CATEGORY.values()
+        if isinstance(metadata.get("APR"), DeferredAPR)
+    )
 
 
 MIN_REBALANCE_POSITION_THRESHOLD = 2 if os.getenv("DEBUG") == "false" else 50
-DEFILLAMA_API_REQUEST_FREQUENCY_RECIPROCAL = 50
+DEFILLAMA_SNAPSHOT_TTL_SECONDS = 60 * 60
+COINGECKO_SNAPSHOT_TTL_SECONDS = 60 * 60 * 24
+DEBANK_CACHE_TTL_SECONDS = 60 * 10
+# the categorized Binance/Nansen positions are re-categorized at least this often, for their APRs
+NON_EVM_CATEGORIZED_POSITIONS_TTL_SECONDS = 60 * 30
+# worker processes of the optimizer's candidate search, 0 or 1 runs it in the request's own process
+# they're forked, so they share the pool snapshot copy-on-write, which is only safe with no other thread alive but the snapshot refresher, like the CLI,
+# in a threaded server worker (gunicorn's gthread) the search stays in-process with the candidate cache whatever this is set to
+OPTIMIZER_MAX_WORKERS = int(os.getenv("OPTIMIZER_MAX_WORKERS", "0"))
 BLACKLIST_CHAINS = {"Avalanche", "BSC", "Solana"}
 BLACKLIST_CHAINS_FOR_STABLE_COIN = {"Ethereum"}
 BLACKLIST_PROTOCOL = {
@@ -281,7 +406,7 @@ DEBANK_ADDRESS = {
     "0x72a19342e8f1838460ebfccef09f6585e32db86e:convex": {
         "categories": ["small_cap_us_stocks", "commodities"],
         "symbol": "CVX",
-        "APR": fetch_convex_locked_CVX_APR(),
+        "APR": DeferredAPR(fetch_convex_locked_CVX_APR),
         "tags": ["cvx"],
         "composition": {"cvx": 1},
         "project": "convex-finance",
@@ -318,7 +443,8 @@ DEBANK_ADDRESS = {
             "gold",
         ],
         "symbol": "GLP",
-        "APR": fetch_equilibria_APR(
+        "APR": DeferredAPR(
+            fetch_equilibria_APR,
             chain_id="42161",
             category="poolInfos",
             pool_token="0xb0D7182Ba15eD02326590f033F72c393C978EB7a",
@@ -340,7 +466,8 @@ DEBANK_ADDRESS = {
     "0x4d32c8ff2facc771ec7efc70d6a8468bc30c26bf:1:bsc_equilibria": {
         "categories": ["long_term_bond"],
         "symbol": "frxETH",
-        "APR": fetch_equilibria_APR(
+        "APR": DeferredAPR(
+            fetch_equilibria_APR,
             chain_id="56",
             category="poolInfos",
             pool_token="0x55F140ABbf87EF957263F04Ed75d1691980433A8",
@@ -352,7 +479,8 @@ DEBANK_ADDRESS = {
     "0x4d32c8ff2facc771ec7efc70d6a8468bc30c26bf:4:arb_equilibria": {
         "categories": ["long_term_bond", "large_cap_us_stocks"],
         "symbol": "PENDLE-WETH",
-        "APR": fetch_equilibria_APR(
+        "APR": DeferredAPR(
+            fetch_equilibria_APR,
             chain_id="42161",
             category="poolInfos",
             pool_token="0x7a2d44931fA2953f812676e05039F488144763F4",
@@ -364,7 +492,7 @@ DEBANK_ADDRESS = {
     "0x71e0ce200a10f0bbfb9f924fe466acf0b7401ebf:arb_equilibria": {
         "categories": ["large_cap_us_stocks"],
         "symbol": "PENDLE-stake2",
-        "APR": fetch_equilibria_APR(chain_id="42161", category="ePendle"),
+        "APR": DeferredAPR(fetch_equilibria_APR, chain_id="42161", category="ePendle"),
         "tags": ["pendle"],
         "composition": {"pendle": 1},
     },
@@ -372,7 +500,7 @@ DEBANK_ADDRESS = {
         "categories": ["long_term_bond"],
         "symbol": "rETH",
         "defillama-APY-pool-id": "35fe5f76-3b7d-42c8-9e54-3da70fbcb3a9",
-        "APR": fetch_equilibria_APR(chain_id="42161", category="ePendle"),
+        "APR": DeferredAPR(fetch_equilibria_APR, chain_id="42161", category="ePendle"),
         "tags": ["eth"],
         "composition": {"eth": 1},
     },
@@ -396,8 +524,9 @@ DEBANK_ADDRESS = {
         "categories": ["non_us_developed_market_stocks", "intermediate_term_bond"],
         "project": "sushiswap",
         "symbol": "USDC-WKAVA",
-        "APR": fetch_kava_sushiswap_APR(
-            pool_addr="0xb379eb428a28a927a16ee7f95100ac6a5117aaa1"
+        "APR": DeferredAPR(
+            fetch_kava_sushiswap_APR,
+            pool_addr="0xb379eb428a28a927a16ee7f95100ac6a5117aaa1",
         ),
         "tags": ["kava", "usdc"],
         "composition": {"kava": 0.5, "usdc": 0.5},
@@ -462,7 +591,8 @@ DEBANK_ADDRESS = {
         "categories": ["intermediate_term_bond"],
         "project": "arb_equilibria",
         "symbol": "gDAI",
-        "APR": fetch_equilibria_APR(
+        "APR": DeferredAPR(
+            fetch_equilibria_APR,
             chain_id="42161",
             category="poolInfos",
             pool_token="0x183b30706ff2655e7aB0aB37867DD7AF8Cb75e78",
@@ -474,7 +604,8 @@ DEBANK_ADDRESS = {
         "categories": ["long_term_bond"],
         "project": "equilibria",
         "symbol": "oETH",
-        "APR": fetch_equilibria_APR(
+        "APR": DeferredAPR(
+            fetch_equilibria_APR,
             chain_id="1",
             category="poolInfos",
             pool_token="0x3Dbd7e5018e720507a16f2Ad87731995C71B0707",
@@ -502,7 +633,8 @@ DEBANK_ADDRESS = {
         "categories": ["long_term_bond"],
         "project": "arb_equilibria",
         "symbol": "rETH",
-        "APR": fetch_equilibria_APR(
+        "APR": DeferredAPR(
+            fetch_equilibria_APR,
             chain_id="42161",
             category="poolInfos",
             pool_token="0xD5d1276B85A51F6D2B5eE26b9D7317bEa022ecbf",
@@ -522,7 +654,8 @@ DEBANK_ADDRESS = {
         "categories": ["intermediate_term_bond"],
         "project": "arb_equilibria",
         "symbol": "USDT",
-        "APR": fetch_equilibria_APR(
+        "APR": DeferredAPR(
+            fetch_equilibria_APR,
             chain_id="42161",
             category="poolInfos",
             pool_token="0x3672abD8b9c70e0F2ED8210cE8663d3dbC5E491a",
@@ -574,7 +707,8 @@ DEBANK_ADDRESS = {
         "categories": ["small_cap_us_stocks"],
         "project": "arb_equilibria",
         "symbol": "EQB",
-        "APR": fetch_equilibria_APR(
+        "APR": DeferredAPR(
+            fetch_equilibria_APR,
             chain_id="42161",
             category="vlEqb",
         ),
@@ -629,7 +763,8 @@ DEBANK_ADDRESS = {
             "gold",
         ],
         "symbol": "HLP",
-        "APR": fetch_equilibria_APR(
+        "APR": DeferredAPR(
+            fetch_equilibria_APR,
             chain_id="42161",
             category="poolInfos",
             pool_token="0xbAa2B0aa1DEf4F278d7D6CD9f7C8483d6e256470",
@@ -651,7 +786,8 @@ DEBANK_ADDRESS = {
         "categories": ["small_cap_us_stocks"],
         "project": "arb_equilibria",
         "symbol": "EQB",
-        "APR": fetch_equilibria_APR(
+        "APR": DeferredAPR(
+            fetch_equilibria_APR,
             chain_id="42161",
             category="vlEqb",
         ),
@@ -661,11 +797,60 @@ DEBANK_ADDRESS = {
 }
 
 
-ADDRESS_2_CATEGORY = {
-    **DEBANK_ADDRESS,
-}
+class _VersionedDict(dict):
+    """
+    a dict whose `version` is bumped by every change to it, so the indexes built on it know when they're stale
+    """
+
+    __slots__ = ("version",)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.version = 0
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.version += 1
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self.version += 1
+
+    def __ior__(self, other):
+        super().__ior__(other)
+        self.version += 1
+        return self
+
+    def clear(self):
+        super().clear()
+        self.version += 1
+
+    def pop(self, *args):
+        self.version += 1
+        return super().pop(*args)
+
+    def popitem(self):
+        self.version += 1
+        return super().popitem()
+
+    def setdefault(self, key, default=None):
+        self.version += 1
+        return super().setdefault(key, default)
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self.version += 1
+
+
+ADDRESS_2_CATEGORY = _VersionedDict(
+    {
+        **DEBANK_ADDRESS,
+    }
+)
+_ADDRESS_2_CATEGORY_INDEXES = {"project_symbol": {}, "address": {}, "version": None}
+rebuild_address_2_category_indexes()
 
-# TODO(david): use this one to implement advanced search algorithm. Search for new compositions.
+# the new_combination optimizer maps the tokens of defillama's pools to categories with it
 TOKEN_2_CATEGORIES = {
     "long_term_bond": ["eth"],
     "intermediate_term_bond": ["ohm", "gohm", "usdc", "frax", "dai", "gdai"],
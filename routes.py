@@ -1,6 +1,5 @@
 import copy
 import os
-import random
 from collections import defaultdict
 
 import requests
@@ -9,6 +8,7 @@ from web3 import Web3
 
 from rebalance_server.apr_utils import convert_apy_to_apr
 from rebalance_server.main import load_evm_raw_positions
+from rebalance_server.portfolio_config import get_equilibria_chain_info_map
 
 RADIANT_USER_ADDRESS = "0x43cd745Bd5FbFc8CfD79ebC855f949abc79a1E0C"
 RADIANT_MULTI_FEE_DISTRIBUTION = "0x76ba3eC5f5adBf1C58c91e86502232317EeA72dE"
@@ -33,7 +33,7 @@ def get_debank_data():
             "0x4999AE9fDD361Ca6278B0295dd65776b4587E1aA",
             "0x99E9cE14C807e95329a2A35aDD52683528e53231",
         ],
-        useCache=True if random.random() > 0.2 else False,
+        useCache=True,
     )
     token_metadata_table: dict[str, dict] = {}
     for position in evm_positions["data"]["result"]["data"]:
@@ -121,10 +121,7 @@ def fetch_1inch_swap_data(
 
 def _fetch_equilibria_APR_composition(pool_addr: str, ratio: float) -> float:
     result = defaultdict(lambda: defaultdict(float))
-    equilibria_chain_info_map = requests.get("https://equilibria.fi/api/chain-info-map")
-    if equilibria_chain_info_map.status_code != 200:
-        raise Exception("Failed to fetch equilibria chain info map")
-    equilibria_chain_info_map = equilibria_chain_info_map.json()
+    equilibria_chain_info_map = get_equilibria_chain_info_map()
     result["Underlying APY"]["token"] = []
     pool_info = [
         pl
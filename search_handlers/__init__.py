@@ -1,4 +1,16 @@
 from abc import ABC
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from rebalance_server.search_handlers.suffix_trie import (
+    MIN_DENORMALIZED_TAG_LENGTH,
+    SuffixTrie,
+)
+from rebalance_server.search_handlers.tag_index import TagIndex
+
+if TYPE_CHECKING:
+    from rebalance_server.apr_utils.yields_store import YieldsStore
 
 
 class SearchBase(ABC):
@@ -6,38 +18,70 @@ class SearchBase(ABC):
     This is the base class for all search handlers
     """
 
+    # whether the similarity of two symbols might change with the yields snapshot, e.g. with the tokens it knows of
+    similarity_depends_on_snapshot = False
+
     def __init__(self, *args, **kwargs):
         pass
 
     def check_similarity(self, symbol: str):
         raise NotImplementedError
 
+    def get_candidate_pool_indexes(
+        self, metadata: dict, tag_index: TagIndex
+    ) -> set[int] | None:
+        """
+        indexes of the pools worth scoring for this position, None means every pool has to be scored
+        """
+        return None
+
+    def get_similarity_matrix(
+        self,
+        metadatas: list[dict],
+        yields_store: "YieldsStore",
+        candidate_pool_mask: np.ndarray,
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray] | None:
+        """
+        similarities of every position x candidate pool pair at once, as (position indexes, pool indexes, similarities) of the non-zero ones
+        None means this handler can only score one pair at a time with `get_similarity`
+        """
+        return None
+
     def unwrap_token(self, symbol: str) -> str:
         if symbol.startswith("w"):
             return symbol[1:]
         return symbol
 
     @staticmethod
-    def denormalize_tag(tags1: set[str], union_tags: set[str]) -> set[str]:
+    def denormalize_tag(
+        tags1: set[str], union_tags: set[str], suffix_trie: SuffixTrie | None = None
+    ) -> set[str]:
         """
         1. This function is used to denormalize the tags, for example, if we have a tag "sfrxeth", we want to denormalize it to "eth"
         2. Also, set a contraint for length of tag, if the length of tag is less than 3, we don't think it's a variation of another tag
+        3. If a tag ends with several tags of the union, the shortest one wins, e.g. "sfrxeth" -> "eth" rather than "frxeth"
+        4. `suffix_trie` is optional, it has to contain every tag of `union_tags`, and only narrows down which suffixes get looked up
         """
         result_tag_set = set()
         for tag_a in tags1:
-            added = False
-            for tag_b in union_tags:
-                if tag_a != tag_b and tag_a.endswith(tag_b) and len(tag_b) >= 3:
-                    result_tag_set.add(tag_b)
-                    added = True
-                    break
-            if added:
-                continue
-            result_tag_set.add(tag_a)
-
+            suffixes = (
+                suffix_trie.get_suffixes(tag_a)
+                if suffix_trie is not None
+                else _get_suffixes(tag_a)
+            )
+            result_tag_set.add(
+                next((tag_b for tag_b in suffixes if tag_b in union_tags), tag_a)
+            )
         return result_tag_set
 
 
+def _get_suffixes(tag: str) -> tuple[str, ...]:
+    # shortest first, same as SuffixTrie.get_suffixes
+    return tuple(
+        tag[start:] for start in range(len(tag) - MIN_DENORMALIZED_TAG_LENGTH, 0, -1)
+    )
+
+
 if __name__ == "__main__":
     print(
         SearchBase.denormalize_tag(
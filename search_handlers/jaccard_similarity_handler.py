@@ -1,29 +1,153 @@
+from typing import TYPE_CHECKING
+
+import numpy as np
+
 from rebalance_server.search_handlers import SearchBase
+from rebalance_server.search_handlers.suffix_trie import SuffixTrie
+from rebalance_server.search_handlers.tag_index import TagIndex, get_tag_index
+from rebalance_server.search_handlers.token_incidence import (
+    TokenIncidence,
+    get_jaccard_similarity_matrix,
+    get_token_incidence,
+)
+
+if TYPE_CHECKING:
+    from rebalance_server.apr_utils.yields_store import YieldsStore
+
+# positions multiplied with the pools at once, bounds the size of the joined entries
+SIMILARITY_MATRIX_BATCH_SIZE = 64
 
 
 class JaccardSimilarityHandler(SearchBase):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self._similarity_threshold = kwargs["similarity_threshold"]
+        # vocabulary of every known token, see tag_index.get_suffix_trie
+        self._suffix_trie = kwargs.get("suffix_trie")
+        self._my_pool_tags_cache = {}
+        self._candidate_pool_tags_cache = {}
 
     @property
     def similarity_threshold(self):
         return self._similarity_threshold
 
-    def get_similarity(self, metadata: dict, candidate_symbol: str) -> float:
-        """Jaccard similarity between two sets of tags"""
-        my_pool_tags = set(
-            self.unwrap_token(tag.lower()) for tag in metadata["metadata"]["tags"]
+    def get_candidate_pool_indexes(
+        self, metadata: dict, tag_index: TagIndex
+    ) -> set[int] | None:
+        # a pool sharing no tag with this position has a similarity of 0, it can never pass the threshold
+        if self.similarity_threshold < 0:
+            return None
+        return tag_index.get_pool_indexes_sharing_a_tag(
+            set(self.unwrap_token(tag.lower()) for tag in metadata["metadata"]["tags"])
         )
-        candidate_pool_tags = set(
-            self.unwrap_token(tag) for tag in candidate_symbol.split("-")
+
+    def get_similarity_matrix(
+        self,
+        metadatas: list[dict],
+        yields_store: "YieldsStore",
+        candidate_pool_mask: np.ndarray,
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        The same similarities as `get_similarity`, for every position x candidate pool pair sharing a tag, computed as a sparse product of their token incidence matrices
+        this handler has to use the suffix trie of `yields_store`
+        """
+        pools = yields_store.pools
+        pool_token_incidence = get_token_incidence(yields_store)
+        candidate_pool_incidence = pool_token_incidence.select_rows(candidate_pool_mask)
+        position_indexes, pool_indexes, similarities = [], [], []
+        # the incidence matrix can only encode the positions whose every tag is in the trie
+        encodable_position_indexes = []
+        for position_index, metadata in enumerate(metadatas):
+            if self._get_my_pool_tags(metadata)[1] is not None:
+                encodable_position_indexes.append(position_index)
+                continue
+            for pool_index in sorted(
+                self.get_candidate_pool_indexes(metadata, get_tag_index(yields_store))
+            ):
+                if not candidate_pool_mask[pool_index]:
+                    continue
+                position_indexes.append(np.array([position_index]))
+                pool_indexes.append(np.array([pool_index]))
+                similarities.append(
+                    np.array(
+                        [
+                            self.get_similarity(
+                                metadata, pools[pool_index]["symbol"].lower()
+                            )
+                        ]
+                    )
+                )
+        for start in range(
+            0, len(encodable_position_indexes), SIMILARITY_MATRIX_BATCH_SIZE
+        ):
+            end = start + SIMILARITY_MATRIX_BATCH_SIZE
+            batch = encodable_position_indexes[start:end]
+            position_incidence = TokenIncidence(
+                [self._get_my_pool_tags(metadatas[index])[0] for index in batch],
+                self._suffix_trie,
+                token_ids=pool_token_incidence.token_ids,
+            )
+            (
+                batch_rows,
+                batch_pool_indexes,
+                batch_similarities,
+                is_ambiguous,
+            ) = get_jaccard_similarity_matrix(
+                position_incidence, candidate_pool_incidence
+            )
+            batch_position_indexes = np.array(batch, dtype=np.int64)[batch_rows]
+            # the pairs the product can't tell are scored one by one
+            for pair in np.flatnonzero(is_ambiguous):
+                batch_similarities[pair] = self.get_similarity(
+                    metadatas[batch_position_indexes[pair]],
+                    pools[batch_pool_indexes[pair]]["symbol"].lower(),
+                )
+            position_indexes.append(batch_position_indexes)
+            pool_indexes.append(batch_pool_indexes)
+            similarities.append(batch_similarities)
+        if not position_indexes:
+            return (
+                np.array([], dtype=np.int64),
+                np.array([], dtype=np.int64),
+                np.array([], dtype=float),
+            )
+        return (
+            np.concatenate(position_indexes),
+            np.concatenate(pool_indexes),
+            np.concatenate(similarities),
         )
+
+    def get_similarity(self, metadata: dict, candidate_symbol: str) -> float:
+        """Jaccard similarity between two sets of tags"""
+        my_pool_tags, suffix_trie = self._get_my_pool_tags(metadata)
+        candidate_pool_tags = self._get_candidate_pool_tags(candidate_symbol)
+        union_tags = my_pool_tags | candidate_pool_tags
         normalized_my_pool_tags = self.denormalize_tag(
-            my_pool_tags, my_pool_tags.union(candidate_pool_tags)
+            my_pool_tags, union_tags, suffix_trie
         )
         normalized_candidate_pool_tags = self.denormalize_tag(
-            candidate_pool_tags, my_pool_tags.union(candidate_pool_tags)
+            candidate_pool_tags, union_tags, suffix_trie
         )
         return len(
             normalized_my_pool_tags.intersection(normalized_candidate_pool_tags)
         ) / len(normalized_my_pool_tags.union(normalized_candidate_pool_tags))
+
+    def _get_my_pool_tags(self, metadata: dict) -> tuple[frozenset, SuffixTrie | None]:
+        key = tuple(metadata["metadata"]["tags"])
+        if key not in self._my_pool_tags_cache:
+            my_pool_tags = frozenset(self.unwrap_token(tag.lower()) for tag in key)
+            # the trie can only be used if it knows every tag of the position, e.g. it might be older than portfolio_config
+            suffix_trie = self._suffix_trie
+            if suffix_trie is not None and not all(
+                tag in suffix_trie for tag in my_pool_tags
+            ):
+                suffix_trie = None
+            self._my_pool_tags_cache[key] = (my_pool_tags, suffix_trie)
+        return self._my_pool_tags_cache[key]
+
+    def _get_candidate_pool_tags(self, candidate_symbol: str) -> frozenset:
+        if candidate_symbol not in self._candidate_pool_tags_cache:
+            self._candidate_pool_tags_cache[candidate_symbol] = frozenset(
+                self.unwrap_token(tag) for tag in candidate_symbol.split("-")
+            )
+        return self._candidate_pool_tags_cache[candidate_symbol]
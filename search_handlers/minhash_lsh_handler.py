@@ -0,0 +1,179 @@
+import zlib
+from typing import TYPE_CHECKING, Iterable
+
+import numpy as np
+
+from rebalance_server.search_handlers import SearchBase
+from rebalance_server.search_handlers.jaccard_similarity_handler import (
+    JaccardSimilarityHandler,
+)
+from rebalance_server.search_handlers.suffix_trie import SuffixTrie
+from rebalance_server.search_handlers.tag_index import TagIndex, get_suffix_trie
+from rebalance_server.utils.store_indexes import get_store_index
+
+if TYPE_CHECKING:
+    from rebalance_server.apr_utils.yields_store import YieldsStore
+
+_MERSENNE_PRIME = np.uint64((1 << 31) - 1)
+DEFAULT_NUM_PERM = 128
+
+
+def get_minhash_tokens(tags: Iterable[str], suffix_trie: SuffixTrie) -> frozenset:
+    # fold every tag to its base token, so that "sfrxeth" and "eth" count as the same token, like the jaccard similarity would
+    # this only finds the candidates, which are then scored with the exact jaccard similarity
+    return frozenset(suffix_trie.get_canonical_base(tag) for tag in tags)
+
+
+class MinHashLSHIndex:
+    """
+    MinHash signatures of every pool's token set, bucketed by locality-sensitive hashing.
+    Pools whose jaccard similarity with a query is above `threshold` land in the same bucket as the query for at least one band with high probability,
+    so a query only looks at the pools in its buckets instead of the whole universe.
+    """
+
+    def __init__(
+        self,
+        token_sets: list[frozenset],
+        threshold: float = 0.5,
+        num_perm: int = DEFAULT_NUM_PERM,
+        seed: int = 1,
+    ):
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self._band_coefficients = rng.integers(
+            1, np.iinfo(np.uint64).max, size=num_perm, dtype=np.uint64
+        )
+        self.num_perm = num_perm
+        self.bands, self.rows = _get_bands_and_rows(num_perm, threshold)
+        self.signatures = self._get_signatures(token_sets)
+        # per band, the band keys of every pool sorted, so a query is a binary search per band
+        self._sorted_band_keys = []
+        self._sorted_pool_indexes = []
+        for band in range(self.bands):
+            band_keys = self._get_band_keys(self.signatures, band)
+            order = np.argsort(band_keys, kind="stable")
+            self._sorted_band_keys.append(band_keys[order])
+            self._sorted_pool_indexes.append(order)
+
+    def get_signature(self, tokens: frozenset) -> np.ndarray:
+        return self._get_signatures([tokens])[0]
+
+    def query(self, signature: np.ndarray) -> set[int]:
+        """
+        indexes of the pools sharing at least one band with the signature, i.e. the likely similar ones
+        """
+        pool_indexes = set()
+        for band in range(self.bands):
+            band_key = self._get_band_keys(signature[np.newaxis, :], band)[0]
+            sorted_band_keys = self._sorted_band_keys[band]
+            start = np.searchsorted(sorted_band_keys, band_key, side="left")
+            end = np.searchsorted(sorted_band_keys, band_key, side="right")
+            pool_indexes.update(self._sorted_pool_indexes[band][start:end].tolist())
+        return pool_indexes
+
+    def _get_signatures(self, token_sets: list[frozenset]) -> np.ndarray:
+        signatures = np.full(
+            (len(token_sets), self.num_perm), _MERSENNE_PRIME, dtype=np.uint64
+        )
+        token_hashes = []
+        owners = []
+        for index, tokens in enumerate(token_sets):
+            for token in tokens:
+                token_hashes.append(zlib.crc32(token.encode()))
+                owners.append(index)
+        if not token_hashes:
+            return signatures
+        token_hashes = np.array(token_hashes, dtype=np.uint64) % _MERSENNE_PRIME
+        # universal hashing, (a * x + b) mod p for each of the num_perm permutations
+        permuted = (
+            np.outer(token_hashes, self._a) + self._b[np.newaxis, :]
+        ) % _MERSENNE_PRIME
+        # tokens of the same token set are next to each other
+        owners_with_tokens, starts = np.unique(np.array(owners), return_index=True)
+        signatures[owners_with_tokens] = np.minimum.reduceat(permuted, starts, axis=0)
+        return signatures
+
+    def _get_band_keys(self, signatures: np.ndarray, band: int) -> np.ndarray:
+        columns = slice(band * self.rows, (band + 1) * self.rows)
+        # overflow is fine, a collision only adds a false candidate which its exact similarity rules out
+        return (signatures[:, columns] * self._band_coefficients[columns]).sum(
+            axis=1, dtype=np.uint64
+        )
+
+
+def get_minhash_lsh_index(yields_store: "YieldsStore") -> MinHashLSHIndex:
+    return get_store_index(yields_store, "minhash_lsh_index", _build_minhash_lsh_index)
+
+
+def _build_minhash_lsh_index(yields_store: "YieldsStore") -> MinHashLSHIndex:
+    suffix_trie = get_suffix_trie(yields_store)
+    return MinHashLSHIndex(
+        [
+            get_minhash_tokens(TagIndex.get_tags(pool["symbol"]), suffix_trie)
+            for pool in yields_store.pools
+        ]
+    )
+
+
+def _get_bands_and_rows(num_perm: int, threshold: float) -> tuple[int, int]:
+    """
+    the probability that a pair with similarity s shares a band is 1 - (1 - s^rows)^bands, which turns steep around (1/bands)^(1/rows)
+    take the most rows whose turning point still stays below the threshold, in favor of recall
+    """
+    bands, rows = num_perm, 1
+    for candidate_rows in range(1, num_perm + 1):
+        if num_perm % candidate_rows != 0:
+            continue
+        candidate_bands = num_perm // candidate_rows
+        if (1 / candidate_bands) ** (1 / candidate_rows) > threshold:
+            break
+        bands, rows = candidate_bands, candidate_rows
+    return bands, rows
+
+
+class MinHashLSHSimilarityHandler(SearchBase):
+    """
+    Jaccard similarity over the pools MinHash/LSH finds, for pool universes too large to look up every pool sharing a tag with a position
+    the index only narrows down the candidates, each of them is scored with the exact jaccard similarity before the threshold
+    """
+
+    # tokens are folded with the snapshot's suffix trie
+    similarity_depends_on_snapshot = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._similarity_threshold = kwargs["similarity_threshold"]
+        self._minhash_lsh_index = kwargs["minhash_lsh_index"]
+        self._suffix_trie = kwargs["suffix_trie"]
+        self._jaccard_similarity_handler = JaccardSimilarityHandler(
+            similarity_threshold=self._similarity_threshold,
+            suffix_trie=self._suffix_trie,
+        )
+        self._signature_cache = {}
+
+    @property
+    def similarity_threshold(self):
+        return self._similarity_threshold
+
+    def get_candidate_pool_indexes(
+        self, metadata: dict, tag_index: TagIndex
+    ) -> set[int] | None:
+        return self._minhash_lsh_index.query(self._get_my_pool_signature(metadata))
+
+    def get_similarity(self, metadata: dict, candidate_symbol: str) -> float:
+        """Jaccard similarity between two sets of tags, same as JaccardSimilarityHandler's"""
+        return self._jaccard_similarity_handler.get_similarity(
+            metadata, candidate_symbol
+        )
+
+    def _get_my_pool_signature(self, metadata: dict) -> np.ndarray:
+        tokens = get_minhash_tokens(
+            set(self.unwrap_token(tag.lower()) for tag in metadata["metadata"]["tags"]),
+            self._suffix_trie,
+        )
+        if tokens not in self._signature_cache:
+            self._signature_cache[tokens] = self._minhash_lsh_index.get_signature(
+                tokens
+            )
+        return self._signature_cache[tokens]
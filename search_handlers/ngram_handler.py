@@ -1,18 +1,101 @@
+from collections import defaultdict
+from typing import TYPE_CHECKING
+
 import ngram
+import numpy as np
 
 from rebalance_server.search_handlers import SearchBase
+from rebalance_server.search_handlers.tag_index import TagIndex
+from rebalance_server.utils.position import unwrap_token
+from rebalance_server.utils.store_indexes import get_store_index
+
+if TYPE_CHECKING:
+    from rebalance_server.apr_utils.yields_store import YieldsStore
+
+
+class NgramIndex:
+    """
+    One `ngram.NGram` index over the distinct symbols of a snapshot's pools (lower-cased and unwrapped), pools sharing a symbol share an entry
+    """
+
+    def __init__(self, symbols: list[str]):
+        self._pool_indexes_by_key = defaultdict(list)
+        for pool_index, symbol in enumerate(symbols):
+            self._pool_indexes_by_key[self.get_key(symbol)].append(pool_index)
+        self._ngram = ngram.NGram(self._pool_indexes_by_key.keys())
+
+    @staticmethod
+    def get_key(symbol: str) -> str:
+        return unwrap_token(symbol.lower())
+
+    def search(self, symbol: str, threshold: float) -> dict[int, float]:
+        """
+        similarity of every pool whose symbol is at least `threshold` similar to `symbol`, by pool index
+        same as `ngram.NGram.compare` on the keys, but only the pools sharing an n-gram with the symbol are scored
+        """
+        similarities = {}
+        for key, similarity in self._ngram.search(self.get_key(symbol), threshold):
+            for pool_index in self._pool_indexes_by_key[key]:
+                similarities[pool_index] = similarity
+        return similarities
+
+
+def get_ngram_index(yields_store: "YieldsStore") -> NgramIndex:
+    return get_store_index(
+        yields_store,
+        "ngram_index",
+        lambda yields_store: NgramIndex(
+            [pool["symbol"] for pool in yields_store.pools]
+        ),
+    )
 
 
 class NgramSimilarityHandler(SearchBase):
+    """
+    Fuzzy match on the whole symbol, for the symbols whose tags don't match the jaccard handler's
+    """
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.similarity_threshold = kwargs["similarity_threshold"]
+        self._ngram_index = kwargs["ngram_index"]
+        self._similarities_cache = {}
 
-    def check_similarity(self, metadata: dict, candidate_symbol: str) -> float:
+    def get_candidate_pool_indexes(
+        self, metadata: dict, tag_index: TagIndex
+    ) -> set[int] | None:
+        return set(self._get_similarities(metadata))
+
+    def get_similarity_matrix(
+        self,
+        metadatas: list[dict],
+        yields_store: "YieldsStore",
+        candidate_pool_mask: np.ndarray,
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # one index query per position
+        position_indexes, pool_indexes, similarities = [], [], []
+        for position_index, metadata in enumerate(metadatas):
+            for pool_index, similarity in self._get_similarities(metadata).items():
+                if candidate_pool_mask[pool_index]:
+                    position_indexes.append(position_index)
+                    pool_indexes.append(pool_index)
+                    similarities.append(similarity)
         return (
-            ngram.NGram.compare(
-                self.unwrap_token(metadata["metadata"]["symbol"].lower()),
-                self.unwrap_token(candidate_symbol.lower()),
-            )
-            > self.similarity_threshold
+            np.array(position_indexes, dtype=np.int64),
+            np.array(pool_indexes, dtype=np.int64),
+            np.array(similarities, dtype=float),
         )
+
+    def get_similarity(self, metadata: dict, candidate_symbol: str) -> float:
+        return ngram.NGram.compare(
+            NgramIndex.get_key(metadata["metadata"]["symbol"]),
+            NgramIndex.get_key(candidate_symbol),
+        )
+
+    def _get_similarities(self, metadata: dict) -> dict[int, float]:
+        symbol = metadata["metadata"]["symbol"]
+        if symbol not in self._similarities_cache:
+            self._similarities_cache[symbol] = self._ngram_index.search(
+                symbol, self.similarity_threshold
+            )
+        return self._similarities_cache[symbol]
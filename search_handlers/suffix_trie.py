@@ -0,0 +1,61 @@
+from typing import Iterable
+
+MIN_DENORMALIZED_TAG_LENGTH = 3
+_END_OF_TOKEN = ""
+
+
+class SuffixTrie:
+    """
+    Trie of the reversed tokens of a vocabulary (e.g. every defillama symbol and the tags in portfolio_config).
+    Walking a reversed tag through it finds every token the tag ends with, e.g. "sfrxeth" -> ("eth", "frxeth").
+    """
+
+    def __init__(self, vocabulary: Iterable[str] = ()):
+        self._root = {}
+        self._suffixes_cache = {}
+        for token in vocabulary:
+            self.insert(token)
+
+    def insert(self, token: str) -> None:
+        node = self._root
+        for char in reversed(token):
+            node = node.setdefault(char, {})
+        if _END_OF_TOKEN not in node:
+            node[_END_OF_TOKEN] = True
+            # a new token might be a suffix of tags we've already looked up
+            self._suffixes_cache.clear()
+
+    def __contains__(self, token: str) -> bool:
+        node = self._root
+        for char in reversed(token):
+            node = node.get(char)
+            if node is None:
+                return False
+        return _END_OF_TOKEN in node
+
+    def get_suffixes(self, tag: str) -> tuple[str, ...]:
+        """
+        tokens of the vocabulary `tag` ends with, apart from `tag` itself and the ones too short to be a variation of another token
+        shortest first, memoized per tag
+        """
+        suffixes = self._suffixes_cache.get(tag)
+        if suffixes is not None:
+            return suffixes
+        suffixes = []
+        node = self._root
+        for length, char in enumerate(reversed(tag), start=1):
+            node = node.get(char)
+            if node is None:
+                break
+            if _END_OF_TOKEN in node and MIN_DENORMALIZED_TAG_LENGTH <= length < len(
+                tag
+            ):
+                suffixes.append(tag[-length:])
+        suffixes = tuple(suffixes)
+        self._suffixes_cache[tag] = suffixes
+        return suffixes
+
+    def get_canonical_base(self, tag: str) -> str:
+        # e.g. "sfrxeth" -> "eth"
+        suffixes = self.get_suffixes(tag)
+        return suffixes[0] if suffixes else tag
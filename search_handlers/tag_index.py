@@ -0,0 +1,80 @@
+from collections import defaultdict
+from typing import TYPE_CHECKING
+
+from rebalance_server.portfolio_config import ADDRESS_2_CATEGORY, TOKEN_2_CATEGORIES
+from rebalance_server.search_handlers.suffix_trie import (
+    MIN_DENORMALIZED_TAG_LENGTH,
+    SuffixTrie,
+)
+from rebalance_server.utils.position import unwrap_token
+from rebalance_server.utils.store_indexes import get_store_index
+
+if TYPE_CHECKING:
+    from rebalance_server.apr_utils.yields_store import YieldsStore
+
+
+class TagIndex:
+    """
+    Inverted index from the tags of each pool's symbol (lower-cased, split by "-" and unwrapped) to the indexes of the pools containing it.
+    Tags are also indexed by their suffixes, so that lookups follow the same suffix folding as `SearchBase.denormalize_tag`, e.g. "eth" finds "sfrxeth" and the other way around.
+    """
+
+    def __init__(self, symbols: list[str]):
+        self._pool_indexes_by_tag = defaultdict(set)
+        self._pool_indexes_by_tag_suffix = defaultdict(set)
+        for pool_index, symbol in enumerate(symbols):
+            for tag in self.get_tags(symbol):
+                self._pool_indexes_by_tag[tag].add(pool_index)
+                for suffix in self._get_suffixes(tag, include_itself=True):
+                    self._pool_indexes_by_tag_suffix[suffix].add(pool_index)
+
+    @staticmethod
+    def get_tags(symbol: str) -> set[str]:
+        return set(unwrap_token(tag) for tag in symbol.lower().split("-"))
+
+    def get_pool_indexes_sharing_a_tag(self, tags: set[str]) -> set[int]:
+        """
+        pools whose normalized tags could intersect with the normalized `tags`, pools outside of it always have a jaccard similarity of 0
+        """
+        pool_indexes = set()
+        for tag in tags:
+            # pools with the same tag, or a tag ending with it (e.g. "sfrxeth" for "eth")
+            pool_indexes |= self._pool_indexes_by_tag_suffix.get(tag, set())
+            # pools with a tag this tag ends with (e.g. "eth" for "sfrxeth")
+            for suffix in self._get_suffixes(tag, include_itself=False):
+                pool_indexes |= self._pool_indexes_by_tag.get(suffix, set())
+        return pool_indexes
+
+    @staticmethod
+    def _get_suffixes(tag: str, include_itself: bool) -> list[str]:
+        suffixes = [
+            tag[start:]
+            for start in range(1, len(tag) - MIN_DENORMALIZED_TAG_LENGTH + 1)
+        ]
+        if include_itself:
+            suffixes.append(tag)
+        return suffixes
+
+
+def get_tag_index(yields_store: "YieldsStore") -> TagIndex:
+    return get_store_index(
+        yields_store,
+        "tag_index",
+        lambda yields_store: TagIndex([pool["symbol"] for pool in yields_store.pools]),
+    )
+
+
+def get_suffix_trie(yields_store: "YieldsStore") -> SuffixTrie:
+    return get_store_index(yields_store, "suffix_trie", _build_suffix_trie)
+
+
+def _build_suffix_trie(yields_store: "YieldsStore") -> SuffixTrie:
+    # every token we know of: the ones in defillama's symbols, plus the ones in portfolio_config
+    vocabulary = set()
+    for pool in yields_store.pools:
+        vocabulary |= TagIndex.get_tags(pool["symbol"])
+    for tokens in TOKEN_2_CATEGORIES.values():
+        vocabulary |= set(unwrap_token(token.lower()) for token in tokens)
+    for metadata in ADDRESS_2_CATEGORY.values():
+        vocabulary |= set(unwrap_token(tag.lower()) for tag in metadata["tags"])
+    return SuffixTrie(vocabulary)
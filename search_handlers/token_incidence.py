@@ -0,0 +1,139 @@
+from collections import defaultdict
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from rebalance_server.search_handlers.suffix_trie import SuffixTrie
+from rebalance_server.search_handlers.tag_index import TagIndex, get_suffix_trie
+from rebalance_server.utils.store_indexes import get_store_index
+
+if TYPE_CHECKING:
+    from rebalance_server.apr_utils.yields_store import YieldsStore
+
+
+class TokenIncidence:
+    """
+    Sparse incidence matrix of token sets (rows) x base tokens (columns) in COO form, the base token of a tag being its shortest suffix in the suffix trie, e.g. "sfrxeth" -> "eth".
+    Every tag of a token set should be in the suffix trie.
+    Each entry also keeps
+    - `minimal_tag_counts`: how many tags of the set fold to this base token and have no suffix within the set, i.e. how many tags are left for this base token once the set is denormalized on its own
+    - `has_base_tag`: whether the base token itself is a tag of the set, in which case every tag of another set folding to the same base token gets denormalized to it too
+    """
+
+    def __init__(
+        self,
+        token_sets: list[frozenset],
+        suffix_trie: SuffixTrie,
+        token_ids: dict[str, int] | None = None,
+    ):
+        # the columns of a query (e.g. the positions) have to be the ones of the pools it's multiplied with
+        # base tokens the pools don't have are left out, they can't be shared with any pool anyway
+        self.token_ids = token_ids if token_ids is not None else {}
+        can_add_token = token_ids is None
+        rows, columns, minimal_tag_counts, has_base_tag = [], [], [], []
+        self.row_minimal_tag_counts = np.zeros(len(token_sets), dtype=np.int64)
+        for row, tags in enumerate(token_sets):
+            tags_by_base = defaultdict(list)
+            for tag in tags:
+                tags_by_base[suffix_trie.get_canonical_base(tag)].append(tag)
+            for base, tags_of_base in tags_by_base.items():
+                minimal_tag_count = sum(
+                    1
+                    for tag in tags_of_base
+                    if not any(
+                        suffix in tags for suffix in suffix_trie.get_suffixes(tag)
+                    )
+                )
+                self.row_minimal_tag_counts[row] += minimal_tag_count
+                if base not in self.token_ids:
+                    if not can_add_token:
+                        continue
+                    self.token_ids[base] = len(self.token_ids)
+                rows.append(row)
+                columns.append(self.token_ids[base])
+                minimal_tag_counts.append(minimal_tag_count)
+                has_base_tag.append(base in tags)
+        self.n_rows = len(token_sets)
+        # sorted by column, so the rows sharing a column can be found by a binary search
+        order = np.argsort(np.array(columns, dtype=np.int64), kind="stable")
+        self.rows = np.array(rows, dtype=np.int64)[order]
+        self.columns = np.array(columns, dtype=np.int64)[order]
+        self.minimal_tag_counts = np.array(minimal_tag_counts, dtype=np.int64)[order]
+        self.has_base_tag = np.array(has_base_tag, dtype=bool)[order]
+
+    def select_rows(self, row_mask: np.ndarray) -> "TokenIncidence":
+        selected = object.__new__(TokenIncidence)
+        selected.token_ids = self.token_ids
+        selected.n_rows = self.n_rows
+        selected.row_minimal_tag_counts = self.row_minimal_tag_counts
+        entry_mask = row_mask[self.rows]
+        selected.rows = self.rows[entry_mask]
+        selected.columns = self.columns[entry_mask]
+        selected.minimal_tag_counts = self.minimal_tag_counts[entry_mask]
+        selected.has_base_tag = self.has_base_tag[entry_mask]
+        return selected
+
+
+def get_token_incidence(yields_store: "YieldsStore") -> TokenIncidence:
+    # the token sets of every pool, over the store's suffix trie
+    return get_store_index(
+        yields_store,
+        "token_incidence",
+        lambda yields_store: TokenIncidence(
+            [
+                frozenset(TagIndex.get_tags(pool["symbol"]))
+                for pool in yields_store.pools
+            ],
+            get_suffix_trie(yields_store),
+        ),
+    )
+
+
+def get_jaccard_similarity_matrix(
+    query_incidence: TokenIncidence, incidence: TokenIncidence
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Jaccard similarity of the denormalized tags (see `SearchBase.denormalize_tag`) of every pair of rows sharing a base token, as one sparse product.
+    Tags folding to different base tokens can never be denormalized to the same tag, so base tokens are denormalized separately:
+    - a base token only one of the sets has adds its minimal tag count to the union
+    - a base token both sets have, and at least one of them as a tag, adds exactly one tag to both the intersection and the union
+    - otherwise it depends on how the tags of both sets end with each other, those pairs are flagged `is_ambiguous` and their similarity is left to the caller
+    returns (query rows, rows, similarities, is_ambiguous) of the pairs sharing a base token, pairs sharing none have a similarity of 0
+    """
+    # join the entries of both matrices on their column
+    starts = np.searchsorted(incidence.columns, query_incidence.columns, side="left")
+    ends = np.searchsorted(incidence.columns, query_incidence.columns, side="right")
+    counts = ends - starts
+    query_entries = np.repeat(np.arange(len(query_incidence.columns)), counts)
+    offsets = np.cumsum(counts) - counts
+    entries = np.repeat(starts - offsets, counts) + np.arange(counts.sum())
+
+    pair_keys = (
+        query_incidence.rows[query_entries] * incidence.n_rows + incidence.rows[entries]
+    )
+    pair_keys, pair_of_entries = np.unique(pair_keys, return_inverse=True)
+    query_rows, rows = np.divmod(pair_keys, incidence.n_rows)
+    shared_base_tokens = np.bincount(pair_of_entries, minlength=len(pair_keys))
+    # the minimal tags of a shared base token fold to a single one
+    folded_tags = np.bincount(
+        pair_of_entries,
+        weights=query_incidence.minimal_tag_counts[query_entries]
+        + incidence.minimal_tag_counts[entries]
+        - 1,
+        minlength=len(pair_keys),
+    ).astype(np.int64)
+    is_ambiguous = (
+        np.bincount(
+            pair_of_entries,
+            weights=~query_incidence.has_base_tag[query_entries]
+            & ~incidence.has_base_tag[entries],
+            minlength=len(pair_keys),
+        )
+        > 0
+    )
+    unions = (
+        query_incidence.row_minimal_tag_counts[query_rows]
+        + incidence.row_minimal_tag_counts[rows]
+        - folded_tags
+    )
+    return query_rows, rows, shared_base_tokens / unions, is_ambiguous
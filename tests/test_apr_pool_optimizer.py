@@ -0,0 +1,189 @@
+"""
+test the candidate search of the apr pool optimizer
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import pytest
+
+from apr_utils import apr_pool_optimizer
+from apr_utils.apr_calculator import ADDRESS_2_CATEGORY, get_apy
+from apr_utils.apr_pool_optimizer import (
+    _get_candidate_pool_columns,
+    _get_topn_candidate_pools,
+    _get_topn_candidate_pools_in_parallel,
+)
+from apr_utils.candidate_cache import CandidateCache
+from apr_utils.yields_store import YieldsStore
+from benchmarks.synthetic import (
+    generate_categorized_positions,
+    generate_pools,
+    get_address_2_category,
+)
+from search_handlers.jaccard_similarity_handler import JaccardSimilarityHandler
+from search_handlers.tag_index import get_suffix_trie
+from utils.snapshot_refresher import SNAPSHOT_REFRESHER_THREAD_NAME
+
+
+def _get_positions(pools: list[dict]) -> list[tuple[str, dict, float]]:
+    return [
+        (project_symbol, position, position["APR"])
+        for portfolio in generate_categorized_positions(30, pools, seed=1).values()
+        for project_symbol, position in portfolio["portfolio"].items()
+    ]
+
+
+def _get_jaccard_similarity_handler(
+    yields_store: YieldsStore,
+) -> JaccardSimilarityHandler:
+    return JaccardSimilarityHandler(
+        similarity_threshold=0.5, suffix_trie=get_suffix_trie(yields_store)
+    )
+
+
+def test_candidate_cache_follows_the_snapshot() -> None:
+    pools = generate_pools(2000, seed=1)
+    positions = _get_positions(pools)
+    old = YieldsStore(pools)
+    new_pools = [dict(pool) for pool in pools[100:]]
+    for pool in new_pools[::10]:
+        pool["apy"] *= 3
+    new = YieldsStore(new_pools)
+
+    def get_top_ns(cache: CandidateCache, yields_store: YieldsStore) -> list[list]:
+        return cache.get_topn_candidate_pools(
+            positions,
+            yields_store,
+            _get_candidate_pool_columns(yields_store, set()),
+            get_apy,
+            frozenset(),
+        )
+
+    cache = CandidateCache(_get_jaccard_similarity_handler)
+    assert get_top_ns(cache, old) == _get_topn_candidate_pools(
+        positions,
+        old,
+        _get_candidate_pool_columns(old, set()),
+        _get_jaccard_similarity_handler(old),
+        get_apy,
+    )
+    incremental = get_top_ns(cache, new)
+    assert incremental != get_top_ns(
+        CandidateCache(_get_jaccard_similarity_handler), old
+    )
+    assert incremental == get_top_ns(
+        CandidateCache(_get_jaccard_similarity_handler), new
+    )
+
+
+def test_candidate_cache_serves_cached_positions_while_scoring_new_ones() -> None:
+    pools = generate_pools(2000, seed=1)
+    positions = _get_positions(pools)
+    yields_store = YieldsStore(pools)
+    candidate_pool_columns = _get_candidate_pool_columns(yields_store, set())
+    cache = CandidateCache(_get_jaccard_similarity_handler)
+
+    def get_top_ns(positions: list[tuple[str, dict, float]]) -> list[list]:
+        return cache.get_topn_candidate_pools(
+            positions, yields_store, candidate_pool_columns, get_apy, frozenset()
+        )
+
+    cached = get_top_ns(positions[:10])
+    get_similar_pools = cache._get_similar_pools
+    scoring, release = threading.Event(), threading.Event()
+    scored = []
+
+    def get_similar_pools_slowly(*args) -> list[tuple[int, str, float]]:
+        scored.append(args)
+        scoring.set()
+        release.wait(10)
+        return get_similar_pools(*args)
+
+    cache._get_similar_pools = get_similar_pools_slowly
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        new = [executor.submit(get_top_ns, positions[10:]) for _ in range(2)]
+        assert scoring.wait(10)
+        assert executor.submit(get_top_ns, positions[:10]).result(timeout=5) == cached
+        release.set()
+        assert new[0].result() == new[1].result()
+    # the concurrent request for the same new positions waited for the first one's scores
+    assert len(scored) == 1
+    assert new[0].result() == _get_topn_candidate_pools(
+        positions[10:],
+        yields_store,
+        candidate_pool_columns,
+        _get_jaccard_similarity_handler(yields_store),
+        get_apy,
+    )
+
+
+def test_parallel_candidate_search_keeps_the_order() -> None:
+    pools = generate_pools(2000, seed=1)
+    yields_store = YieldsStore(pools)
+    positions = _get_positions(pools)
+    snapshot = (
+        yields_store,
+        _get_candidate_pool_columns(yields_store, set()),
+        _get_jaccard_similarity_handler(yields_store),
+        get_apy,
+    )
+    sequential = _get_topn_candidate_pools(positions, *snapshot)
+    assert any(sequential)
+    assert _get_topn_candidate_pools_in_parallel(positions, snapshot, 3) == sequential
+
+
+def test_parallel_candidate_search_refuses_to_fork_a_threaded_process() -> None:
+    pools = generate_pools(100, seed=1)
+    yields_store = YieldsStore(pools)
+    snapshot = (
+        yields_store,
+        _get_candidate_pool_columns(yields_store, set()),
+        _get_jaccard_similarity_handler(yields_store),
+        get_apy,
+    )
+    stop = threading.Event()
+    thread = threading.Thread(target=stop.wait)
+    thread.start()
+    try:
+        with pytest.raises(RuntimeError):
+            _get_topn_candidate_pools_in_parallel(_get_positions(pools), snapshot, 3)
+    finally:
+        stop.set()
+        thread.join()
+
+
+def test_max_workers_forks_alongside_the_snapshot_refresher() -> None:
+    pools = generate_pools(2000, seed=1)
+    yields_store = YieldsStore(pools)
+    categorized_positions = generate_categorized_positions(30, pools, seed=1)
+    stop = threading.Event()
+    # what get_yields_store starts in every process
+    refresher = threading.Thread(
+        target=stop.wait, name=SNAPSHOT_REFRESHER_THREAD_NAME, daemon=True
+    )
+    refresher.start()
+    try:
+        with mock.patch.object(
+            apr_pool_optimizer, "get_yields_store", lambda: yields_store
+        ), mock.patch.dict(
+            ADDRESS_2_CATEGORY, get_address_2_category(categorized_positions)
+        ), mock.patch.object(
+            apr_pool_optimizer,
+            "_get_topn_candidate_pools_in_parallel",
+            wraps=_get_topn_candidate_pools_in_parallel,
+        ) as in_parallel:
+            parallel = apr_pool_optimizer.search_top_n_pool_consist_of_same_lp_token(
+                categorized_positions, "new_pool", max_workers=3
+            )
+            assert in_parallel.call_count == 1
+            assert (
+                parallel
+                == apr_pool_optimizer.search_top_n_pool_consist_of_same_lp_token(
+                    categorized_positions, "new_pool", max_workers=0
+                )
+            )
+            assert in_parallel.call_count == 1
+    finally:
+        stop.set()
+        refresher.join()
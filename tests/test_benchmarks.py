@@ -0,0 +1,64 @@
+"""
+test the benchmarks and their regression checks
+"""
+from benchmarks import minhash_lsh_vs_jaccard
+from benchmarks.apr_pool_optimizer import (
+    PRESETS,
+    benchmark_apr_pool_optimizer,
+    get_regressions,
+    load_baselines,
+)
+
+
+def test_benchmark_apr_pool_optimizer() -> None:
+    results = benchmark_apr_pool_optimizer(
+        500, 5, searching_algorithms=["jaccard_similarity"]
+    )
+    assert list(results) == [
+        "yields_store",
+        "candidate_search:jaccard_similarity",
+        "candidate_search:jaccard_similarity:cached",
+        "stable_coin_search",
+    ]
+    for result in results.values():
+        assert result["wall_seconds"] > 0
+        assert result["peak_memory_mb"] >= 0
+        assert result["pools_per_second"] > 0
+
+
+def test_smallest_preset_runs_the_stages_of_its_baselines() -> None:
+    # timings depend on the machine, they're only checked against the baselines by the benchmark's own entry point
+    preset = min(PRESETS, key=lambda preset: PRESETS[preset][0])
+    n_pools, n_positions, searching_algorithms = PRESETS[preset]
+    results = benchmark_apr_pool_optimizer(
+        n_pools, n_positions, searching_algorithms=searching_algorithms
+    )
+    baselines = load_baselines()[preset]
+    assert set(results) == set(baselines)
+    for name, result in results.items():
+        assert set(result) == set(baselines[name])
+
+
+def test_get_regressions() -> None:
+    baselines = {
+        "fast": {"wall_seconds": 1.0, "peak_memory_mb": 100.0},
+        "tiny": {"wall_seconds": 0.001, "peak_memory_mb": 0.1},
+    }
+    results = {
+        "fast": {"wall_seconds": 2.0, "peak_memory_mb": 110.0},
+        # within the absolute slack, however large the ratio
+        "tiny": {"wall_seconds": 0.005, "peak_memory_mb": 0.5},
+        "new": {"wall_seconds": 100.0, "peak_memory_mb": 100.0},
+    }
+    assert get_regressions(results, baselines) == ["fast: 2.0000s, baseline 1.0000s"]
+
+
+def test_minhash_lsh_finds_the_same_pools_as_exact_jaccard() -> None:
+    results = minhash_lsh_vs_jaccard.benchmark_minhash_lsh_vs_jaccard(2000, 20)
+    assert minhash_lsh_vs_jaccard.get_regressions(results) == []
+    assert minhash_lsh_vs_jaccard.get_regressions(
+        {"recall": 0.9, "precision": 0.3}
+    ) == [
+        "recall: 0.9000, minimum 0.99",
+        "precision: 0.3000, minimum 1.0",
+    ]
@@ -0,0 +1,32 @@
+"""
+test the position model categorized portfolios are built with
+"""
+from utils.categorized_positions import CategorizedPositions, PositionSource
+
+
+def test_positions_spanning_categories_share_their_source_and_metadata() -> None:
+    metadata = {"symbol": "GLP", "categories": ["gold", "long_term_bond"]}
+    categorized_positions = CategorizedPositions()
+    categorized_positions.add_position(
+        "gmx:GLP",
+        {"gold": 30, "long_term_bond": 70},
+        PositionSource("0xglp:gmx", 0.2, [{"symbol": "GLP"}]),
+        metadata,
+    )
+    last_source = PositionSource("0xglp2:gmx", 0.3, [])
+    categorized_positions.add_position(
+        "gmx:GLP", {"gold": 3, "long_term_bond": 7}, last_source, metadata
+    )
+    gold = categorized_positions["gold"]["portfolio"]["gmx:GLP"]
+    long_term_bond = categorized_positions["long_term_bond"]["portfolio"]["gmx:GLP"]
+    assert gold.source is long_term_bond.source is last_source
+    assert gold["metadata"] is long_term_bond["metadata"] is metadata
+    assert dict(gold) == {
+        "worth": 33,
+        "address": "0xglp2:gmx",
+        "APR": 0.3,
+        "metadata": metadata,
+        "tokens_metadata": [],
+    }
+    assert categorized_positions["long_term_bond"]["sum"] == 77
+    assert categorized_positions["commodities"] == {"sum": 0, "portfolio": {}}
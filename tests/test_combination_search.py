@@ -0,0 +1,57 @@
+"""
+test the branch-and-bound search of the new_combination optimizer
+"""
+import itertools
+import random
+
+from apr_utils.combination_search import search_best_combination
+
+
+def _fill(combination, category_weights, capacities, category_budgets) -> tuple:
+    # the same greedy fill as the search, from the highest APR down
+    room = list(category_budgets)
+    allocations = []
+    for index in combination:
+        amount = min(
+            [capacities[index]]
+            + [room[c] / w for c, w in enumerate(category_weights[index]) if w > 0]
+        )
+        for c, weight in enumerate(category_weights[index]):
+            room[c] -= amount * weight
+        allocations.append((index, amount))
+    return room, allocations
+
+
+def test_search_best_combination_matches_brute_force() -> None:
+    rng = random.Random(0)
+    compositions = [(1.0, 0.0), (0.0, 1.0), (0.5, 0.5)]
+    category_budgets = [100.0, 50.0]
+    for _ in range(20):
+        category_weights = [rng.choice(compositions) for _ in range(9)]
+        aprs = [rng.uniform(0.01, 0.3) for _ in range(9)]
+        capacities = [rng.uniform(10, 80) for _ in range(9)]
+        best_interest = None
+        ranked = sorted(range(9), key=lambda index: -aprs[index])
+        for size in range(1, 4):
+            for combination in itertools.combinations(ranked, size):
+                room, allocations = _fill(
+                    combination, category_weights, capacities, category_budgets
+                )
+                if all(r <= 5 for r in room):
+                    interest = sum(amount * aprs[i] for i, amount in allocations)
+                    best_interest = max(best_interest or 0, interest)
+        best = search_best_combination(
+            category_weights, aprs, capacities, category_budgets, 5, max_pools=3
+        )
+        if best_interest is None:
+            assert best is None
+            continue
+        assert abs(best["interest"] - best_interest) < 1e-9
+        assert best["exhaustive"]
+        room, _ = _fill(
+            [index for index, _ in best["allocations"]],
+            category_weights,
+            capacities,
+            category_budgets,
+        )
+        assert all(-1e-9 <= r <= 5 for r in room)
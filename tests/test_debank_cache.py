@@ -0,0 +1,25 @@
+"""
+test the per-address DeBank cache
+"""
+import os
+
+from utils.debank_cache import DebankCache
+
+
+def test_entries_are_per_address_and_expire(tmp_path) -> None:
+    cache = DebankCache(cache_dir=str(tmp_path / "debank-cache"), ttl=60)
+    assert cache.get("0xA") is None
+    cache.put("0xA", [{"id": "gmx"}])
+    cache.put("0xb", [])
+    assert cache.get("0xa") == [{"id": "gmx"}]
+    assert cache.get("0xB") == []
+    os.utime(cache._get_path("0xa"), (0, 0))
+    assert cache.get("0xa") is None
+    assert cache.get("0xb") == []
+
+
+def test_addresses_cannot_escape_the_cache_dir(tmp_path) -> None:
+    cache = DebankCache(cache_dir=str(tmp_path / "debank-cache"), ttl=60)
+    cache.put("../../escaped", [])
+    assert os.listdir(tmp_path) == ["debank-cache"]
+    assert cache.get("../../escaped") == []
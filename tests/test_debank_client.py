@@ -0,0 +1,80 @@
+"""
+test DebankClient against a local stub of DeBank's API
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+import requests
+
+from utils.debank_client import DebankClient
+
+RESPONSE_DELAY_SECONDS = 0.3
+
+
+def _serve_stub(failures: dict[str, list[int]]) -> ThreadingHTTPServer:
+    class StubHandler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            address = parse_qs(urlparse(self.path).query)["id"][0]
+            time.sleep(RESPONSE_DELAY_SECONDS)
+            status = failures[address].pop(0) if failures.get(address) else 200
+            body = json.dumps(
+                [{"id": f"protocol-of-{address}"}] if status == 200 else {}
+            ).encode()
+            self.send_response(status)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args) -> None:
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def test_addresses_are_fetched_concurrently_and_merged_in_order() -> None:
+    server = _serve_stub({"0xb": [503]})
+    client = DebankClient(base_url=f"http://127.0.0.1:{server.server_port}")
+    addresses = ["0xa", "0xb", "0xc", "0xd", "0xe", "0xf"]
+    start = time.monotonic()
+    protocol_lists = client.get_all_complex_protocol_lists(addresses)
+    elapsed = time.monotonic() - start
+    server.shutdown()
+    assert protocol_lists == [
+        [{"id": f"protocol-of-{address}"}] for address in addresses
+    ]
+    # as long as the slowest address, which is 0xb's retry
+    assert elapsed < RESPONSE_DELAY_SECONDS * len(addresses)
+
+
+def test_client_errors_are_not_retried() -> None:
+    failures = {"0xa": [404, 404]}
+    server = _serve_stub(failures)
+    client = DebankClient(base_url=f"http://127.0.0.1:{server.server_port}")
+    with pytest.raises(requests.HTTPError):
+        client.get_all_complex_protocol_list("0xa")
+    server.shutdown()
+    assert failures == {"0xa": [404]}
+
+
+def test_protocol_lists_are_yielded_before_the_slowest_address_arrives() -> None:
+    delays = {"0xa": 0.0, "0xb": 0.0, "0xslow": RESPONSE_DELAY_SECONDS * 3}
+
+    def get_protocol_list(address: str) -> list[dict]:
+        time.sleep(delays[address])
+        return [{"id": f"protocol-of-{address}"}]
+
+    client = DebankClient(base_url="http://127.0.0.1:0")
+    start = time.monotonic()
+    protocol_lists = client.iter_all_complex_protocol_lists(
+        list(delays), get_protocol_list
+    )
+    assert next(protocol_lists) == [{"id": "protocol-of-0xa"}]
+    assert next(protocol_lists) == [{"id": "protocol-of-0xb"}]
+    assert time.monotonic() - start < delays["0xslow"]
+    assert list(protocol_lists) == [[{"id": "protocol-of-0xslow"}]]
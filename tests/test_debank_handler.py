@@ -0,0 +1,126 @@
+"""
+test categorizing DeBank's positions from scratch and from the delta against the last call
+"""
+import copy
+import importlib
+import json
+from unittest import mock
+
+import pytest
+
+from handlers.debank_handler import debank_delta_handler, debank_handler
+from utils.categorized_positions import CategorizedPositions
+
+# the package re-exports the handler under the module's name
+debank_handler_module = importlib.import_module("handlers.debank_handler")
+# the mapping table the handler and the APR lookups actually read
+ADDRESS_2_CATEGORY = debank_handler_module.ADDRESS_2_CATEGORY
+
+MAPPING_TABLE = {
+    "0xglp:arb_gmx": {
+        "categories": ["large_cap_us_stocks", "long_term_bond", "gold"],
+        "symbol": "GLP",
+        "APR": 0.2,
+        "composition": {"eth": 0.3, "wbtc": 0.3, "usdc": 0.4},
+    },
+    "0xusdc:aave": {
+        "categories": ["intermediate_term_bond"],
+        "symbol": "USDC",
+        "APR": 0.05,
+        "composition": {"usdc": 1},
+    },
+    "0xeth:aave": {
+        "categories": ["long_term_bond"],
+        "symbol": "ETH",
+        "APR": 0.02,
+        "composition": {"eth": 1},
+    },
+}
+
+
+def _get_protocol(project_id: str, positions: list[tuple[str, float]]) -> dict:
+    return {
+        "id": project_id,
+        "portfolio_item_list": [
+            {
+                "pool": {"id": pool_id, "project_id": project_id},
+                "stats": {"net_usd_value": net_usd_value},
+                "detail": {
+                    "supply_token_list": [
+                        {"amount": net_usd_value, "symbol": pool_id, "price": 1}
+                    ]
+                },
+            }
+            for pool_id, net_usd_value in positions
+        ],
+    }
+
+
+def _as_json(categorized_positions: CategorizedPositions) -> dict:
+    # sums adjusted by deltas may be off by a rounding error
+    return json.loads(
+        json.dumps(categorized_positions, default=dict),
+        parse_float=lambda f: round(float(f), 6),
+    )
+
+
+@pytest.mark.parametrize(
+    "snapshots",
+    [
+        [
+            [
+                [_get_protocol("arb_gmx", [("0xglp", 1000)])],
+                [_get_protocol("aave", [("0xusdc", 500), ("0xeth", 300)])],
+            ],
+            # a balance changed, a position was added and another one removed
+            [
+                [_get_protocol("arb_gmx", [("0xglp", 1200)])],
+                [_get_protocol("aave", [("0xusdc", 500), ("0xusdc", 700)])],
+            ],
+            # everything is gone
+            [[], []],
+            [
+                [_get_protocol("aave", [("0xeth", 100)])],
+                [_get_protocol("arb_gmx", [("0xglp", 1000)])],
+            ],
+        ]
+    ],
+)
+def test_delta_matches_categorizing_from_scratch(snapshots: list) -> None:
+    state = None
+    with mock.patch.dict(ADDRESS_2_CATEGORY, MAPPING_TABLE, clear=True):
+        for protocol_lists in snapshots:
+            expected = debank_handler(
+                copy.deepcopy(protocol_lists), CategorizedPositions()
+            )
+            result = CategorizedPositions()
+            state = debank_delta_handler(protocol_lists, result, state)
+            # the state goes through the cache as json
+            state = json.loads(json.dumps(state))
+            assert _as_json(result) == _as_json(expected)
+
+
+def test_only_changed_portfolio_items_are_categorized_again() -> None:
+    protocol_lists = [
+        [_get_protocol("arb_gmx", [("0xglp", 1000)])],
+        [_get_protocol("aave", [("0xusdc", 500), ("0xeth", 300)])],
+    ]
+    get_contribution = mock.Mock(wraps=debank_handler_module._get_contribution)
+    with mock.patch.dict(
+        ADDRESS_2_CATEGORY, MAPPING_TABLE, clear=True
+    ), mock.patch.object(debank_handler_module, "_get_contribution", get_contribution):
+        state = debank_delta_handler(protocol_lists, CategorizedPositions(), None)
+        assert get_contribution.call_count == 3
+        protocol_lists[1] = [_get_protocol("aave", [("0xusdc", 800), ("0xeth", 300)])]
+        result = CategorizedPositions()
+        debank_delta_handler(protocol_lists, result, state)
+        assert get_contribution.call_count == 4
+    assert result["intermediate_term_bond"]["sum"] == 800
+    # every cached contribution is invalidated once the mapping table changes
+    with mock.patch.dict(
+        ADDRESS_2_CATEGORY,
+        {**MAPPING_TABLE, "0xusdc:aave": {**MAPPING_TABLE["0xeth:aave"]}},
+        clear=True,
+    ), mock.patch.object(debank_handler_module, "_get_contribution", get_contribution):
+        debank_delta_handler(protocol_lists, CategorizedPositions(), state)
+        assert get_contribution.call_count == 7
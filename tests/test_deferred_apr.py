@@ -0,0 +1,60 @@
+"""
+test DeferredAPR's lazy fetching and ttl
+"""
+from apr_utils.deferred_apr import (
+    DEFERRED_APR_RETRY_BACKOFF_SECONDS,
+    DeferredAPR,
+    resolve_apr,
+    warm_up_deferred_aprs,
+)
+
+
+def test_deferred_apr_is_fetched_once_within_ttl() -> None:
+    calls = []
+
+    def fetcher(pool_addr: str) -> float:
+        calls.append(pool_addr)
+        return 0.1
+
+    apr = DeferredAPR(fetcher, pool_addr="0xabc")
+    assert calls == []
+    assert resolve_apr(apr) == 0.1
+    assert apr.resolve() == 0.1
+    assert calls == ["0xabc"]
+
+
+def test_deferred_apr_serves_stale_value_when_refetch_fails() -> None:
+    values = iter([0.2])
+
+    def fetcher() -> float:
+        return next(values)
+
+    apr = DeferredAPR(fetcher, ttl=-1)
+    warm_up_deferred_aprs([apr])
+    assert apr.is_stale
+    assert apr.resolve() == 0.2
+
+
+def test_failed_refetch_backs_off_before_trying_again() -> None:
+    calls = []
+
+    def fetcher() -> float:
+        calls.append(None)
+        if len(calls) > 1:
+            raise ConnectionError("upstream is down")
+        return 0.3
+
+    apr = DeferredAPR(fetcher, ttl=600)
+    apr.resolve()
+    apr._fetched_at -= 601
+    assert apr.resolve() == 0.3
+    assert apr.resolve() == 0.3
+    assert not apr.is_stale
+    assert len(calls) == 2
+    apr._fetched_at -= DEFERRED_APR_RETRY_BACKOFF_SECONDS + 1
+    assert apr.is_stale
+
+
+def test_resolve_apr_passes_through_plain_values() -> None:
+    assert resolve_apr(0.4) == 0.4
+    assert resolve_apr(None) is None
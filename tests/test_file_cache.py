@@ -0,0 +1,58 @@
+"""
+test the in-memory cache of files keyed by their mtime and size
+"""
+import gc
+import json
+import os
+import warnings
+from unittest import mock
+
+from utils.file_cache import get_cached_by_file, load_json_file
+
+
+def test_files_are_parsed_again_only_once_they_change(tmp_path) -> None:
+    path = str(tmp_path / "binance.json")
+    with open(path, "w") as f:
+        json.dump({"data": [1]}, f)
+    compute = mock.Mock(side_effect=lambda path: load_json_file(path)["data"])
+    assert get_cached_by_file(path, compute) == [1]
+    assert get_cached_by_file(path, compute) is get_cached_by_file(path, compute)
+    assert compute.call_count == 1
+    with open(path, "w") as f:
+        json.dump({"data": [1, 2]}, f)
+    assert get_cached_by_file(path, compute) == [1, 2]
+    # same size, only the mtime tells it apart
+    with open(path, "w") as f:
+        json.dump({"data": [3, 4]}, f)
+    os.utime(path, ns=(0, 0))
+    assert get_cached_by_file(path, compute) == [3, 4]
+    assert compute.call_count == 3
+
+
+def test_results_expire_after_the_ttl(tmp_path) -> None:
+    path = str(tmp_path / "nansen.json")
+    with open(path, "w") as f:
+        json.dump({}, f)
+    compute = mock.Mock(return_value={})
+    get_cached_by_file(path, compute, name="categorized", ttl=60)
+    get_cached_by_file(path, compute, name="categorized", ttl=60)
+    get_cached_by_file(path, compute, name="categorized", ttl=0)
+    assert compute.call_count == 2
+
+
+def test_file_handles_are_closed(tmp_path) -> None:
+    path = str(tmp_path / "binance.json")
+    with warnings.catch_warnings(record=True) as caught_warnings:
+        # an unclosed file warns once it's garbage collected
+        warnings.simplefilter("always", ResourceWarning)
+        for i in range(10):
+            with open(path, "w") as f:
+                json.dump({"data": "x" * i}, f)
+            load_json_file(path)
+        gc.collect()
+    assert not [
+        warning
+        for warning in caught_warnings
+        if issubclass(warning.category, ResourceWarning)
+        and path in str(warning.message)
+    ]
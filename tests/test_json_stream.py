@@ -0,0 +1,26 @@
+"""
+test decoding a json array from a stream of chunks
+"""
+import json
+
+from utils.json_stream import iter_json_array_items
+
+
+def test_iter_json_array_items_across_chunk_boundaries() -> None:
+    payload = {
+        "status": "success",
+        "data": [
+            {"pool": "a", "symbol": "USDC-é", "apy": 12.5, "tvlUsd": 1234567},
+            {"pool": "b", "symbol": "ETH", "apy": None, "stablecoin": False},
+            [1, 2.75, "3"],
+            10,
+        ],
+        "after": {"ignored": [1, 2]},
+    }
+    encoded = json.dumps(payload, ensure_ascii=False).encode()
+    for chunk_size in (1, 2, 7, len(encoded)):
+        bounds = list(range(0, len(encoded), chunk_size)) + [len(encoded)]
+        chunks = (encoded[start:end] for start, end in zip(bounds, bounds[1:]))
+        assert list(iter_json_array_items(chunks, "data")) == payload["data"]
+    assert list(iter_json_array_items([b'{"data": []}'], "data")) == []
+    assert list(iter_json_array_items([b"{}"], "data")) == []
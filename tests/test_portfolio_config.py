@@ -0,0 +1,83 @@
+"""
+test the lookup indexes of ADDRESS_2_CATEGORY, and the equilibria chain info map shared by the workers
+"""
+import multiprocessing
+import os
+import time
+from unittest import mock
+
+import portfolio_config
+from portfolio_config import (
+    ADDRESS_2_CATEGORY,
+    get_metadata_by_address,
+    get_metadata_by_project_symbol,
+    get_unique_ids_by_address,
+)
+
+
+def test_get_metadata_by_project_symbol_is_case_insensitive() -> None:
+    metadata = get_metadata_by_project_symbol("ARB_GMX:glp")
+    assert (
+        metadata
+        is ADDRESS_2_CATEGORY["0x4e971a87900b931ff39d1aad67697f49835400b6:arb_gmx"]
+    )
+
+
+def test_indexes_are_rebuilt_when_address_2_category_changes() -> None:
+    unique_id = "0x0000000000000000000000000000000000000001:test_project"
+    ADDRESS_2_CATEGORY[unique_id] = {"symbol": "TEST", "tags": ["test"]}
+    try:
+        assert get_metadata_by_project_symbol("test_project:test")["symbol"] == "TEST"
+        assert get_metadata_by_address(unique_id.split(":")[0]) == [
+            ADDRESS_2_CATEGORY[unique_id]
+        ]
+        assert get_unique_ids_by_address(unique_id.split(":")[0].upper()) == [unique_id]
+    finally:
+        del ADDRESS_2_CATEGORY[unique_id]
+        portfolio_config.rebuild_address_2_category_indexes()
+
+
+def test_indexes_are_rebuilt_when_an_entry_is_replaced() -> None:
+    unique_id = "0x4e971a87900b931ff39d1aad67697f49835400b6:arb_gmx"
+    metadata = ADDRESS_2_CATEGORY[unique_id]
+    assert get_metadata_by_project_symbol("arb_gmx:glp") is metadata
+    ADDRESS_2_CATEGORY[unique_id] = {**metadata, "symbol": "GLP2"}
+    try:
+        assert get_metadata_by_project_symbol("arb_gmx:glp2")["symbol"] == "GLP2"
+    finally:
+        ADDRESS_2_CATEGORY[unique_id] = metadata
+    assert get_metadata_by_project_symbol("arb_gmx:glp") is metadata
+
+
+def _get_equilibria_chain_info_map_in_worker(
+    cache_path: str, fetches_path: str
+) -> None:
+    def get(url: str) -> mock.Mock:
+        with open(fetches_path, "a") as f:
+            f.write(f"{os.getpid()}\n")
+        time.sleep(0.2)
+        return mock.Mock(status_code=200, json=lambda: {"42161": {"poolInfos": []}})
+
+    with mock.patch.object(portfolio_config.requests, "get", get):
+        assert portfolio_config.get_equilibria_chain_info_map(cache_path) == {
+            "42161": {"poolInfos": []}
+        }
+
+
+def test_workers_share_one_equilibria_chain_info_map_fetch(tmp_path) -> None:
+    cache_path, fetches_path = str(tmp_path / "map.json"), str(tmp_path / "fetches")
+    context = multiprocessing.get_context("fork")
+    workers = [
+        context.Process(
+            target=_get_equilibria_chain_info_map_in_worker,
+            args=(cache_path, fetches_path),
+        )
+        for _ in range(3)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert [worker.exitcode for worker in workers] == [0, 0, 0]
+    with open(fetches_path) as f:
+        assert len(f.readlines()) == 1
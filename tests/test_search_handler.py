@@ -1,7 +1,15 @@
 """
 test Search Base's basic functions
 """
+import numpy as np
+
+from apr_utils.yields_store import YieldsStore
 from search_handlers import SearchBase
+from search_handlers.jaccard_similarity_handler import JaccardSimilarityHandler
+from search_handlers.minhash_lsh_handler import MinHashLSHIndex, get_minhash_tokens
+from search_handlers.ngram_handler import NgramIndex, NgramSimilarityHandler
+from search_handlers.suffix_trie import SuffixTrie
+from search_handlers.tag_index import TagIndex, get_suffix_trie
 
 
 def test_denormalize_tag() -> None:
@@ -20,3 +28,93 @@ def test_denormalize_tag() -> None:
         "kepl",
         "eth",
     }
+
+
+def test_tag_index_follows_suffix_folding() -> None:
+    tag_index = TagIndex(["SFRXETH-FRAX", "WETH-USDC", "ETH", "OP-VELO", "GOHM"])
+    assert tag_index.get_pool_indexes_sharing_a_tag({"eth"}) == {0, 1, 2}
+    assert tag_index.get_pool_indexes_sharing_a_tag({"sfrxeth"}) == {0, 1, 2}
+    # tags shorter than 3 characters only match exactly
+    assert tag_index.get_pool_indexes_sharing_a_tag({"p"}) == set()
+    assert tag_index.get_pool_indexes_sharing_a_tag({"op"}) == {3}
+    assert tag_index.get_pool_indexes_sharing_a_tag({"ohm"}) == {4}
+
+
+def test_suffix_trie() -> None:
+    suffix_trie = SuffixTrie({"eth", "frxeth", "sfrxeth", "kepl", "op"})
+    assert suffix_trie.get_suffixes("sfrxeth") == ("eth", "frxeth")
+    assert suffix_trie.get_canonical_base("sfrxeth") == "eth"
+    assert suffix_trie.get_canonical_base("kepl") == "kepl"
+    # too short to be a variation of another token
+    assert suffix_trie.get_suffixes("stop") == ()
+    assert "frxeth" in suffix_trie and "rxeth" not in suffix_trie
+    union_tags = {"kepl", "eth", "sfrxeth", "frxeth"}
+    for tags in [{"kepl", "eth"}, {"sfrxeth"}, {"frxeth", "kepl"}]:
+        assert SearchBase.denormalize_tag(
+            tags, union_tags, suffix_trie
+        ) == SearchBase.denormalize_tag(tags, union_tags)
+
+
+def test_minhash_lsh_index_finds_identical_token_sets() -> None:
+    suffix_trie = SuffixTrie({"eth", "sfrxeth", "usdc", "op", "velo", "gohm"})
+    token_sets = [
+        get_minhash_tokens(TagIndex.get_tags(symbol), suffix_trie)
+        for symbol in ["SFRXETH-USDC", "OP-VELO", "GOHM", "ETH-USDC"]
+    ]
+    minhash_lsh_index = MinHashLSHIndex(token_sets)
+    signature = minhash_lsh_index.get_signature(frozenset({"eth", "usdc"}))
+    assert {0, 3} <= minhash_lsh_index.query(signature)
+
+
+def test_similarity_matrix_matches_pairwise_similarity() -> None:
+    symbols = ["SFRXETH-FRXETH", "AETH-BETH", "WETH-USDC", "ETH", "OP-VELO", "KEPL"]
+    yields_store = YieldsStore(
+        [
+            {
+                "pool": str(index),
+                "chain": "Ethereum",
+                "project": "curve",
+                "symbol": symbol,
+                "stablecoin": False,
+            }
+            for index, symbol in enumerate(symbols)
+        ]
+    )
+    handler = JaccardSimilarityHandler(
+        similarity_threshold=0.5, suffix_trie=get_suffix_trie(yields_store)
+    )
+    metadatas = [
+        {"metadata": {"tags": tags}}
+        for tags in [
+            ["sfrxeth"],
+            ["aeth"],
+            ["eth", "usdc"],
+            ["kepl", "frxeth"],
+            ["xyz"],
+        ]
+    ]
+    candidate_pool_mask = np.array([True, True, True, True, True, False])
+    rows, pool_indexes, similarities = handler.get_similarity_matrix(
+        metadatas, yields_store, candidate_pool_mask
+    )
+    similarity_matrix = {
+        (row, pool_index): similarity
+        for row, pool_index, similarity in zip(rows, pool_indexes, similarities)
+    }
+    for row, metadata in enumerate(metadatas):
+        for pool_index, symbol in enumerate(symbols[:-1]):
+            assert similarity_matrix.get((row, pool_index), 0) == (
+                handler.get_similarity(metadata, symbol.lower())
+            )
+
+
+def test_ngram_index_matches_pairwise_compare() -> None:
+    symbols = ["WETH-USDC", "ETH-USDC", "GLP", "EQB-GLP", "OP-VELO", "eth-usdc"]
+    ngram_index = NgramIndex(symbols)
+    handler = NgramSimilarityHandler(similarity_threshold=0.2, ngram_index=ngram_index)
+    metadata = {"metadata": {"symbol": "WETH-USDC.e"}}
+    similarities = ngram_index.search("WETH-USDC.e", 0.2)
+    assert set(similarities) == {0, 1, 5}
+    assert handler.get_candidate_pool_indexes(metadata, None) == {0, 1, 5}
+    for pool_index, similarity in similarities.items():
+        assert similarity == handler.get_similarity(metadata, symbols[pool_index])
@@ -0,0 +1,79 @@
+"""
+test that concurrent callers share one fetch, across threads and processes
+"""
+import multiprocessing
+import os
+import threading
+import time
+
+from utils.single_flight import get_single_flight_stats, single_flight
+
+
+def test_threads_share_one_fetch() -> None:
+    fetches = []
+
+    def fetch() -> dict:
+        fetches.append(1)
+        time.sleep(0.2)
+        return {"apr": 0.1}
+
+    stats = get_single_flight_stats()
+    results = []
+    threads = [
+        threading.Thread(
+            target=lambda: results.append(single_flight("test:threads", fetch))
+        )
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert fetches == [1]
+    assert results == [{"apr": 0.1}] * 8
+    new_stats = get_single_flight_stats()
+    assert new_stats["calls"] - stats["calls"] == 8
+    assert new_stats["fetches"] - stats["fetches"] == 1
+    assert new_stats["dedup_ratio"] > stats["dedup_ratio"]
+
+
+def _fetch_in_worker(cache_path: str, fetches_path: str) -> None:
+    def fetch() -> str:
+        with open(fetches_path, "a") as f:
+            f.write(f"{os.getpid()}\n")
+        time.sleep(0.2)
+        with open(cache_path, "w") as f:
+            f.write("fetched")
+        return "fetched"
+
+    def load_cached() -> str | None:
+        if not os.path.exists(cache_path):
+            return None
+        with open(cache_path) as f:
+            return f.read()
+
+    assert (
+        single_flight(
+            "test:processes",
+            fetch,
+            load_cached=load_cached,
+            lock_path=f"{cache_path}.lock",
+        )
+        == "fetched"
+    )
+
+
+def test_processes_share_one_fetch_through_the_cache(tmp_path) -> None:
+    cache_path, fetches_path = str(tmp_path / "cache"), str(tmp_path / "fetches")
+    context = multiprocessing.get_context("fork")
+    workers = [
+        context.Process(target=_fetch_in_worker, args=(cache_path, fetches_path))
+        for _ in range(3)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert [worker.exitcode for worker in workers] == [0, 0, 0]
+    with open(fetches_path) as f:
+        assert len(f.readlines()) == 1
@@ -0,0 +1,59 @@
+"""
+test SnapshotRefresher's stale-while-revalidate behaviour
+"""
+import json
+import os
+
+from utils.snapshot_refresher import SnapshotRefresher
+
+
+def test_snapshot_is_fetched_inline_only_when_missing(tmp_path) -> None:
+    calls = []
+
+    def fetch() -> dict:
+        calls.append(1)
+        return {"data": len(calls)}
+
+    refresher = SnapshotRefresher(
+        name="test", snapshot_path=str(tmp_path / "snapshot.json"), ttl=60, fetch=fetch
+    )
+    assert refresher.age() is None
+    assert refresher.load() == {"data": 1}
+    assert refresher.load() == {"data": 1}
+    assert calls == [1]
+    assert not refresher.is_stale()
+    assert refresher.refresh() is False
+
+
+def test_stale_snapshot_is_refreshed_and_swapped_in(tmp_path) -> None:
+    snapshot_path = tmp_path / "snapshot.json"
+    snapshot_path.write_text(json.dumps({"data": "old"}))
+    updates = []
+    refresher = SnapshotRefresher(
+        name="test",
+        snapshot_path=str(snapshot_path),
+        ttl=60,
+        fetch=lambda: {"data": "new"},
+        on_update=updates.append,
+    )
+    assert refresher.load() == {"data": "old"}
+    os.utime(snapshot_path, (0, 0))
+    assert refresher.is_stale()
+    refresher.tick()
+    assert updates == [{"data": "new"}]
+    assert json.loads(snapshot_path.read_text()) == {"data": "new"}
+
+
+def test_failed_refresh_keeps_the_last_good_snapshot(tmp_path) -> None:
+    snapshot_path = tmp_path / "snapshot.json"
+    snapshot_path.write_text(json.dumps({"data": "old"}))
+    os.utime(snapshot_path, (0, 0))
+
+    def fetch() -> dict:
+        raise Exception("upstream is down")
+
+    refresher = SnapshotRefresher(
+        name="test", snapshot_path=str(snapshot_path), ttl=60, fetch=fetch
+    )
+    refresher.tick()
+    assert refresher.load() == {"data": "old"}
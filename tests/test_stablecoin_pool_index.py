@@ -0,0 +1,49 @@
+"""
+test the stable coin pools sorted by APY
+"""
+from apr_utils.stablecoin_pool_index import get_stablecoin_pool_index
+from apr_utils.yields_store import YieldsStore
+
+
+def _pool(uuid: str, symbol: str, apy: float, apy_mean_30d: float, **kwargs) -> dict:
+    return {
+        "pool": uuid,
+        "chain": "Arbitrum",
+        "project": "aave-v3",
+        "symbol": symbol,
+        "poolMeta": None,
+        "apy": apy,
+        "apyMean30d": apy_mean_30d,
+        "tvlUsd": 10**7,
+        "stablecoin": True,
+        **kwargs,
+    }
+
+
+def test_stablecoin_pool_index_search() -> None:
+    yields_store = YieldsStore(
+        [
+            _pool("low", "USDC", 3.0, 3.0),
+            _pool("not-whitelisted", "USDC-MIM", 50.0, 50.0),
+            _pool("ethereum", "USDC", 40.0, 40.0, chain="Ethereum"),
+            _pool("tiny", "USDC", 30.0, 30.0, tvlUsd=10),
+            _pool("volatile", "USDC", 20.0, 20.0, stablecoin=False),
+            _pool("first-tie", "USDC-DAI", 10.0, 10.0),
+            _pool("spike", "USDT", 15.0, 1.0),
+            _pool("second-tie", "DAI", 10.0, 10.0),
+            _pool("unknown-apy", "USDC", None, None),
+            _pool("best", "FRAX", 12.0, 12.0),
+        ]
+    )
+    index = get_stablecoin_pool_index(yields_store)
+
+    def search(max_apy: float, topn_int: int) -> list[str]:
+        return [
+            yields_store.pools[pool_index]["pool"]
+            for pool_index in index.search(max_apy, topn_int)
+        ]
+
+    assert search(5.0, 5) == ["best", "first-tie", "second-tie"]
+    assert search(5.0, 2) == ["best", "first-tie"]
+    assert search(0.0, 5) == ["spike", "best", "first-tie", "second-tie", "low"]
+    assert search(12.0, 5) == []
@@ -0,0 +1,34 @@
+"""
+test the indexes built once per yields store
+"""
+import gc
+import weakref
+
+from apr_utils.yields_store import YieldsStore
+from utils.store_indexes import drop_store_index, get_store_index
+
+
+class _Index:
+    def __init__(self, pool_ids: list[str]):
+        self.pool_ids = pool_ids
+
+
+def test_index_is_built_once_per_store_and_goes_away_with_it() -> None:
+    builds = []
+
+    def build(yields_store: YieldsStore) -> _Index:
+        builds.append(yields_store)
+        return _Index([pool["pool"] for pool in yields_store.pools])
+
+    yields_store = YieldsStore([])
+    index = get_store_index(yields_store, "test", build)
+    assert get_store_index(yields_store, "test", build) is index
+    assert get_store_index(YieldsStore([]), "test", build) is not index
+    assert len(builds) == 2
+    drop_store_index(yields_store, "test")
+    assert get_store_index(yields_store, "test", build) is not index
+    index = weakref.ref(get_store_index(yields_store, "test", build))
+    builds.clear()
+    del yields_store
+    gc.collect()
+    assert index() is None
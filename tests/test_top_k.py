@@ -0,0 +1,27 @@
+"""
+test the bounded top-k selector and the pool ranking scores
+"""
+import random
+
+from apr_utils.apr_calculator import get_tvl_apr_harmonic_mean
+from utils.top_k import get_top_k
+
+
+def test_get_top_k_matches_sorted() -> None:
+    rng = random.Random(0)
+    items = [{"id": index, "apy": rng.randint(0, 20)} for index in range(500)]
+    for k in [0, 1, 5, 499, 500, 600]:
+        assert (
+            get_top_k(items, k, score=lambda x: x["apy"])
+            == sorted(items, key=lambda x: x["apy"], reverse=True)[:k]
+        )
+    assert get_top_k(iter([]), 5, score=lambda x: x) == []
+
+
+def test_tvl_apr_harmonic_mean() -> None:
+    shallow_pool = {"apy": 80, "project": "curve", "tvlUsd": 10**5}
+    deep_pool = {"apy": 20, "project": "curve", "tvlUsd": 5 * 10**7}
+    assert get_tvl_apr_harmonic_mean(deep_pool) > get_tvl_apr_harmonic_mean(
+        shallow_pool
+    )
+    assert get_tvl_apr_harmonic_mean({**deep_pool, "tvlUsd": 0}) == 0
@@ -0,0 +1,90 @@
+"""
+test YieldsStore's indexes
+"""
+from apr_utils.yields_store import (
+    POOL_FIELDS,
+    YieldsStore,
+    _is_pool_worth_keeping,
+    diff_yields_stores,
+)
+
+
+def _pool(uuid: str, chain: str, project: str, stablecoin: bool) -> dict:
+    return {
+        "pool": uuid,
+        "chain": chain,
+        "project": project,
+        "symbol": "USDC",
+        "apy": 5.0,
+        "apyMean30d": 5.0,
+        "tvlUsd": 10**7,
+        "stablecoin": stablecoin,
+        "poolMeta": None,
+    }
+
+
+def test_yields_store_indexes() -> None:
+    yields_store = YieldsStore.from_json(
+        {
+            "data": [
+                _pool("a", "Arbitrum", "gmx", False),
+                _pool("b", "Arbitrum", "aave-v3", True),
+                _pool("c", "Ethereum", "aave-v3", True),
+            ]
+        }
+    )
+    assert len(yields_store) == 3
+    assert yields_store.get_pool("b")["project"] == "aave-v3"
+    assert yields_store.get_pool("missing") is None
+    assert [p["pool"] for p in yields_store.get_pools_by_chain("Arbitrum")] == [
+        "a",
+        "b",
+    ]
+    assert [p["pool"] for p in yields_store.get_pools_by_project("aave-v3")] == [
+        "b",
+        "c",
+    ]
+    assert [p["pool"] for p in yields_store.get_stablecoin_pools()] == ["b", "c"]
+
+
+def test_diff_yields_stores() -> None:
+    old = YieldsStore(
+        [
+            _pool("a", "Arbitrum", "gmx", False),
+            _pool("b", "Arbitrum", "aave-v3", True),
+            _pool("c", "Ethereum", "aave-v3", True),
+        ]
+    )
+    changed = _pool("b", "Arbitrum", "aave-v3", True)
+    changed["apy"] = 6.0
+    new = YieldsStore(
+        [
+            _pool("a", "Arbitrum", "gmx", False),
+            changed,
+            _pool("d", "Ethereum", "aave-v3", True),
+        ]
+    )
+    assert diff_yields_stores(old, new) == {
+        "added": {"d"},
+        "removed": {"c"},
+        "changed": {"b"},
+    }
+
+
+def test_compact_snapshot() -> None:
+    pools = [
+        _pool("a", "Arbitrum", "gmx", False),
+        _pool("b", "BSC", "aave-v3", False),
+        _pool("c", "BSC", "aave-v3", True),
+        _pool("d", "Arbitrum", "gamma", False),
+        {**_pool("e", "Arbitrum", "gmx", False), "tvlUsd": 10},
+    ]
+    kept = [pool["pool"] for pool in pools if _is_pool_worth_keeping(pool, {"d"})]
+    assert kept == ["a", "c", "d"]
+    yields_store = YieldsStore.from_json(
+        {
+            "fields": list(POOL_FIELDS),
+            "rows": [[pool[field] for field in POOL_FIELDS] for pool in pools],
+        }
+    )
+    assert yields_store.pools == pools
@@ -0,0 +1,70 @@
+"""
+test ZapperClient against a local stub of Zapper's API
+"""
+import base64
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+
+from utils.zapper_client import ZapperClient
+
+
+def _serve_stub(requests_seen: list, statuses: list[int]) -> ThreadingHTTPServer:
+    class StubHandler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            requests_seen.append((url.path, query, self.headers["Authorization"]))
+            status = statuses.pop(0) if statuses else 200
+            body = json.dumps(
+                [
+                    {"address": address, "appId": "gmx", "products": []}
+                    for address in query["addresses[]"]
+                ]
+                if status == 200
+                else {}
+            ).encode()
+            self.send_response(status)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args) -> None:
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def test_every_address_and_network_is_fetched_in_one_request() -> None:
+    requests_seen = []
+    server = _serve_stub(requests_seen, statuses=[])
+    client = ZapperClient(
+        base_url=f"http://127.0.0.1:{server.server_port}/v2",
+        networks=("ethereum", "arbitrum"),
+    )
+    addresses = [f"0x{i:040x}" for i in range(20)]
+    with mock.patch.dict("os.environ", {"ZAPPER_API_KEY": "api-key"}):
+        app_balances = client.get_app_balances(addresses)
+    server.shutdown()
+    assert [app_balance["address"] for app_balance in app_balances] == addresses
+    assert len(requests_seen) == 1
+    path, query, authorization = requests_seen[0]
+    assert path == "/v2/balances/apps"
+    assert query == {"addresses[]": addresses, "networks[]": ["ethereum", "arbitrum"]}
+    assert authorization == f"Basic {base64.b64encode(b'api-key:').decode()}"
+
+
+def test_server_errors_are_retried() -> None:
+    requests_seen = []
+    server = _serve_stub(requests_seen, statuses=[503])
+    client = ZapperClient(base_url=f"http://127.0.0.1:{server.server_port}/v2")
+    assert client.get_app_balances(["0xa"]) == [
+        {"address": "0xa", "appId": "gmx", "products": []}
+    ]
+    server.shutdown()
+    assert len(requests_seen) == 2
+    assert client.get_app_balances([]) == []
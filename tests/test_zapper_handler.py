@@ -0,0 +1,79 @@
+"""
+test categorizing Zapper's app balances
+"""
+from unittest import mock
+
+import pytest
+
+# the mapping table the handler and the APR lookups actually read
+from handlers.zapper_handler import ADDRESS_2_CATEGORY, zapper_handler
+from utils.categorized_positions import CategorizedPositions
+
+MAPPING_TABLE = {
+    "0xglp:arb_gmx": {
+        "categories": ["gold", "long_term_bond"],
+        "symbol": "GLP",
+        "APR": 0.2,
+        "composition": {"eth": 0.5, "usdc": 0.5},
+    },
+    "0xlp:1:arb_sushiswap": {
+        "categories": ["small_cap_us_stocks"],
+        "symbol": "MAGIC-WETH",
+        "APR": 0.3,
+    },
+    "0xlp:2:arb_sushiswap": {
+        "categories": ["small_cap_us_stocks"],
+        "symbol": "DPX-WETH",
+        "APR": 0.4,
+    },
+    "0xlp:sushiswap": {
+        "categories": ["small_cap_us_stocks"],
+        "symbol": "DPX-WETH",
+        "APR": 0.4,
+    },
+}
+
+
+def _get_app_balance(owner: str, app_id: str, assets: list[tuple]) -> dict:
+    return {
+        "address": owner,
+        "appId": app_id,
+        "network": "arbitrum",
+        "products": [
+            {
+                "label": app_id,
+                "assets": [
+                    {
+                        "address": address,
+                        "balanceUSD": balance_usd,
+                        "tokens": [{"symbol": "WETH", "tokens": []}],
+                    }
+                    for address, balance_usd in assets
+                ],
+            }
+        ],
+    }
+
+
+def test_app_balances_of_every_address_are_categorized() -> None:
+    app_balances = [
+        _get_app_balance("0xa", "gmx", [("0xGLP", 1000), ("0xglp", 1)]),
+        _get_app_balance("0xb", "gmx", [("0xglp", 3000)]),
+        _get_app_balance("0xb", "sushiswap", [("0xlp", 500)]),
+    ]
+    with mock.patch.dict(ADDRESS_2_CATEGORY, MAPPING_TABLE, clear=True):
+        result = zapper_handler(app_balances, CategorizedPositions())
+    assert result["gold"]["portfolio"]["arb_gmx:GLP"]["worth"] == 2000
+    assert result["long_term_bond"]["sum"] == 2000
+    # the contract address is ambiguous, but there's a key for Zapper's app id
+    position = result["small_cap_us_stocks"]["portfolio"]["sushiswap:DPX-WETH"]
+    assert dict(position)["address"] == "0xlp:sushiswap"
+    assert position["tokens_metadata"] == [{"symbol": "WETH", "tokens": []}]
+
+
+def test_ambiguous_contract_addresses_are_rejected() -> None:
+    app_balances = [_get_app_balance("0xa", "sushi", [("0xlp", 500)])]
+    with mock.patch.dict(ADDRESS_2_CATEGORY, MAPPING_TABLE, clear=True), pytest.raises(
+        Exception, match="add 0xlp:sushi to your ADDRESS_2_CATEGORY"
+    ):
+        zapper_handler(app_balances, CategorizedPositions())
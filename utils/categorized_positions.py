@@ -0,0 +1,92 @@
+from collections.abc import Mapping
+
+# in the order the strategies iterate them
+CATEGORIES = (
+    "long_term_bond",
+    "intermediate_term_bond",
+    "commodities",
+    "gold",
+    "large_cap_us_stocks",
+    "small_cap_us_stocks",
+    "non_us_developed_market_stocks",
+    "non_us_emerging_market_stocks",
+)
+
+
+class PositionSource:
+    """
+    the portfolio item a position's address, APR and tokens come from, shared by all of the categories it was placed into
+    """
+
+    __slots__ = ("address", "APR", "tokens_metadata")
+
+    def __init__(self, address: str, APR: float, tokens_metadata: list):
+        self.address = address
+        self.APR = APR
+        self.tokens_metadata = tokens_metadata
+
+
+class CategorizedPosition(Mapping):
+    """
+    a position in one category, reads like the dict each category used to hold
+    only its worth in this category is its own, the metadata and source are shared with the categories it also spans
+    """
+
+    __slots__ = ("worth", "source", "metadata")
+
+    _KEYS = ("worth", "address", "APR", "metadata", "tokens_metadata")
+
+    def __init__(self, worth: float, source: PositionSource, metadata: dict):
+        self.worth = worth
+        self.source = source
+        self.metadata = metadata
+
+    def __getitem__(self, key: str):
+        if key in ("worth", "metadata"):
+            return getattr(self, key)
+        if key in ("address", "APR", "tokens_metadata"):
+            return getattr(self.source, key)
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self._KEYS)
+
+    def __len__(self) -> int:
+        return len(self._KEYS)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+
+class CategorizedPositions(dict):
+    """
+    category -> {"sum": ..., "portfolio": {project_symbol: CategorizedPosition}}, the shape the strategies and the optimizer read
+    """
+
+    __slots__ = ()
+
+    def __init__(self):
+        super().__init__(
+            {category: {"sum": 0, "portfolio": {}} for category in CATEGORIES}
+        )
+
+    def add_position(
+        self,
+        project_symbol: str,
+        category_worths: dict[str, float],
+        source: PositionSource,
+        metadata: dict,
+    ) -> None:
+        """
+        the worths are added up, the source and metadata replace the ones of earlier portfolio items of the same project:symbol
+        """
+        for category, worth in category_worths.items():
+            position = self[category]["portfolio"].get(project_symbol)
+            if position is None:
+                position = self[category]["portfolio"][
+                    project_symbol
+                ] = CategorizedPosition(0, source, metadata)
+            position.worth += worth
+            position.source = source
+            position.metadata = metadata
+            self[category]["sum"] += worth
@@ -0,0 +1,100 @@
+import hashlib
+import json
+import os
+import time
+from typing import Iterator
+from urllib.parse import quote
+
+from rebalance_server.portfolio_config import DEBANK_CACHE_TTL_SECONDS
+from rebalance_server.utils.debank_client import DebankClient
+from rebalance_server.utils.single_flight import single_flight
+from rebalance_server.utils.snapshot_refresher import write_json_atomically
+
+DEBANK_CACHE_DIR = "./rebalance_server/dashboard/debank-cache"
+
+
+class DebankCache:
+    """
+    DeBank's protocol list of each address in its own json file, fresh for `ttl` seconds after it was written
+    so any mix of address sets is served from the same entries, and files are replaced atomically for the other workers
+    """
+
+    def __init__(
+        self, cache_dir: str = DEBANK_CACHE_DIR, ttl: float = DEBANK_CACHE_TTL_SECONDS
+    ):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+
+    def get(self, address: str, min_mtime: float | None = None) -> list[dict] | None:
+        """
+        the cached protocol list, None if it's missing or older than the ttl (or written before `min_mtime`)
+        """
+        path = self._get_path(address)
+        if min_mtime is None:
+            min_mtime = time.time() - self.ttl
+        try:
+            if os.path.getmtime(path) < min_mtime:
+                return None
+            with open(path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def put(self, address: str, protocol_list: list[dict]) -> None:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        write_json_atomically(self._get_path(address), protocol_list)
+
+    def get_categorized_state(self, addresses: list[str]) -> dict | None:
+        """
+        what debank_delta_handler returned for the last call with the same addresses, None if there wasn't one
+        """
+        try:
+            with open(self._get_categorized_state_path(addresses), "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def put_categorized_state(self, addresses: list[str], state: dict) -> None:
+        path = self._get_categorized_state_path(addresses)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_json_atomically(path, state)
+
+    def iter_or_fetch_protocol_lists(
+        self, addresses: list[str], client: DebankClient, use_cache: bool = True
+    ) -> Iterator[list[dict]]:
+        """
+        the protocol list of each address, in the order of `addresses`, as they arrive
+        only the addresses not cached within the ttl are fetched, or all of them without `use_cache`
+        concurrent calls for the same address, from any thread or worker, share one fetch
+        """
+        requested_at = time.time()
+        min_mtime = requested_at - self.ttl if use_cache else requested_at
+
+        def get_or_fetch(address: str) -> list[dict]:
+            protocol_list = self.get(address, min_mtime)
+            if protocol_list is not None:
+                return protocol_list
+            return single_flight(
+                f"debank:{address.lower()}",
+                lambda: self._fetch(address, client),
+                load_cached=lambda: self.get(address, min_mtime),
+                lock_path=f"{self._get_path(address)}.lock",
+            )
+
+        return client.iter_all_complex_protocol_lists(addresses, get_or_fetch)
+
+    def _fetch(self, address: str, client: DebankClient) -> list[dict]:
+        protocol_list = client.get_all_complex_protocol_list(address)
+        self.put(address, protocol_list)
+        return protocol_list
+
+    def _get_path(self, address: str) -> str:
+        # addresses come from the request, so nothing in them may escape the cache dir
+        return os.path.join(self.cache_dir, f"{quote(address.lower(), safe='')}.json")
+
+    def _get_categorized_state_path(self, addresses: list[str]) -> str:
+        # keyed by the ordered addresses, the order decides which position's metadata ends up in the result
+        digest = hashlib.sha1(
+            "\n".join(address.lower() for address in addresses).encode()
+        ).hexdigest()
+        return os.path.join(self.cache_dir, "categorized", f"{digest}.json")
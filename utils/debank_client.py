@@ -0,0 +1,96 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator
+
+import requests
+from requests.adapters import HTTPAdapter
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential
+
+from rebalance_server.utils.http_retry import is_retryable_http_error
+
+DEBANK_API = "https://pro-openapi.debank.com/v1"
+DEBANK_MAX_WORKERS = 8
+# (connect, read)
+DEBANK_TIMEOUT_SECONDS = (5, 30)
+DEBANK_MAX_ATTEMPTS = 4
+DEBANK_RETRY_BACKOFF_SECONDS = 0.5
+
+
+class DebankClient:
+    """
+    DeBank's pro API over one keep-alive session, the per-address calls of a request are spread across a bounded thread pool
+    timeouts, connection errors, 429s and 5xxs are retried with exponential backoff, other errors are raised right away
+    """
+
+    def __init__(
+        self,
+        base_url: str = DEBANK_API,
+        max_workers: int = DEBANK_MAX_WORKERS,
+        timeout: tuple[float, float] = DEBANK_TIMEOUT_SECONDS,
+    ):
+        self.base_url = base_url
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self._session = requests.Session()
+        # one pooled connection per worker, so concurrent calls don't open and drop extra ones
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+
+    @retry(
+        stop=stop_after_attempt(DEBANK_MAX_ATTEMPTS),
+        wait=wait_exponential(multiplier=DEBANK_RETRY_BACKOFF_SECONDS),
+        retry=retry_if_exception(is_retryable_http_error),
+        reraise=True,
+    )
+    def get_all_complex_protocol_list(self, address: str) -> list[dict]:
+        res = self._session.get(
+            f"{self.base_url}/user/all_complex_protocol_list",
+            params={"id": address},
+            headers={"AccessKey": os.getenv("ACCESSKEY")},
+            timeout=self.timeout,
+        )
+        res.raise_for_status()
+        return res.json()
+
+    def get_all_complex_protocol_lists(
+        self,
+        addresses: list[str],
+        get_protocol_list: Callable[[str], list[dict]] | None = None,
+    ) -> list[list[dict]]:
+        return list(self.iter_all_complex_protocol_lists(addresses, get_protocol_list))
+
+    def iter_all_complex_protocol_lists(
+        self,
+        addresses: list[str],
+        get_protocol_list: Callable[[str], list[dict]] | None = None,
+    ) -> Iterator[list[dict]]:
+        """
+        the protocol list of each address, in the order of `addresses`, each one as soon as it and the ones before it have arrived
+        `get_protocol_list` is called on each address concurrently, it's the plain API call by default
+        """
+        if get_protocol_list is None:
+            get_protocol_list = self.get_all_complex_protocol_list
+        if len(addresses) <= 1:
+            for address in addresses:
+                yield get_protocol_list(address)
+            return
+        with ThreadPoolExecutor(
+            max_workers=min(self.max_workers, len(addresses))
+        ) as executor:
+            # map hands over each result once it's yielded, so it's freed once the consumer is done with it
+            yield from executor.map(get_protocol_list, addresses)
+
+
+_debank_client = None
+_debank_client_lock = threading.Lock()
+
+
+def get_debank_client() -> DebankClient:
+    # process-wide, so the keep-alive connections are shared across requests
+    global _debank_client
+    with _debank_client_lock:
+        if _debank_client is None:
+            _debank_client = DebankClient()
+        return _debank_client
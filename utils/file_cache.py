@@ -0,0 +1,44 @@
+import json
+import os
+import threading
+import time
+from typing import Callable, TypeVar
+
+T = TypeVar("T")
+
+# (path, name) -> ((mtime, size), computed at, result)
+_cache: dict[tuple[str, str], tuple[tuple[int, int], float, object]] = {}
+_lock = threading.Lock()
+
+
+def get_cached_by_file(
+    path: str, compute: Callable[[str], T], name: str = "", ttl: float | None = None
+) -> T:
+    """
+    `compute(path)`, kept in memory until the file's mtime or size changes, or for at most `ttl` seconds
+    `name` tells apart what's computed from the same file, the result is shared so callers must not mutate it
+    """
+    stat = os.stat(path)
+    version = (stat.st_mtime_ns, stat.st_size)
+    with _lock:
+        cached = _cache.get((path, name))
+    if cached is not None:
+        cached_version, computed_at, result = cached
+        if cached_version == version and (
+            ttl is None or time.time() - computed_at <= ttl
+        ):
+            return result
+    result = compute(path)
+    with _lock:
+        _cache[(path, name)] = (version, time.time(), result)
+    return result
+
+
+def load_json_file(path: str):
+    # parsed once per version of the file
+    return get_cached_by_file(path, _load_json, "json")
+
+
+def _load_json(path: str):
+    with open(path, "r") as f:
+        return json.load(f)
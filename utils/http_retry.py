@@ -0,0 +1,12 @@
+import requests
+
+
+def is_retryable_http_error(e: BaseException) -> bool:
+    """
+    timeouts, connection errors, 429s and 5xxs are worth retrying, any other error would fail again
+    """
+    if isinstance(e, (requests.ConnectionError, requests.Timeout)):
+        return True
+    if isinstance(e, requests.HTTPError) and e.response is not None:
+        return e.response.status_code == 429 or e.response.status_code >= 500
+    return False
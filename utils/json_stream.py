@@ -0,0 +1,87 @@
+import codecs
+import json
+from typing import Any, Iterable, Iterator
+
+_WHITESPACE = " \t\n\r"
+_decoder = json.JSONDecoder()
+
+
+def iter_json_array_items(chunks: Iterable[bytes], key: str) -> Iterator[Any]:
+    """
+    the items of the array under `key` of a top-level json object, decoded one at a time from a stream of utf-8 chunks
+    so the whole document is never held in memory, the values of the other keys are decoded and thrown away
+    """
+    reader = _JsonStreamReader(chunks)
+    reader.expect("{")
+    if reader.peek() == "}":
+        return
+    while True:
+        current_key = reader.decode_value()
+        reader.expect(":")
+        if current_key == key:
+            reader.expect("[")
+            if reader.peek() == "]":
+                return
+            while True:
+                yield reader.decode_value()
+                if reader.peek() == "]":
+                    return
+                reader.expect(",")
+        reader.decode_value()
+        if reader.peek() == "}":
+            return
+        reader.expect(",")
+
+
+class _JsonStreamReader:
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._utf8_decoder = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._position = 0
+
+    def peek(self) -> str | None:
+        # the next non-whitespace character, None at the end of the stream
+        while True:
+            while (
+                self._position < len(self._buffer)
+                and self._buffer[self._position] in _WHITESPACE
+            ):
+                self._position += 1
+            if self._position < len(self._buffer):
+                return self._buffer[self._position]
+            if not self._read_more():
+                return None
+
+    def expect(self, char: str) -> None:
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} in the json stream, got {found!r}")
+        self._position += 1
+
+    def decode_value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self._buffer, self._position)
+            except json.JSONDecodeError:
+                # the value goes on in the next chunk
+                if not self._read_more():
+                    raise
+                continue
+            # so does a number cut at the end of the buffer
+            if end == len(self._buffer) and self._read_more():
+                continue
+            self._position = end
+            return value
+
+    def _read_more(self) -> bool:
+        for chunk in self._chunks:
+            text = self._utf8_decoder.decode(chunk)
+            if text:
+                # drop what has been consumed, so the buffer stays about a chunk long
+                position = self._position
+                self._buffer = self._buffer[position:] + text
+                self._position = 0
+                return True
+        return False
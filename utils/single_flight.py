@@ -0,0 +1,76 @@
+import fcntl
+import os
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Callable, TypeVar
+
+T = TypeVar("T")
+
+_in_flight: dict[str, Future] = {}
+_stats = {"calls": 0, "fetches": 0}
+_lock = threading.Lock()
+
+
+def single_flight(
+    key: str,
+    fetch: Callable[[], T],
+    load_cached: Callable[[], T | None] | None = None,
+    lock_path: str | None = None,
+) -> T:
+    """
+    Concurrent callers for the same `key` share one in-flight `fetch`.
+    Threads of this process wait for the first caller's result. With a `lock_path`, sibling worker processes queue up on that file lock,
+    and each of them calls `load_cached` once it gets the lock, so a result the previous holder has just cached isn't fetched again.
+    The result is shared, callers must not mutate it.
+    """
+    with _lock:
+        _stats["calls"] += 1
+        future = _in_flight.get(key)
+        is_leader = future is None
+        if is_leader:
+            future = _in_flight[key] = Future()
+    if not is_leader:
+        return future.result()
+    try:
+        with _file_lock(lock_path):
+            result = load_cached() if load_cached is not None else None
+            if result is None:
+                with _lock:
+                    _stats["fetches"] += 1
+                result = fetch()
+        future.set_result(result)
+        return result
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _lock:
+            del _in_flight[key]
+
+
+def get_single_flight_stats() -> dict[str, float]:
+    """
+    calls and upstream fetches of this process so far, the dedup ratio is the share of calls served without a fetch of their own
+    """
+    with _lock:
+        calls, fetches = _stats["calls"], _stats["fetches"]
+    return {
+        "calls": calls,
+        "fetches": fetches,
+        "dedup_ratio": (calls - fetches) / calls if calls else 0.0,
+    }
+
+
+@contextmanager
+def _file_lock(lock_path: str | None):
+    if lock_path is None:
+        yield
+        return
+    os.makedirs(os.path.dirname(lock_path) or ".", exist_ok=True)
+    with open(lock_path, "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -0,0 +1,158 @@
+import fcntl
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable
+
+from rebalance_server.utils.single_flight import single_flight
+
+SNAPSHOT_REFRESHER_CHECK_INTERVAL_SECONDS = 60
+SNAPSHOT_REFRESHER_THREAD_NAME = "snapshot-refresher"
+
+
+class SnapshotRefresher:
+    """
+    Stale-while-revalidate refresher for a json snapshot on disk shared by all gunicorn workers.
+    Readers keep being served the last good snapshot, while the scheduler downloads a new one once it's older than `ttl`.
+    A file lock makes sure only one worker downloads it, the others pick the new file up on their next tick.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        snapshot_path: str,
+        ttl: float,
+        fetch: Callable[[], dict],
+        on_update: Callable[[dict], None] | None = None,
+    ):
+        self.name = name
+        self.snapshot_path = snapshot_path
+        self.ttl = ttl
+        self._fetch = fetch
+        self._on_update = on_update
+        self._loaded_mtime = 0.0
+
+    def snapshot_mtime(self) -> float | None:
+        try:
+            return os.path.getmtime(self.snapshot_path)
+        except FileNotFoundError:
+            return None
+
+    def age(self) -> float | None:
+        mtime = self.snapshot_mtime()
+        if mtime is None:
+            return None
+        return time.time() - mtime
+
+    def is_stale(self) -> bool:
+        age = self.age()
+        return age is None or age > self.ttl
+
+    def load(self) -> dict:
+        """
+        return the last good snapshot, it's only fetched inline when there's nothing on disk yet
+        """
+        if self.snapshot_mtime() is None:
+            # the other threads and workers loading it meanwhile wait for this fetch instead of firing their own
+            single_flight(
+                f"snapshot:{self.name}",
+                self._fetch_to_disk,
+                load_cached=self.snapshot_mtime,
+                lock_path=self._get_lock_path(),
+            )
+        mtime = self.snapshot_mtime()
+        with open(self.snapshot_path, "r") as f:
+            res_json = json.load(f)
+        self._loaded_mtime = mtime
+        return res_json
+
+    def refresh(self) -> bool:
+        with self._file_lock(blocking=False) as acquired:
+            if not acquired or not self.is_stale():
+                # either another worker is refreshing it, or it has just been refreshed
+                return False
+            print(f"Refresh {self.name} snapshot, age: {self.age()}")
+            write_json_atomically(self.snapshot_path, self._fetch())
+            return True
+
+    def tick(self) -> None:
+        if self.is_stale():
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Failed to refresh {self.name}, keep serving the stale one: {e}")
+        mtime = self.snapshot_mtime()
+        if self._on_update is not None and mtime and mtime > self._loaded_mtime:
+            self._on_update(self.load())
+
+    @contextmanager
+    def _file_lock(self, blocking: bool):
+        os.makedirs(os.path.dirname(self.snapshot_path) or ".", exist_ok=True)
+        with open(self._get_lock_path(), "w") as lock_file:
+            try:
+                fcntl.flock(
+                    lock_file,
+                    fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB,
+                )
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _fetch_to_disk(self) -> float:
+        write_json_atomically(self.snapshot_path, self._fetch())
+        return self.snapshot_mtime()
+
+    def _get_lock_path(self) -> str:
+        return f"{self.snapshot_path}.lock"
+
+
+def write_json_atomically(path: str, payload: dict) -> None:
+    # write-then-rename, so readers never see a half-written file
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(payload, f)
+    os.replace(tmp_path, path)
+
+
+_refreshers: dict[str, SnapshotRefresher] = {}
+_refreshers_lock = threading.Lock()
+_scheduler_thread = None
+
+
+def register_snapshot_refresher(refresher: SnapshotRefresher) -> SnapshotRefresher:
+    """
+    register a refresher to the scheduler of this process, a refresher registered under the same name is returned instead
+    """
+    global _scheduler_thread
+    with _refreshers_lock:
+        refresher = _refreshers.setdefault(refresher.name, refresher)
+        if _scheduler_thread is None:
+            _scheduler_thread = threading.Thread(
+                target=_run_scheduler, name=SNAPSHOT_REFRESHER_THREAD_NAME, daemon=True
+            )
+            _scheduler_thread.start()
+    return refresher
+
+
+def get_snapshot_ages() -> dict[str, float | None]:
+    with _refreshers_lock:
+        refreshers = list(_refreshers.values())
+    return {refresher.name: refresher.age() for refresher in refreshers}
+
+
+def _run_scheduler() -> None:
+    while True:
+        time.sleep(SNAPSHOT_REFRESHER_CHECK_INTERVAL_SECONDS)
+        with _refreshers_lock:
+            refreshers = list(_refreshers.values())
+        for refresher in refreshers:
+            try:
+                refresher.tick()
+            except Exception as e:
+                print(f"Snapshot refresher {refresher.name} failed: {e}")
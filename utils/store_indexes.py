@@ -0,0 +1,29 @@
+import threading
+from typing import Callable, TypeVar
+from weakref import WeakKeyDictionary
+
+T = TypeVar("T")
+
+# yields store -> {index name: index}, an index goes away with the snapshot it was built from
+_indexes: WeakKeyDictionary = WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+def get_store_index(store, name: str, build: Callable[[object], T]) -> T:
+    """
+    `build(store)`, built once per store, the modules that need an index of the pools own how it's built
+    concurrent first calls may both build it, the first one stored wins
+    """
+    with _lock:
+        index = _indexes.get(store, {}).get(name)
+    if index is not None:
+        return index
+    index = build(store)
+    with _lock:
+        return _indexes.setdefault(store, {}).setdefault(name, index)
+
+
+def drop_store_index(store, name: str) -> None:
+    # e.g. to measure building it again
+    with _lock:
+        _indexes.get(store, {}).pop(name, None)
@@ -0,0 +1,22 @@
+import heapq
+from typing import Any, Callable, Iterable, TypeVar
+
+T = TypeVar("T")
+
+
+def get_top_k(items: Iterable[T], k: int, score: Callable[[T], Any]) -> list[T]:
+    """
+    the k items with the highest score, best first, in O(n log k) time and O(k) memory
+    items with the same score keep their original order, same as `sorted(items, key=score, reverse=True)[:k]`
+    """
+    if k <= 0:
+        return []
+    heap = []
+    # the negated position breaks ties in favor of the earlier item, so the items themselves are never compared
+    for position, item in enumerate(items):
+        entry = (score(item), -position, item)
+        if len(heap) < k:
+            heapq.heappush(heap, entry)
+        elif entry[:2] > heap[0][:2]:
+            heapq.heapreplace(heap, entry)
+    return [item for _, _, item in sorted(heap, reverse=True)]
@@ -0,0 +1,80 @@
+import os
+import threading
+
+import requests
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential
+
+from rebalance_server.utils.http_retry import is_retryable_http_error
+
+ZAPPER_API = "https://api.zapper.xyz/v2"
+# every network Zapper supports, same as the README's example
+ZAPPER_NETWORKS = (
+    "ethereum",
+    "polygon",
+    "optimism",
+    "gnosis",
+    "binance-smart-chain",
+    "fantom",
+    "avalanche",
+    "arbitrum",
+    "bitcoin",
+    "cronos",
+    "aurora",
+)
+# (connect, read), one call carries every address so it gets a longer read timeout than DeBank's
+ZAPPER_TIMEOUT_SECONDS = (5, 60)
+ZAPPER_MAX_ATTEMPTS = 4
+ZAPPER_RETRY_BACKOFF_SECONDS = 0.5
+
+
+class ZapperClient:
+    """
+    Zapper's API over one keep-alive session, the app balances of every address on every network come back from one bulk call
+    timeouts, connection errors, 429s and 5xxs are retried with exponential backoff, other errors are raised right away
+    """
+
+    def __init__(
+        self,
+        base_url: str = ZAPPER_API,
+        networks: tuple[str, ...] = ZAPPER_NETWORKS,
+        timeout: tuple[float, float] = ZAPPER_TIMEOUT_SECONDS,
+    ):
+        self.base_url = base_url
+        self.networks = networks
+        self.timeout = timeout
+        self._session = requests.Session()
+
+    @retry(
+        stop=stop_after_attempt(ZAPPER_MAX_ATTEMPTS),
+        wait=wait_exponential(multiplier=ZAPPER_RETRY_BACKOFF_SECONDS),
+        retry=retry_if_exception(is_retryable_http_error),
+        reraise=True,
+    )
+    def get_app_balances(self, addresses: list[str]) -> list[dict]:
+        """
+        one app balance per address, app and network, each with the products and assets the address holds in it
+        """
+        if not addresses:
+            return []
+        res = self._session.get(
+            f"{self.base_url}/balances/apps",
+            params={"addresses[]": addresses, "networks[]": list(self.networks)},
+            # Zapper takes the API key as the basic auth username
+            auth=(os.getenv("ZAPPER_API_KEY", ""), ""),
+            timeout=self.timeout,
+        )
+        res.raise_for_status()
+        return res.json()
+
+
+_zapper_client = None
+_zapper_client_lock = threading.Lock()
+
+
+def get_zapper_client() -> ZapperClient:
+    # process-wide, so the keep-alive connection is shared across requests
+    global _zapper_client
+    with _zapper_client_lock:
+        if _zapper_client is None:
+            _zapper_client = ZapperClient()
+        return _zapper_client